@@ -0,0 +1,342 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+from urllib.parse import urlsplit
+
+logging.basicConfig(handlers=[logging.NullHandler()]) # the log goes into the workdir (main), importing scrap doesn't create one in the current directory
+from scrap import Timer
+
+try:
+    import psutil # measures the steps' cpu time and memory where there is no os.wait4 (optional)
+except ImportError:
+    psutil = None
+
+# Global variables
+repo_dirname = os.path.dirname(os.path.abspath(__file__))
+fixture_csv_filenames = {
+    "categories": "professional_categories_links.csv",
+    "professionals": "professionals_links.csv",
+    "vendors": "profile_vendors_links.csv",
+    "contacts": "vendors_name_contact.csv",
+}
+start_path = "/services/all-services"
+listing_page_size = 20 # vendors per page of a professionals listing (Step 3 paginates through them)
+steps_descs = ["Step 1", "Step 2", "Step 3", "Step 4"]
+baseline_filename = "benchmark_baseline.json"
+result_filename = "benchmark_result.json"
+regression_tolerance = 0.2 # a metric 20% worse than the baseline is a regression
+higher_is_better_metrics = ["pages_per_second"]
+lower_is_better_metrics = ["seconds", "cpu_seconds", "peak_rss_mb", "p50_page_seconds", "p95_page_seconds"]
+logging_filename = 'recommend.log' # in the workdir, next to the log of the steps
+rss_sample_seconds = 0.05 # no os.wait4: the child's memory and cpu time are sampled this often with psutil
+# END: Global variables
+
+
+# Global function
+def read_csv_column(filename, column):
+    with open(os.path.join(repo_dirname, filename), "r", encoding="utf-8", newline="") as file:
+        return [row[column] for row in csv.DictReader(file)]
+
+def read_csv_rows(filename):
+    with open(os.path.join(repo_dirname, filename), "r", encoding="utf-8", newline="") as file:
+        return list(csv.DictReader(file))
+
+def url_to_path(url):
+    # The fixture site serves the real urls' path and query
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+def remove_url_parameters(url):
+    return url.split('?',1)[0]
+
+def html_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+def render_page(body):
+    return f"<!DOCTYPE html><html><head><title>recommend.my fixture</title></head><body>{body}</body></html>"
+
+def render_links(container, link_class, paths):
+    return "".join(f'<div class="col"><a class="{link_class}" href="{html_escape(path)}">{html_escape(path)}</a></div>' for path in paths).join([container[0], container[1]])
+
+def render_paginator(listing_path, page_number, pages_count):
+    # Window of page links around the current page + the next page button, like the real site
+    items = []
+    for number in range(max(1, page_number - 2), min(pages_count, page_number + 2) + 1):
+        items.append(f'<li class="{"active" if number == page_number else ""}"><a href="{listing_page_path(listing_path, number)}">{number}</a></li>')
+    if page_number < pages_count:
+        items.append(f'<li class="pagination-next"><a href="{listing_page_path(listing_path, page_number + 1)}">Next</a></li>')
+    return f'<ul class="pagination">{"".join(items)}</ul>'
+
+def listing_page_path(listing_path, page_number):
+    return listing_path if page_number == 1 else f"{listing_path}?page={page_number}"
+
+def render_vendor_page(contact):
+    # Same markup as a vendor profile: the name in the provider title, the numbers in the buttons' click handlers script
+    scripts = []
+    if contact.get("whatsapp_number"):
+        scripts.append(f"$('.btn-whatsapp-call').on('click', function() {{ window.open('https://wa.me/6' + '{contact['whatsapp_number']}'); }});")
+    if contact.get("phonecall_number"):
+        scripts.append(f"$('.btn-phone-call').on('click', function() {{ window.location = 'tel:' + '{contact['phonecall_number']}'; }});")
+    return render_page(
+        f'<div class="provider"><div class="provider__meta"><div class="provider__title"><h4 class="provider__name">{html_escape(contact.get("name", ""))}</h4></div></div></div>'
+        f'<script>var page = "vendor";</script><script>$(document).ready(function() {{ {" ".join(scripts)} }});</script>'
+    )
+
+def build_fixture_site(vendors_limit=None, page_size=listing_page_size):
+    # {path: html} of a site with the real site's links and selectors: start page -> categories -> professionals listings -> vendors
+    categories_paths = [url_to_path(url) for url in read_csv_column(fixture_csv_filenames["categories"], "link")]
+    professionals_paths = [url_to_path(remove_url_parameters(url)) for url in read_csv_column(fixture_csv_filenames["professionals"], "link")]
+    vendors_paths = [url_to_path(remove_url_parameters(url)) for url in read_csv_column(fixture_csv_filenames["vendors"], "link")][:vendors_limit]
+    contacts = read_csv_rows(fixture_csv_filenames["contacts"])
+    pages = {}
+
+    pages[start_path] = render_page(render_links(('<div class="left-side-content"><div class="flickity-cell">', '</div></div>'), "category", categories_paths))
+
+    # Every category links to a round-robin share of the professionals listings
+    for category_index, category_path in enumerate(categories_paths):
+        pages[category_path] = render_page(render_links(('<div id="jsSideContent">', '</div>'), "card-overlay-link", professionals_paths[category_index::len(categories_paths)]))
+
+    # Every listing paginates through a round-robin share of the vendors
+    for professional_index, professional_path in enumerate(professionals_paths):
+        listing_vendors_paths = vendors_paths[professional_index::len(professionals_paths)]
+        pages_count = max(1, -(-len(listing_vendors_paths) // page_size))
+        for page_number in range(1, pages_count + 1):
+            page_vendors_paths = listing_vendors_paths[(page_number - 1) * page_size:page_number * page_size]
+            cards = "".join(f'<div class="profile-card-top-left"><a class="profile-card-title" href="{html_escape(path)}?ref=listing">{html_escape(path)}</a></div>' for path in page_vendors_paths)
+            pages[listing_page_path(professional_path, page_number)] = render_page(cards + render_paginator(professional_path, page_number, pages_count))
+
+    for vendor_index, vendor_path in enumerate(vendors_paths):
+        pages[vendor_path] = render_vendor_page(contacts[vendor_index % len(contacts)] if contacts else {})
+    return pages
+
+def percent_change(value, baseline_value):
+    return (value - baseline_value) / baseline_value if baseline_value else 0
+
+def compare_to_baseline(result, baseline, tolerance=regression_tolerance):
+    # Returns the regressions: [(stage, metric, value, baseline value, change)]
+    regressions = []
+    for stage, stage_result in result["stages"].items():
+        baseline_stage_result = baseline.get("stages", {}).get(stage)
+        if not baseline_stage_result:
+            continue
+        for metric in higher_is_better_metrics + lower_is_better_metrics:
+            value, baseline_value = stage_result.get(metric), baseline_stage_result.get(metric)
+            if not value or not baseline_value:
+                continue
+            change = percent_change(value, baseline_value)
+            if (metric in higher_is_better_metrics and change < -tolerance) or (metric in lower_is_better_metrics and change > tolerance):
+                regressions.append((stage, metric, value, baseline_value, change))
+    return regressions
+# END: Global function
+
+
+# Classes
+class FixtureRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the fixture pages with the injected latency and errors (server attributes set by FixtureSite)
+    def do_GET(self) -> None:
+        server = self.server
+        time.sleep(max(0, random.gauss(server.latency_seconds, server.latency_jitter_seconds)) if server.latency_seconds else 0)
+        html = server.pages.get(self.path) or server.pages.get(remove_url_parameters(self.path) if "ref=" in self.path else None)
+        with server.lock:
+            server.requests_count += 1
+        if html is None:
+            self.send_error(404)
+            return
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.errors_count += 1
+            self.send_error(server.error_status)
+            return
+        body = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass # no access log on stderr
+
+class FixtureSite:
+    def __init__(self, pages, port=0, latency_seconds=0, latency_jitter_seconds=0, error_rate=0, error_status=503) -> None:
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), FixtureRequestHandler)
+        self.server.daemon_threads = True
+        self.server.pages = pages
+        self.server.latency_seconds = latency_seconds
+        self.server.latency_jitter_seconds = latency_jitter_seconds
+        self.server.error_rate = error_rate
+        self.server.error_status = error_status
+        self.server.lock = threading.Lock()
+        self.server.requests_count = 0
+        self.server.errors_count = 0
+
+    def get_url(self, path) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="fixture_site", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+# END: Classes
+
+
+# Benchmark function
+def run_measured(command, workdir):
+    # Run a command to completion: (exit code, wall seconds, cpu seconds, peak rss MB) from the child's resource usage,
+    # sampled with psutil where there is no os.wait4 (e.g. windows), cpu seconds and peak rss are None without psutil
+    timer = Timer()
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status) # reaped by wait4
+        timer.stop()
+        return process.returncode, timer.get_execution_time(), rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024) # bytes on macos, KB on linux
+    cpu_seconds, peak_rss_mb = None, None
+    if psutil:
+        try:
+            measured_process = psutil.Process(process.pid)
+            while process.poll() is None:
+                cpu_times, memory_info = measured_process.cpu_times(), measured_process.memory_info()
+                cpu_seconds = cpu_times.user + cpu_times.system
+                peak_rss_mb = max(peak_rss_mb or 0, getattr(memory_info, "peak_wset", memory_info.rss) / (1024 * 1024)) # windows keeps the peak itself
+                time.sleep(rss_sample_seconds)
+        except psutil.Error:
+            pass # exited between two samples
+    process.wait()
+    timer.stop()
+    return process.returncode, timer.get_execution_time(), cpu_seconds, peak_rss_mb
+
+def round_measure(value, digits):
+    return round(value, digits) if value is not None else None
+
+def run_benchmark(fixture_site, workdir, engine="http", extra_args=None):
+    scrap_filename = os.path.join(repo_dirname, "scrap.py")
+    reformat_data_filename = os.path.join(repo_dirname, "reformat_data.py")
+    metrics_summary_filename = os.path.join(workdir, "metrics_summary.json")
+    stages = {}
+    for step_number, step_desc in enumerate(steps_descs, start=1):
+        command = [sys.executable, scrap_filename, "--start-url", fixture_site.get_url(start_path), "--engine", engine, "--steps", str(step_number), "--step-cache-ttl", "0"] + (extra_args if extra_args else []) # every step scraps the site
+        if os.path.exists(metrics_summary_filename):
+            os.remove(metrics_summary_filename) # the summary of the step before isn't this step's
+        exit_code, seconds, cpu_seconds, peak_rss_mb = run_measured(command, workdir)
+        if not os.path.exists(metrics_summary_filename):
+            stages[step_desc] = {"exit_code": exit_code, "seconds": round(seconds, 3), "failed": True}
+            logging.error(f"<{step_desc}> failed with exit code {exit_code}, no metrics summary written (see {logging_filename} in {workdir})")
+            print(f"<{step_desc}> failed with exit code {exit_code}, no metrics summary written (see {logging_filename} in {workdir})")
+            continue
+        with open(metrics_summary_filename, "r", encoding="utf-8") as file:
+            step_summary = json.load(file).get(step_desc, {})
+        stages[step_desc] = {
+            "exit_code": exit_code,
+            "seconds": round(seconds, 3),
+            "cpu_seconds": round_measure(cpu_seconds, 3),
+            "peak_rss_mb": round_measure(peak_rss_mb, 1),
+            "pages": step_summary.get("pages", 0),
+            "pages_per_second": round(step_summary.get("pages_per_second", 0), 2),
+            "p50_page_seconds": step_summary.get("p50_page_seconds", 0),
+            "p95_page_seconds": step_summary.get("p95_page_seconds", 0),
+            "error_rate": step_summary.get("error_rate", 0),
+        }
+        print(f"<{step_desc}> {stages[step_desc]}")
+
+    exit_code, seconds, cpu_seconds, peak_rss_mb = run_measured([sys.executable, reformat_data_filename], workdir)
+    stages["reformat_data"] = {"exit_code": exit_code, "seconds": round(seconds, 3), "cpu_seconds": round_measure(cpu_seconds, 3), "peak_rss_mb": round_measure(peak_rss_mb, 1)}
+    print(f"<reformat_data> {stages['reformat_data']}")
+    return stages
+# END: Benchmark function
+
+
+# Main Function
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scraping steps and reformat_data.py against a local fixture site built from the repo's csv files")
+    parser.add_argument("--vendors", type=int, default=None, help="no. of vendor pages in the fixture site (default: all of profile_vendors_links.csv)")
+    parser.add_argument("--page-size", type=int, default=listing_page_size, help="vendors per professionals listing page")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds the fixture site takes to answer a page")
+    parser.add_argument("--latency-jitter", type=float, default=0.005, help="standard deviation of the latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of the requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--engine", choices=["http", "browser"], default="http")
+    parser.add_argument("--workdir", default=None, help="directory the steps write their files in (default: a temporary directory)")
+    parser.add_argument("--baseline", default=baseline_filename, help="results of a previous run to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run's results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=regression_tolerance, help="relative change of a metric reported as a regression")
+    parser.add_argument("--output", default=result_filename, help="file the results are written to")
+    parser.add_argument("scrap_args", nargs=argparse.REMAINDER, help="extra options passed to scrap.py after --, e.g. -- --pipeline")
+    return parser.parse_args(argv)
+
+def main(args=None):
+    args = args if args else parse_args([])
+    whole_benchmark_timer = Timer()
+    pages = build_fixture_site(args.vendors, args.page_size)
+    fixture_site = FixtureSite(pages, latency_seconds=args.latency, latency_jitter_seconds=args.latency_jitter, error_rate=args.error_rate, error_status=args.error_status)
+    fixture_site.start()
+    print(f"Fixture site: {len(pages)} pages on {fixture_site.get_url(start_path)}")
+
+    with tempfile.TemporaryDirectory() as temp_dirname:
+        workdir = args.workdir if args.workdir else temp_dirname
+        os.makedirs(workdir, exist_ok=True)
+        logging.basicConfig(filename=os.path.join(workdir, logging_filename), level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+        try:
+            stages = run_benchmark(fixture_site, workdir, args.engine, [scrap_arg for scrap_arg in args.scrap_args if scrap_arg != "--"])
+            vendors_filename = os.path.join(workdir, "vendors_name_contact.csv")
+            vendors_rows_count = 0
+            if os.path.exists(vendors_filename):
+                with open(vendors_filename, "r", encoding="utf-8") as file:
+                    vendors_rows_count = sum(1 for _ in file) - 1
+        finally:
+            fixture_site.stop()
+        whole_benchmark_timer.stop()
+
+        result = {
+            "params": {"vendors": args.vendors, "page_size": args.page_size, "latency": args.latency, "latency_jitter": args.latency_jitter, "error_rate": args.error_rate, "engine": args.engine, "scrap_args": args.scrap_args},
+            "fixture_pages": len(pages),
+            "requests": fixture_site.server.requests_count,
+            "injected_errors": fixture_site.server.errors_count,
+            "vendors_rows": vendors_rows_count,
+            "seconds": round(whole_benchmark_timer.get_execution_time(), 3),
+            "stages": stages,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+        logging.info(f"Benchmark: {result}")
+        logging.basicConfig(handlers=[logging.NullHandler()], force=True) # close the log before the temporary workdir is removed
+    print(f"Benchmark: {result['requests']} requests, {result['vendors_rows']} vendors rows, {result['seconds']:.2f} seconds -> {args.output}")
+
+    failed_stages = [stage for stage, stage_result in result["stages"].items() if stage_result.get("failed") or stage_result.get("exit_code")]
+    if failed_stages:
+        print(f"{len(failed_stages)} stage(s) failed: {', '.join(failed_stages)}, no baseline comparison")
+        return 1
+
+    is_regressed = False
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("params") != result["params"]:
+            print(f"Baseline {args.baseline} was run with other params {baseline.get('params')}, comparison skipped")
+        else:
+            regressions = compare_to_baseline(result, baseline, args.tolerance)
+            for stage, metric, value, baseline_value, change in regressions:
+                print(f"REGRESSION <{stage}> {metric}: {value} vs. {baseline_value} in the baseline ({change:+.0%})")
+            is_regressed = bool(regressions)
+            print("No regression against the baseline" if not regressions else f"{len(regressions)} regression(s) against the baseline")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+        print(f"Baseline saved: {args.baseline}")
+    return 1 if is_regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
+# END: Main Function
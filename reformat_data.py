@@ -1,16 +1,28 @@
-import re
 import os
-import sys
-import copy
+import csv
 import time
 import json
+import heapq
+import hashlib
 import logging
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+import functools
+import collections
 import pandas as pd
 
+from concurrent.futures import ProcessPoolExecutor
+
+from scrap import csv_file_manager as scrap_csv_file_manager, output_filename_checker # reads the outputs of scrap.py in any of its formats
+
 # Global variables
 default_link = "https://www.recommend.my/services/all-services"
-save_point_filename = "save_point"
-save_point_header = ["link_index", "url", "desc"]
+reformat_chunk_rows = 50000 # rows of the input reformatted at a time (bounded memory whatever the input size)
+reformat_state_filename = "reformat_state.sqlite" # index of the (name, contact number) already written + input position of the last run
+contact_numbers_separators_regex = r'\s*[/,;|&]\s*' # a cell with several numbers, e.g. "0123456789 / 0198765432"
+file_signature_bytes = 4096 # an input file is the one of the last run if these first bytes, and the ones before its last position, didn't change
 logging_filename = 'recommend.log'
 logging.basicConfig(filename=logging_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 # END: Global variables
@@ -54,73 +66,105 @@ def list_extend_or_append_data(list, data):
 
 def csv_filename_checker(filename):
     return (filename if ".csv" in filename else filename+".csv")
+
+def reformat_contacts_chunk(df, name_column, contact_columns, contact_column):
+    # One (name, contact number) row per number of the chunk's contact columns, with vectorized string operations:
+    # the cells with several numbers are split, the numbers keep their digits only, with the local "0" prefix instead of "60"
+    df = df.astype("string") # missing values stay missing (not "None" or "nan")
+    df_contacts = pd.concat([df[[name_column, column]].rename(columns={column: contact_column}) for column in contact_columns], ignore_index=True)
+    df_contacts[contact_column] = df_contacts[contact_column].str.split(contact_numbers_separators_regex)
+    df_contacts = df_contacts.explode(contact_column)
+    df_contacts[contact_column] = df_contacts[contact_column].str.replace(r'\D', '', regex=True).str.replace(r'^60(?=[1-9])', '0', regex=True)
+    df_contacts[name_column] = df_contacts[name_column].str.strip()
+    df_contacts = df_contacts[df_contacts[name_column].fillna("").ne("") & df_contacts[contact_column].fillna("").ne("")]
+    return df_contacts.drop_duplicates(keep='first').reset_index(drop=True)
+
+def iter_map_bounded(executor, function, items, max_pending):
+    # executor.map, in order, without submitting all the items at once (a lazy input stays lazy)
+    pending_futures = collections.deque()
+    for item in items:
+        pending_futures.append(executor.submit(function, item))
+        if len(pending_futures) >= max_pending:
+            yield pending_futures.popleft().result()
+    while pending_futures:
+        yield pending_futures.popleft().result()
+
+def write_sorted_run(df, header, dirname):
+    # The rows sorted by all the columns of header into a temporary csv file, merged later with the other runs. Sorted as the strings
+    # written (a missing value is ""), the order merge_sorted_runs compares the rows read back in
+    run_file_descriptor, run_filename = tempfile.mkstemp(suffix=".run.csv", dir=dirname)
+    rows = (tuple("" if pd.isna(value) else str(value) for value in row) for row in df[header].itertuples(index=False, name=None))
+    with os.fdopen(run_file_descriptor, "w", encoding="utf-8", newline="") as run_file:
+        writer = csv.writer(run_file, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(sorted(rows))
+    return run_filename
+
+def iter_csv_rows(filename):
+    with open(filename, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None) # skip the header row
+        yield from reader
+
+def merge_sorted_runs(run_filenames, filename, header):
+    # K-way merge of the sorted runs into filename, never more than one row of every run in memory
+    with open(filename, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(heapq.merge(*[iter_csv_rows(run_filename) for run_filename in run_filenames]))
+
+def get_file_signature(filename, position):
+    # Hash of the first bytes of the file and of the bytes before position: an appended file keeps its signature, a rewritten one doesn't
+    with open(filename, "rb") as file:
+        head = file.read(min(position, file_signature_bytes))
+        file.seek(max(0, position - file_signature_bytes))
+        tail = file.read(min(position, file_signature_bytes))
+    return hashlib.sha256(head + b"|" + tail).hexdigest()
+
+def get_output_signature(filename):
+    # The output as the last run left it (size, modification time), else it was changed by something else
+    stat = os.stat(filename)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
 # END: Global function
 
 
 # Classes
-class CSVFileManager:
-
-    def __init__(self)-> None:
-        pass
-
-    def read(self, filename, cols_name, format="list"):
-        filename = csv_filename_checker(filename)
-        if format in ["dict", "list", "series", "split", "tight", "records", "index"]:
-            try:
-                df = pd.read_csv(filename, usecols=cols_name)
-            except Exception as e:
-                print(f"Read csv file exception: {e}")
-                return False
-            else:
-                data = df.to_dict(format)
-            return data
-        else:
-            return False
-
-    def write(self, data, headers, filename):
-        df = pd.DataFrame(data)
-        filename = csv_filename_checker(filename)
-        try:
-            # Export the DataFrame to a CSV file
-            df.to_csv(filename, header=headers, index=False)  # Set index=False to exclude row numbers in the CSV
-        except Exception as e:    
-            logging.error(f"Write data into {filename} failed: {e}", exc_info=True)
-            print(f"Write data into {filename} failed: {e}")
-
-    def write_header(self, header, filename):
-        df = pd.DataFrame(columns=header)
-        filename = csv_filename_checker(filename)
-        try:
-            # Export the DataFrame to a CSV file
-            df.to_csv(filename, index=False)  # Set index=False to exclude row numbers in the CSV
-        except Exception as e: 
-            logging.error(f"Write header {header} into {filename} failed: {e}", exc_info=True)
-            print(f"Write header {header} into {filename} failed: {e}")
-
-    def append(self, data, filename):
-        df = pd.DataFrame(data)
-        filename = csv_filename_checker(filename)
-        try:
-            # Append the DataFrame to a CSV file
-            df.to_csv(filename, mode="a", index=False, header=False)  # Set index=False to exclude row numbers and header=False to exclude extra column names in the CSV
-        except Exception as e:    
-            logging.error(f"Append data into {filename} failed: {e}", exc_info=True)
-            print(f"Append data into {filename} failed: {e}")    
-    
-    def is_file_exist(self, filename):
-        return pd.io.common.file_exists(csv_filename_checker(filename))
-
-    def remove_null_and_duplicates_from_csv(self, filename):
-        filename = csv_filename_checker(filename)
-        # Read the CSV file into a pandas DataFrame
-        df = pd.read_csv(filename, dtype=str)        
-        # Remove rows with empty strings in any column
-        df_cleaned = df.dropna(subset=df.columns, how='all', inplace=False)
-        # Remove duplicate rows based on all columns
-        df_cleaned_no_duplicates = df_cleaned.drop_duplicates(subset=df.columns, keep='first')
-        # Save the cleaned DataFrame to a new CSV file
-        df_cleaned_no_duplicates.to_csv(filename, index=False)
-            
+class ReformatStateStore:
+    # Index of the (name, contact number) keys already in the reformatted output, and the position in the input the last run
+    # stopped at: an incremental run reformats the input rows appended since and writes only the keys not in the index.
+    # All the changes of a run are committed together, once its output file is written
+    def __init__(self, filename=reformat_state_filename) -> None:
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS keys (name TEXT, contact_number TEXT, PRIMARY KEY (name, contact_number)) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute("CREATE TEMP TABLE chunk_keys (row_index INTEGER PRIMARY KEY, name TEXT, contact_number TEXT)")
+        self.connection.commit()
+
+    def get_state(self) -> dict:
+        return {key: json.loads(value) for key, value in self.connection.execute("SELECT key, value FROM state")}
+
+    def set_state(self, state) -> None:
+        self.connection.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)", ((key, json.dumps(value)) for key, value in state.items()))
+
+    def reset(self) -> None:
+        self.connection.execute("DELETE FROM keys")
+        self.connection.execute("DELETE FROM state")
+
+    def add_new_keys(self, df, name_column, contact_column):
+        # The rows of df (unique keys) not in the index yet, added to it
+        self.connection.execute("DELETE FROM chunk_keys")
+        self.connection.executemany("INSERT INTO chunk_keys VALUES (?, ?, ?)", zip(range(len(df)), df[name_column], df[contact_column]))
+        new_row_indexes = [row_index for (row_index,) in self.connection.execute(
+            "SELECT row_index FROM chunk_keys WHERE NOT EXISTS (SELECT 1 FROM keys WHERE keys.name = chunk_keys.name AND keys.contact_number = chunk_keys.contact_number) ORDER BY row_index"
+        )]
+        self.connection.execute("INSERT OR IGNORE INTO keys SELECT name, contact_number FROM chunk_keys")
+        return df.iloc[new_row_indexes]
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
 
 class Timer:
     def __init__(self)-> None:
@@ -138,48 +182,90 @@ class Timer:
 # END: Classes
 
 
-# Classes Configurations
-csv_file_manager = CSVFileManager()
-# END: Classes Configurations
-
-
 # Main Function
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reformat the vendors contacts scraped by scrap.py into one (name, contact number) row per number, sorted by name")
+    parser.add_argument("--incremental", action="store_true", help="only reformat the rows appended to the input since the last run and merge them into the existing output (a full run if the input or the output changed otherwise)")
+    parser.add_argument("--chunk-rows", type=int, default=reformat_chunk_rows, help="rows reformatted at a time")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes reformatting the chunks in parallel")
+    parser.add_argument("--input-format", choices=["csv", "parquet", "arrow", "sqlite"], default="csv", help="output format of the scrap.py step writing the vendors contacts (its \"output_format\")")
+    return parser.parse_args(argv)
+
+def main(args=None):
+    args = args if args else parse_args([])
     read_filename = "vendors_name_contact"
     name_column = "name"
     whatsapp_column = "whatsapp_number"
     phone_column = "phonecall_number"
     contact_column = "contact_number"    
     write_filename = "reformatted_vendors_name_contact"
+    write_header = [name_column, contact_column]
 
     whole_script_timer = Timer()
+    reformat_state_store = None
     try:
-        # Read from csv file
-        filename = csv_filename_checker(read_filename)    
-        df = pd.read_csv(filename, dtype=str)                
-
-        # Extract and seperate whatsapp_number column and phonecall_number
-        df_cleaned_wa_column = df[[name_column, whatsapp_column]].rename(columns={whatsapp_column: contact_column}).dropna()
-        df_cleaned_phone_column = df[[name_column, phone_column]].rename(columns={phone_column: contact_column}).dropna()        
-
-        # Append the new rows to the original DataFrame
-        df_reformatted = pd.concat([df_cleaned_wa_column, df_cleaned_phone_column], ignore_index=True)
-
-        # Remove duplicated rows (make rows unique) & sort by column "name"
-        df_reformatted_cleaned = df_reformatted.drop_duplicates(subset=df_reformatted.columns, keep='first').sort_values(by=[name_column])
-
-        # Write the reformatted data into a csv file
-        df_reformatted_cleaned.to_csv(csv_filename_checker(write_filename), index=False)
+        # Read from the output file of scrap.py (in the output format of its step), the rows appended since the last run in incremental mode
+        output_format = args.input_format
+        input_filename = output_filename_checker(read_filename, output_format)
+        output_filename = csv_filename_checker(write_filename)
+        end_position = scrap_csv_file_manager.get_end_position(read_filename, output_format)
+        reformat_state_store = ReformatStateStore()
+        state = reformat_state_store.get_state()
+        is_incremental = (
+            args.incremental
+            and state.get("input") == input_filename
+            and os.path.exists(output_filename) and state.get("output_signature") == get_output_signature(output_filename)
+            and state.get("position", 0) <= end_position
+            and (output_format != "csv" or state.get("input_signature") == get_file_signature(input_filename, state["position"]))
+        )
+        if not is_incremental:
+            reformat_state_store.reset() # full run: the index is rebuilt with the output
+        start_position = state["position"] if is_incremental else 0
+        chunks = scrap_csv_file_manager.iter_dataframes(read_filename, [name_column, whatsapp_column, phone_column], args.chunk_rows, output_format, start_position, end_position)
+
+        # Extract and seperate whatsapp_number column and phonecall_number (chunks reformatted in parallel, in order), remove the
+        # duplicated rows against the index of the rows already written, and write every chunk's new rows as a sorted run
+        reformat_chunk = functools.partial(reformat_contacts_chunk, name_column=name_column, contact_columns=[whatsapp_column, phone_column], contact_column=contact_column)
+        first_chunks = [chunk for chunk in [next(chunks, None), next(chunks, None)] if chunk is not None]
+        new_rows_count = 0
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_filename))) as temp_dirname:
+            run_filenames = [output_filename] if is_incremental else []
+            with ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 and len(first_chunks) > 1 else contextlib.nullcontext() as executor:
+                all_chunks = (chunk for chunks_part in [first_chunks, chunks] for chunk in chunks_part)
+                reformatted_chunks = iter_map_bounded(executor, reformat_chunk, all_chunks, 2 * args.workers) if executor else map(reformat_chunk, all_chunks)
+                for reformatted_chunk in reformatted_chunks:
+                    new_rows = reformat_state_store.add_new_keys(reformatted_chunk, name_column, contact_column)
+                    if len(new_rows):
+                        run_filenames.append(write_sorted_run(new_rows, write_header, temp_dirname))
+                        new_rows_count += len(new_rows)
+
+            # Merge the sorted runs (and the previous output) into the output sorted by column "name" (then "contact_number"), replaced atomically
+            if new_rows_count or not is_incremental:
+                temp_output_filename = os.path.join(temp_dirname, "output.csv")
+                merge_sorted_runs(run_filenames, temp_output_filename, write_header)
+                os.replace(temp_output_filename, output_filename)
+
+        reformat_state_store.set_state({
+            "input": input_filename,
+            "position": end_position,
+            "input_signature": get_file_signature(input_filename, end_position) if output_format == "csv" else None,
+            "output_signature": get_output_signature(output_filename),
+        })
+        reformat_state_store.commit()
+        logging.info(f"{'Incremental' if is_incremental else 'Full'} reformat: {new_rows_count} new rows written into {output_filename}")
+        print(f"{'Incremental' if is_incremental else 'Full'} reformat: {new_rows_count} new rows written into {output_filename}")
 
     except BaseException as be:
         logging.error(f"Error occurred in main exception: {be}", exc_info=True)
         print(f"Error occurred in main exception: {be}")
     finally:
+        if reformat_state_store:
+            reformat_state_store.close() # not committed: the state of the last successful run is kept
         whole_script_timer.stop()
         logging.info(f"Whole script execution time: {whole_script_timer.get_execution_time():.2f} seconds") # Log info into a file
         print(f"Whole script execution time: {whole_script_timer.get_execution_time():.2f} seconds")
 
 
 if __name__ == "__main__":
-    main()
-# END: Main Function
\ No newline at end of file
+    main(parse_args())
+# END: Main Function
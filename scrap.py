@@ -1,22 +1,207 @@
 import re
 import os
 import sys
+import csv
 import copy
 import time
+import glob
 import json
+import gzip
+import queue
+import random
+import signal
+import asyncio
+import fnmatch
+import hashlib
 import logging
-import pandas as pd
+import heapq
+import shutil
+import socket
+import sqlite3
+import tempfile
+import argparse
+import importlib
+import importlib.util
+import functools
+import itertools
+import threading
+import contextlib
+import http.server
+import html
+import urllib3
+import email.utils
+import urllib.robotparser
+
+from bs4 import BeautifulSoup
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+try:
+    import lxml # compiled HTML parser, used by the http engine when installed
+    html_parser_name = "lxml"
+except ImportError:
+    html_parser_name = "html.parser"
+
+try:
+    import psutil # the browser's processes (memory, kill) where there is no /proc (in requirements.txt)
+except ImportError:
+    psutil = None
+
+class LazyModule:
+    # Module imported on its first attribute access: pandas and pyarrow take ~0.6 seconds to import, most runs of a step never use them
+    def __init__(self, module_name, submodule_names=None) -> None:
+        self.module_name = module_name
+        self.submodule_names = submodule_names if submodule_names else []
+
+    def __getattr__(self, name):
+        for submodule_name in self.submodule_names:
+            importlib.import_module(submodule_name)
+        return getattr(importlib.import_module(self.module_name), name)
+
+pd = LazyModule("pandas")
+pa = LazyModule("pyarrow", ["pyarrow.ipc"]) if importlib.util.find_spec("pyarrow") else None # only needed by the parquet and arrow output formats
+pq = LazyModule("pyarrow.parquet") if pa else None
 
 # Global variables
 default_link = "https://www.recommend.my/services/all-services"
-save_point_filename = "save_point"
-save_point_header = ["link_index", "url", "desc"]
+checkpoint_dirname = "checkpoints" # checkpoint journals of the steps of an unfinished run
+checkpoint_sync_seconds = 5 # the checkpoint journals are synced to disk every few seconds (and after every flush of the rows), a kill loses at most this much work
+checkpoint_compact_entries = 1000 # a checkpoint journal is compacted once it has more entries than this
+worker_file_suffix = "_worker_"
+output_formats_extensions = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow", "sqlite": ".sqlite"} # parquet and arrow outputs are directories of part files
+writer_buffer_rows = 500 # a step's writer writes its buffered rows once it has this many rows...
+writer_flush_seconds = 5 # ... or once its oldest buffered rows are this old
+pipeline_queue_links = 1000 # pipeline mode: max. no. of links waiting between 2 steps, a step emitting more waits for the next step
+pipeline_put_seconds = 1 # pipeline mode: a step waiting for room in the queue checks this often whether the next step stopped
+file_links_index_rows = 10000 # the position in the input file of every this many links is kept, a worker seeks to its first link from the closest one
+file_links_buffer_bytes = 1024 * 1024 # read buffer of a csv input file (the links are read one row at a time)
+dedup_modes = ["memory", "bloom", "external", "none"] # how a step drops its empty and duplicated rows (see RowDeduplicator)
+dedup_bloom_bits = 64 * 1024 * 1024 # 8 MiB bloom filter, ~1% false positives (confirmed on the on-disk index) up to ~6.7M rows
+dedup_bloom_hashes = 7
+dedup_external_sort_rows = 100000 # external sort dedup: max. no. of rows hashes held in memory
+browser_profiles = {
+    "default": {},
+    # Headless, returns at DOMContentLoaded, no images/fonts/media/analytics/ads downloaded, bounded caches.
+    # Stylesheets are not blocked: element.text depends on the styles (a hidden element has no text)
+    "lean": {
+        "headless": True,
+        "page_load_strategy": "eager", # "none" returns as soon as the navigation starts
+        "blocked_url_patterns": [
+            "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", # images
+            "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", # fonts
+            "*.mp4", "*.webm", "*.mp3", "*.m3u8", # media
+            "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+            "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*clarity.ms*", # analytics, ads
+        ],
+        "disable_images": True,
+        "disk_cache_bytes": 32 * 1024 * 1024,
+        "media_cache_bytes": 1024 * 1024,
+    },
+}
+http_headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+http_timeout = 30 # seconds
+http_concurrency = 8 # max. no. of pages the http engine fetches at the same time
+http_prefetch_pages = 32 # no. of upcoming links the http engine fetches in advance
+http_initial_concurrency_per_host = 4 # adaptive concurrency: in-flight requests to a host (all the scrapers together) it starts from,
+http_max_concurrency_per_host = 32 # ... it grows while the host answers fast up to this, and halves when the host pushes back
+http_max_requests_per_second = None # token bucket rate of every host (None: only the host's robots.txt crawl-delay limits the rate)
+http_latency_backoff_factor = 3 # the host's responses getting this many times slower than its baseline ones is a sign of overload
+http_latency_baseline_drift = 0.01 # the baseline follows a lasting rise of the host's latency (CDN route, bigger pages) by this share of the gap per response
+http_backoff_seconds = 2 # pause of a host after a 429/503/anti-bot answer without Retry-After (doubled for every consecutive one)
+http_retry_after_max_seconds = 600 # longest pause of a host
+http_throttle_retries = 3 # times a request answered by a 429/503/anti-bot page is retried, after the host's pause
+anti_bot_title_regex = r'(?i)captcha|attention required|just a moment|access denied|unusual traffic|are you a robot|security check' # title of the challenge/block pages
+batch_action_specs = { # extract actions that extract_batch can run together: action name -> [kind, css selectors, attribute or regex]
+    "extract_elements_links": lambda css_selectors: ["attrs", css_selectors, "href"],
+    "extract_elements_texts": lambda css_selectors: ["texts", css_selectors, None],
+    "extract_regex_from_script_tag": lambda regex: ["regex", ["script"], regex],
+    "extract_page_url": lambda _: ["url", [], None],
+}
+extract_matching_texts_script = """
+const patterns = arguments[1].map(regex => { try { return new RegExp(regex); } catch (e) { return null; } }); // null: pattern only valid in python, keep every element
+return [...document.querySelectorAll(arguments[0])].map(element => element.textContent).filter(text => patterns.some(pattern => !pattern || pattern.test(text))).join("\\n");
+"""
+extract_batch_script = """
+const [specs, regexs] = arguments;
+const results = specs.map(([kind, cssSelectors, arg]) => {
+    if (kind === "regex" || kind === "url") return null; // all the regexs are matched in one pass over scriptsText, the url is the scraper's
+    return cssSelectors.flatMap(cssSelector => [...document.querySelectorAll(cssSelector)].map(element => {
+        if (kind === "texts") return element.innerText.trim();
+        const value = element[arg]; // property first (absolute href), same as element.get_attribute
+        return typeof value === "string" ? value : element.getAttribute(arg);
+    }));
+});
+const patterns = regexs.map(regex => { try { return new RegExp(regex); } catch (e) { return null; } });
+const scriptsText = regexs.length ? [...document.querySelectorAll("script")].map(element => element.textContent).filter(text => patterns.some(pattern => !pattern || pattern.test(text))).join("\\n") : "";
+return [results, scriptsText];
+"""
+browser_restart_pages = 500 # the browser is restarted after this many pages (its memory grows with every page)...
+browser_restart_rss_bytes = 1536 * 1024 * 1024 # ... once the memory (RSS) of its processes (driver, browser, renderers) is over this...
+browser_restart_errors = 3 # ... or after this many navigation errors in a row (at once if it crashed)
+browser_rss_check_pages = 20 # the memory of the browser's processes is measured every this many pages
+browser_navigation_timeout = 60 # seconds a page may take to load (the driver's page load timeout)...
+browser_watchdog_grace_seconds = 30 # ... a navigation still not returned this long after it is hung: the browser is killed
+browser_quit_timeout = 10 # seconds the browser is given to quit before its processes are killed
+browser_fatal_error_messages = ["invalid session id", "tab crashed", "page crash", "chrome not reachable", "disconnected", "no such window", "connection refused", "max retries exceeded"] # the browser is dead, restart it at once
+ready_condition_timeout = 10 # seconds a page readiness condition is waited for (a condition's "timeout" overrides it), the page fails once it times out (unless the condition is "optional")
+ready_condition_poll_seconds = 0.05
+ready_condition_scripts = {
+    # {"selector": css selector}: an element matches the selector
+    "selector": "return document.querySelector(arguments[0]) !== null;",
+    # {"script_regex": regex}: a script tag matches the regex (the regexs of the extract_regex actions are JS compatible)
+    "script_regex": "const regex = new RegExp(arguments[0]); return [...document.scripts].some(script => regex.test(script.textContent));",
+    # {"network_idle": seconds}: the document is parsed and no resource finished loading for this long
+    "network_idle": """
+        if (document.readyState === "loading") return false;
+        const lastResponseEnd = Math.max(0, ...performance.getEntriesByType("resource").map(entry => entry.responseEnd));
+        return performance.now() - lastResponseEnd >= arguments[0] * 1000;
+    """,
+}
+page_archive_dirname = "page_archive" # capture/replay archive of the fetched pages
+page_archive_index_filename = "index.jsonl"
+crawl_state_filename = "crawl_state.sqlite" # last fetch time, content hash and extracted record of every url (incremental mode)
+crawl_freshness_seconds = 7 * 24 * 60 * 60 # incremental mode: an url fetched less than this ago is not fetched again
+metrics_latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60] # seconds, upper bounds of the latency histograms buckets
+metrics_summary_filename = "metrics_summary.json" # per step counters and latency percentiles, written at the end of the run
+trace_exporter_formats = ["jsonl", "otlp"] # --trace: one span per line, or one OTLP/JSON export request per line (the otlp file exporter's format)
+trace_flush_spans = 1000 # the finished spans are written to the trace file once this many are buffered...
+trace_flush_seconds = 5 # ... or once the oldest ones are this old
+profile_dirname = "profiles" # --profile: folded stacks and flamegraph (svg) of every step
+profile_sample_seconds = 0.005 # the python stacks of the steps' threads are sampled every this long
+flamegraph_width = 1200 # pixels
+flamegraph_frame_height = 16
+work_queue_node_id = f"{socket.gethostname()}-{os.getpid()}" # distributed mode: name of this node in the work queue's leases
+work_queue_lease_seconds = 120 # a node's leased links are reissued to the other nodes if it doesn't heartbeat for this long
+work_queue_max_attempts = 3 # a link that failed (or whose node died) this many times is given up
+work_queue_poll_seconds = 2 # seconds between 2 lease attempts while other nodes hold the last links of a step
+step_cache_dirname = "step_cache" # outputs of the finished steps, keyed by the fingerprint of their config and input file
+step_cache_ttl_seconds = 24 * 60 * 60 # a cached output older than this is scraped again (the site changes even if the step's input doesn't)
+step_cache_max_entries = 20 # least recently used cached outputs evicted beyond this many...
+step_cache_max_bytes = 2 * 1024 * 1024 * 1024 # ... or this size
+step_execution_params = ["workers", "engine", "browser_profile", "ready_conditions", "pagination_mode", "freshness_seconds"] # how a step is run, not what it outputs: left out of its fingerprint
+vendor_store_filename = "vendor_store.sqlite" # --store: the rows of every step upserted into indexed tables (vendors by profile link and phone number)
+vendor_store_busy_seconds = 60 # a writer waits this long for the other writers (workers, other runs) of the vendor store
+url_frontier_filename = os.path.join(checkpoint_dirname, "url_frontier.sqlite") # urls claimed by the links of the steps of the current run
+url_tracking_params = ["utm_*", "fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "_ga"] # query params that don't change the page
+default_url_rules = { # how the url frontier canonicalizes the urls of a step (a step's "url_rules" overrides them), see canonicalize_url
+    "drop_params": url_tracking_params, # query params removed (glob patterns)
+    "sort_params": True, # ?b=2&a=1 is ?a=1&b=2
+    "strip_trailing_slash": True, # /path/ is /path
+    "lowercase_path": False, # /Path is /path (servers with case insensitive paths only)
+}
+daemon_port = 8766 # daemon mode: port of the local jobs api
+daemon_browsers = 2 # daemon mode: warm scrapers kept for every scraper config of the steps (engine, browser profile, ready conditions)
 logging_filename = 'recommend.log'
 logging.basicConfig(filename=logging_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 # END: Global variables
@@ -60,26 +245,678 @@ def list_extend_or_append_data(list, data):
 
 def csv_filename_checker(filename):
     return (filename if ".csv" in filename else filename+".csv")
+
+def output_filename_checker(filename, output_format="csv"):
+    if output_format == "csv":
+        return csv_filename_checker(filename)
+    filename = filename.replace(".csv", "")
+    return filename if filename.endswith(output_formats_extensions[output_format]) else filename+output_formats_extensions[output_format]
+
+def temp_output_filename(filename):
+    # Temporary output a step's output is written to before it's renamed over the step's output
+    return f"{filename.replace('.csv', '')}.tmp{os.getpid()}"
+
+def normalize_phone_number(phone_number):
+    # Digits only, with the local "0" prefix instead of the country code "60" (same numbers as reformat_data.py)
+    digits = re.sub(r'\D', '', phone_number if isinstance(phone_number, str) else "")
+    return re.sub(r'^60(?=[1-9])', '0', digits)
+
+def hash_output_file(filename, output_format="csv"):
+    # sha256 of the content of a step's output (of its part files in order for a directory output), None if it doesn't exist
+    filename = output_filename_checker(filename, output_format)
+    part_filenames = sorted(glob.glob(os.path.join(glob.escape(filename), "*"))) if os.path.isdir(filename) else [filename]
+    if not os.path.exists(filename):
+        return None
+    sha256 = hashlib.sha256()
+    for part_filename in part_filenames:
+        sha256.update(os.path.basename(part_filename).encode("utf-8") + b"\0")
+        with open(part_filename, "rb") as part_file:
+            for block in iter(lambda: part_file.read(1024 * 1024), b""):
+                sha256.update(block)
+    return sha256.hexdigest()
+
+def get_step_fingerprint(step_params):
+    # A step's output only depends on its config (selectors, regexs, flags), the start url, the page archive mode and its input file:
+    # the same step run with more workers or another engine reuses the cached output
+    read_csv_file_name = step_params["read_csv_file_name"]
+    input_hash = hash_output_file(read_csv_file_name, csv_file_manager.find_output_format(read_csv_file_name, step_params.get("read_output_format"))) if read_csv_file_name else None
+    output_params = {key: value for key, value in step_params.items() if key not in step_execution_params}
+    fingerprint_data = {"step_params": output_params, "start_url": default_link, "page_archive_mode": page_archive_mode, "input_hash": input_hash}
+    return hashlib.sha256(json.dumps(fingerprint_data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def hash_row(row):
+    return hashlib.blake2b("\x1f".join("" if value is None else str(value) for value in row).encode("utf-8"), digest_size=16).digest()
+
+def write_sorted_run(items, dirname):
+    # Sort items (tuples of a hex string and an int, or ints) in memory and write them into a run file, one per line
+    run_file_descriptor, run_filename = tempfile.mkstemp(suffix=".run", dir=dirname)
+    with os.fdopen(run_file_descriptor, "w", encoding="utf-8") as run_file:
+        for item in sorted(items):
+            run_file.write(f"{item[0]} {item[1]}\n" if isinstance(item, tuple) else f"{item}\n")
+    return run_filename
+
+def read_sorted_run(run_filename):
+    with open(run_filename, "r", encoding="utf-8") as run_file:
+        for line in run_file:
+            values = line.split()
+            yield (values[0], int(values[1])) if len(values) == 2 else int(values[0])
+
+def check_pyarrow(output_format):
+    if pa is None:
+        raise ImportError(f"pyarrow is required for the {output_format} output format: pip install pyarrow")
+
+@functools.lru_cache(maxsize=128)
+def compile_multi_regex(regexs):
+    # Combine the regexs into one pattern, each regex in its own named group inside a lookahead so the matches of different regexs can overlap
+    # Returns (combined pattern or None if they can't be combined, compiled regexs, index of each regex's named group), cached across pages
+    compiled_regexs = [re.compile(regex) for regex in regexs]
+    group_indexes = []
+    group_index = 1
+    for compiled_regex in compiled_regexs:
+        group_indexes.append(group_index)
+        group_index += 1 + compiled_regex.groups
+    try:
+        combined_regex = re.compile("(?=" + "|".join(f"(?P<regex{index}>{regex})" for index, regex in enumerate(regexs)) + ")")
+    except re.error:
+        combined_regex = None # e.g. duplicated group names or global flags in the regexs
+    return combined_regex, compiled_regexs, group_indexes
+
+def regex_match_to_findall_data(match, group_index, groups_count):
+    # Same as re.findall: the whole match without groups, the group with one group, else a tuple of the groups
+    if groups_count == 0:
+        return match.group(group_index)
+    if groups_count == 1:
+        return match.group(group_index + 1) or ""
+    return tuple(match.group(index) or "" for index in range(group_index + 1, group_index + 1 + groups_count))
+
+def find_regexs_first_data(text, regexs):
+    # Scan the text once for all the regexs, return the first matched data of each regex (False if not found)
+    combined_regex, compiled_regexs, group_indexes = compile_multi_regex(tuple(regexs))
+    data = [None] * len(regexs)
+    if combined_regex:
+        remaining = len(regexs)
+        for match in combined_regex.finditer(text or ""):
+            index = int(match.lastgroup[len("regex"):])
+            if data[index] is None:
+                data[index] = regex_match_to_findall_data(match, group_indexes[index], compiled_regexs[index].groups)
+                remaining -= 1
+            # The alternation stops at the first regex matching at this position, the next ones not found yet may match here too
+            for next_index in range(index + 1, len(regexs)):
+                if data[next_index] is None:
+                    next_match = compiled_regexs[next_index].match(text, match.start())
+                    if next_match:
+                        data[next_index] = regex_match_to_findall_data(next_match, 0, compiled_regexs[next_index].groups)
+                        remaining -= 1
+            if not remaining:
+                break
+    else:
+        for index, compiled_regex in enumerate(compiled_regexs):
+            match = compiled_regex.search(text or "")
+            data[index] = regex_match_to_findall_data(match, 0, compiled_regex.groups) if match else None
+    for index, regex in enumerate(regexs):
+        if data[index] is None:
+            print(f"{regex} not found in any script tags")
+            data[index] = False
+    return data
+
+def canonicalize_url(url, url_rules=None):
+    # Same page = same key: lowercase scheme and host, no default port, no fragment,
+    # and with url_rules (url frontier, see default_url_rules): no tracking params, sorted params, no trailing slash...
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in [("http", "80"), ("https", "443")]:
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parts.path or "/"
+    query = parts.query
+    if url_rules:
+        params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if not any(fnmatch.fnmatchcase(key, pattern) for pattern in url_rules.get("drop_params", []))]
+        query = urlencode(sorted(params) if url_rules.get("sort_params") else params)
+        path = (path.rstrip("/") or "/") if url_rules.get("strip_trailing_slash") else path
+        path = path.lower() if url_rules.get("lowercase_path") else path
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def get_process_tree_pids(root_pid):
+    # The pid of a process and of all its descendants (the driver, its browser, the browser's renderer/gpu/utility processes)
+    if not root_pid:
+        return []
+    if psutil:
+        try:
+            return [root_pid] + [child.pid for child in psutil.Process(root_pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    if not os.path.isdir("/proc"):
+        warn_process_tree_unsupported()
+        return []
+    if not os.path.exists(f"/proc/{root_pid}"):
+        return [] # exited
+    children_pids = {}
+    for stat_filename in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_filename, "r") as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue # exited meanwhile
+        pid, parent_pid = int(stat.split(" ", 1)[0]), int(stat.rsplit(")", 1)[1].split()[1]) # the command between the parentheses may contain spaces
+        children_pids.setdefault(parent_pid, []).append(pid)
+    pids, pids_to_visit = [], [root_pid]
+    while pids_to_visit:
+        pid = pids_to_visit.pop()
+        pids.append(pid)
+        pids_to_visit.extend(children_pids.get(pid, []))
+    return pids
+
+@functools.lru_cache(maxsize=None)
+def warn_process_tree_unsupported() -> None:
+    # Once per run: without psutil nor /proc the browser's processes are unknown
+    logging.error("No psutil nor /proc: the browser's processes are neither measured (no restart on rss) nor killed when it hangs or fails to quit, install psutil")
+    print("No psutil nor /proc: the browser's processes are neither measured (no restart on rss) nor killed when it hangs or fails to quit, install psutil")
+
+def get_process_start_time(pid):
+    # Start time of a process (None if it exited): a pid reused by another process has another start time
+    try:
+        if psutil:
+            return psutil.Process(pid).create_time()
+        with open(f"/proc/{pid}/stat", "r") as stat_file:
+            return int(stat_file.read().rsplit(")", 1)[1].split()[19]) # starttime, in clock ticks since boot
+    except Exception:
+        return None
+
+def get_processes_start_times(pids):
+    # {pid: start time} of the processes still alive
+    processes_start_times = {pid: get_process_start_time(pid) for pid in pids}
+    return {pid: start_time for pid, start_time in processes_start_times.items() if start_time is not None}
+
+def get_processes_rss(pids):
+    # Resident memory of the processes in bytes (0 if it can't be measured on this platform)
+    rss = 0
+    for pid in pids:
+        try:
+            if psutil:
+                rss += psutil.Process(pid).memory_info().rss
+            else:
+                with open(f"/proc/{pid}/statm", "r") as statm_file:
+                    rss += int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except Exception:
+            continue # exited meanwhile
+    return rss
+
+def kill_processes(processes_start_times):
+    # processes_start_times: {pid: start time} (get_processes_start_times), a process that exited meanwhile and whose pid was reused isn't killed
+    for pid, start_time in processes_start_times.items():
+        if get_process_start_time(pid) != start_time:
+            continue
+        try:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except (ProcessLookupError, PermissionError):
+            pass
+
+def get_host(url):
+    return urlsplit(url).netloc
+
+def add_base_href(page_html, url):
+    # A page written into about:blank resolves its relative links and resources against about:blank, unless it has a <base>
+    if re.search(r"<base\b", page_html, re.IGNORECASE):
+        return page_html
+    base_tag = f'<base href="{html.escape(url)}">'
+    head_match = re.search(r"<head\b[^>]*>", page_html, re.IGNORECASE)
+    return page_html[:head_match.end()] + base_tag + page_html[head_match.end():] if head_match else base_tag + page_html
+
+def parse_retry_after(value):
+    # Seconds to wait from a Retry-After header (seconds or http date), None if there is none
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_anti_bot_page(title):
+    return bool(title) and re.search(anti_bot_title_regex, title) is not None
+
+def get_html_title(html):
+    match = re.search(r'<title[^>]*>(.*?)</title>', html[:16384], re.IGNORECASE | re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+def get_response_backoff_reason(status, html):
+    # Why the host asks to slow down, None if it doesn't
+    if html is not None and is_anti_bot_page(get_html_title(html)):
+        return "anti_bot"
+    if status in [429, 503]:
+        return str(status)
+    return None
+
+def is_timeout_error(e):
+    return isinstance(e, (TimeoutError, urllib3.exceptions.TimeoutError)) or isinstance(getattr(e, "reason", None), urllib3.exceptions.TimeoutError)
+
+def pagination_links_css_selector(pagination_next_btn_css_selector):
+    # The links of the paginator the next page button is in, e.g. "ul.pagination li.pagination-next a" -> "ul.pagination a"
+    return f"{pagination_next_btn_css_selector.split()[0]} a"
+
+def find_pagination_pages_urls(next_url, pages_urls):
+    # The page number is the one number of next_url that changes in the paginator's other pages urls (same url apart from it),
+    # returns the urls from the next page to the paginator's highest page number ([] if no such number)
+    next_url_parts = re.split(r'(\d+)', next_url) # the numbers are at the odd indexes
+    page_numbers = {}
+    for page_url in pages_urls:
+        page_url_parts = re.split(r'(\d+)', page_url)
+        if len(page_url_parts) != len(next_url_parts):
+            continue
+        differing_indexes = [index for index, (next_url_part, page_url_part) in enumerate(zip(next_url_parts, page_url_parts)) if next_url_part != page_url_part]
+        if len(differing_indexes) == 1 and differing_indexes[0] % 2 == 1:
+            page_numbers.setdefault(differing_indexes[0], set()).add(int(page_url_parts[differing_indexes[0]]))
+    if not page_numbers:
+        return []
+    page_number_index = max(page_numbers, key=lambda index: len(page_numbers[index]))
+    next_page_number = int(next_url_parts[page_number_index])
+    last_page_number = max(page_numbers[page_number_index])
+    return ["".join(next_url_parts[:page_number_index] + [str(page_number)] + next_url_parts[page_number_index+1:]) for page_number in range(next_page_number, last_page_number+1)]
+
+def get_pagination_pages_urls(web_scraper, pagination_next_btn_css_selector):
+    # Urls of the pages after the scraper's current page, generated from the paginator's page urls pattern
+    next_url = web_scraper.extract_element_link(pagination_next_btn_css_selector)
+    if not next_url:
+        return []
+    pages_urls = [page_url for page_url in web_scraper.extract_elements_links([pagination_links_css_selector(pagination_next_btn_css_selector)]) if page_url]
+    return find_pagination_pages_urls(next_url, pages_urls)
+
+def desc_to_filename(desc):
+    return re.sub(r'\W+', '_', str(desc)).strip('_').lower()
+
+def worker_filename(filename, worker_index):
+    return f"{filename.replace('.csv', '')}{worker_file_suffix}{worker_index}"
+
+def get_worker_filenames(filename, output_format="csv"):
+    # The part files of all the workers of a file, in worker order
+    extension = output_formats_extensions[output_format]
+    worker_filenames = glob.glob(f"{glob.escape(worker_filename(filename, ''))}*{extension}")
+    return sorted(worker_filenames, key=lambda worker_filename: int(re.findall(rf'(\d+){re.escape(extension)}$', worker_filename)[0]))
+
+def is_shared_links(links):
+    # A queue of links the workers of a step take their links from, instead of splitting a list of links
+    return isinstance(links, (QueueLinks, WorkQueueLinks))
+
+def iter_links_windows(links, size, link_index_offset=0):
+    # Windows of up to size (link index, link), a QueueLinks yields the links it has as soon as it has one,
+    # a WorkQueueLinks the links it leased, a FileLinks the links it reads (its link indexes are already offset to its chunk)
+    if is_shared_links(links) or isinstance(links, FileLinks):
+        yield from links.iter_windows(size)
+        return
+    for window_start in range(0, len(links), size):
+        yield list(enumerate(links[window_start:window_start+size], start=link_index_offset+window_start))
+
+def link_indexes_to_ranges(link_indexes):
+    ranges = []
+    for link_index in sorted(link_indexes):
+        if ranges and ranges[-1][1] == link_index - 1:
+            ranges[-1][1] = link_index
+        else:
+            ranges.append([link_index, link_index])
+    return ranges
+
+def split_list_into_chunks(items, chunks_count):
+    chunk_size = -(-len(items) // chunks_count) if items else 0 # ceil division, keep the chunks contiguous so merging them keeps the original order
+    return [items[index*chunk_size:(index+1)*chunk_size] for index in range(chunks_count)]
+
+def set_metrics_step(desc) -> None:
+    # The step the metrics recorded by the current thread are labelled with (and its sampled stacks, see SamplingProfiler)
+    metrics_context.step = desc
+    metrics_threads_steps[threading.get_ident()] = desc
+
+def clear_metrics_step() -> None:
+    # The thread's step ended: its next metrics (and samples) are not the step's, a thread id reused by a new thread neither
+    metrics_context.step = ""
+    metrics_threads_steps.pop(threading.get_ident(), None)
+
+def get_metrics_step() -> str:
+    return getattr(metrics_context, "step", "")
+
+def format_metric_labels(labels):
+    # ((name, value), ...) -> {name="value",...} with the prometheus text format escapes
+    escaped_labels = [(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped_labels) + "}"
+
+def format_trace_attribute(value):
+    # Selectors lists and regexs of an action's params as one string
+    return value if isinstance(value, (str, int, float, bool)) or value is None else json.dumps(value, ensure_ascii=False)
+
+def to_otlp_attributes(attributes):
+    otlp_attributes = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)} # int64 are strings in OTLP/JSON
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        else:
+            otlp_value = {"stringValue": str(value)}
+        otlp_attributes.append({"key": key, "value": otlp_value})
+    return otlp_attributes
+
+def from_otlp_attributes(otlp_attributes):
+    attributes = {}
+    for attribute in otlp_attributes:
+        kind, value = next(iter(attribute["value"].items()))
+        attributes[attribute["key"]] = int(value) if kind == "intValue" else value
+    return attributes
+
+def to_otlp_span(span):
+    otlp_span = {
+        "traceId": span["trace_id"],
+        "spanId": span["span_id"],
+        "name": span["name"],
+        "kind": 1, # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span["start_unix_nano"]),
+        "endTimeUnixNano": str(span["end_unix_nano"]),
+        "attributes": to_otlp_attributes(span["attributes"]),
+        "status": {"code": 2, "message": span["error"]} if span["status"] == "error" else {"code": 1},
+    }
+    if span["parent_span_id"]:
+        otlp_span["parentSpanId"] = span["parent_span_id"]
+    return otlp_span
+
+def from_otlp_span(otlp_span):
+    start_unix_nano, end_unix_nano = int(otlp_span["startTimeUnixNano"]), int(otlp_span["endTimeUnixNano"])
+    return {
+        "trace_id": otlp_span["traceId"],
+        "span_id": otlp_span["spanId"],
+        "parent_span_id": otlp_span.get("parentSpanId"),
+        "name": otlp_span["name"],
+        "start_unix_nano": start_unix_nano,
+        "end_unix_nano": end_unix_nano,
+        "duration_seconds": (end_unix_nano - start_unix_nano) / 1e9,
+        "status": "error" if otlp_span.get("status", {}).get("code") == 2 else "ok",
+        "error": otlp_span.get("status", {}).get("message"),
+        "attributes": from_otlp_attributes(otlp_span.get("attributes", [])),
+    }
+
+def read_trace_spans(filename):
+    # The spans of a trace file written by --trace, in either exporter format
+    with open(filename, "r", encoding="utf-8") as trace_file:
+        for line in trace_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # partially written last line of a killed run
+            if "resourceSpans" not in record:
+                yield record
+                continue
+            for resource_spans in record["resourceSpans"]:
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for otlp_span in scope_spans.get("spans", []):
+                        yield from_otlp_span(otlp_span)
+
+def get_percentile(sorted_values, quantile):
+    return sorted_values[min(len(sorted_values) - 1, int(quantile * len(sorted_values)))] if sorted_values else 0
+
+def print_trace_report(filename, top=20) -> None:
+    # The slowest links and pages of a trace file (with the time of their phases), and the selectors the extract actions spent the most time on
+    link_spans, page_spans, children_durations, selectors_durations = [], [], {}, {}
+    for span in read_trace_spans(filename):
+        if span["name"] == "link":
+            link_spans.append(span)
+        elif span["name"] == "page":
+            page_spans.append(span)
+        if span["parent_span_id"]:
+            phases_durations = children_durations.setdefault(span["parent_span_id"], {})
+            phases_durations[span["name"]] = phases_durations.get(span["name"], 0) + span["duration_seconds"]
+        if span["name"] == "extract":
+            selector_key = (span["attributes"].get("action", ""), span["attributes"].get("selector", ""))
+            selectors_durations.setdefault(selector_key, []).append(span["duration_seconds"])
+
+    print(f"Slowest urls ({len(link_spans)} links):")
+    print(f"{'seconds':>9} {'pages':>5}  {'step':<8} url")
+    for span in sorted(link_spans, key=lambda span: span["duration_seconds"], reverse=True)[:top]:
+        status = " [error]" if span["status"] == "error" else ""
+        print(f"{span['duration_seconds']:>9.3f} {span['attributes'].get('pages', 0):>5}  {span['attributes'].get('step', ''):<8} {span['attributes'].get('url', '')}{status}")
+
+    phases = ["navigate", "wait", "extract", "pagination_click", "flush"]
+    print(f"\nSlowest pages ({len(page_spans)} pages):")
+    print(f"{'seconds':>9} " + " ".join(f"{phase:>16}" for phase in phases + ["other"]) + "  url")
+    for span in sorted(page_spans, key=lambda span: span["duration_seconds"], reverse=True)[:top]:
+        phases_durations = children_durations.get(span["span_id"], {})
+        other_seconds = max(0, span["duration_seconds"] - sum(phases_durations.values())) # not in a child span (e.g. waiting for the GIL, parsing the html)
+        print(f"{span['duration_seconds']:>9.3f} " + " ".join(f"{phases_durations.get(phase, 0):>16.3f}" for phase in phases) + f" {other_seconds:>16.3f}  {span['attributes'].get('url', '')}")
+
+    print(f"\nSlowest selectors ({len(selectors_durations)} extract actions and params, by total seconds):")
+    print(f"{'count':>7} {'total':>9} {'p95':>8} {'max':>8}  action selector")
+    for (action, selector), durations in sorted(selectors_durations.items(), key=lambda item: sum(item[1]), reverse=True)[:top]:
+        durations = sorted(durations)
+        print(f"{len(durations):>7} {sum(durations):>9.3f} {get_percentile(durations, 0.95):>8.4f} {durations[-1]:>8.4f}  {action} {selector}")
+
+def get_frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def render_flamegraph_svg(folded_stacks, title):
+    # Flamegraph of {"root frame;...;leaf frame": samples}: the width of a frame is its share of the samples, its callees are on top of it
+    root = {"name": "all", "samples": 0, "children": {}}
+    for stack, samples in folded_stacks.items():
+        node = root
+        node["samples"] += samples
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"name": frame, "samples": 0, "children": {}})
+            node["samples"] += samples
+    max_depth = max((stack.count(";") + 1 for stack in folded_stacks), default=0)
+    height = (max_depth + 1) * flamegraph_frame_height + 40
+    elements = []
+    nodes = [(root, 0.0, 0)] # (node, x, depth)
+    while nodes:
+        node, x, depth = nodes.pop()
+        width = node["samples"] / root["samples"] * flamegraph_width if root["samples"] else 0
+        if width < 0.1:
+            continue # too narrow to be seen, its callees too
+        y = height - 10 - (depth + 1) * flamegraph_frame_height
+        name_hash = int(hashlib.md5(node["name"].split(" (")[0].encode("utf-8")).hexdigest()[:6], 16) # same color for the same function
+        color = f"rgb({205 + name_hash % 50},{80 + (name_hash >> 8) % 130},{(name_hash >> 16) % 60})"
+        label = node["name"] if len(node["name"]) * 7 < width else node["name"][:max(0, int(width / 7) - 2)] + ".." if width > 21 else ""
+        title_text = f"{node['name']} ({node['samples']} samples, {node['samples'] / root['samples']:.2%})"
+        elements.append(
+            f'<g><title>{html.escape(title_text)}</title><rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{flamegraph_frame_height - 1}" fill="{color}" rx="2"/>'
+            f'<text x="{x + 3:.1f}" y="{y + flamegraph_frame_height - 4}">{html.escape(label)}</text></g>'
+        )
+        child_x = x
+        for child in sorted(node["children"].values(), key=lambda child: child["name"]):
+            nodes.append((child, child_x, depth + 1))
+            child_x += child["samples"] / root["samples"] * flamegraph_width
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{flamegraph_width}" height="{height}" font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#f8f8f8"/><text x="{flamegraph_width / 2}" y="20" text-anchor="middle" font-size="14">{html.escape(title)}</text>'
+        + "".join(elements) + "</svg>\n"
+    )
+
+def histogram_quantile(buckets, bucket_counts, count, quantile):
+    # Estimated quantile of a histogram (linear interpolation inside the bucket, like prometheus' histogram_quantile)
+    rank = quantile * count
+    cumulative_count, lower_bound = 0, 0
+    for upper_bound, bucket_count in zip(buckets, bucket_counts):
+        if bucket_count and cumulative_count + bucket_count >= rank:
+            return lower_bound + (upper_bound - lower_bound) * (rank - cumulative_count) / bucket_count
+        cumulative_count += bucket_count
+        lower_bound = upper_bound
+    return lower_bound # in the +Inf bucket
 # END: Global function
 
 
 # Classes
+class PageNotReadyError(Exception):
+    # A readiness condition of the page timed out: its data isn't rendered, the link fails (retried by the next run) instead of giving an empty row
+    pass
+
 class WebScraper:
-    def __init__(self, url) -> None:
+    def __init__(self, url, browser_profile="default", page_load_strategy=None) -> None:
         self.url = url
-        self.driver = webdriver.Chrome()
+        self.archived_url = url # url of the page served from the archive in replay mode
+        self.navigation_error = None
+        self.is_page_not_modified = False # the browser can't send conditional requests, a page is always re-downloaded
+        self.response_headers = {}
+        self.ready_conditions = [] # the step's page readiness conditions, navigate_to_page returns once they hold
+        self.browser_profile = browser_profile
+        self.page_load_strategy = page_load_strategy
+        self.pages_since_restart = 0
+        self.consecutive_errors = 0
+        self.is_browser_hung = False # set by the watchdog when it killed the browser
+        self.driver = create_browser_driver(browser_profile, page_load_strategy)
 
-    def navigate_to_page(self, url) -> None:
+    def navigate_to_page(self, url, request_headers=None) -> None:
+        self.navigation_error = None
         try:
             self.url = url if url else self.url
             print(f"URL: {url}")
-            self.driver.get(self.url)
+            if page_archive_mode == "replay":
+                # Serve the page from the archive, without network access
+                self.archived_url, html = page_archive.load(self.url)
+                self.driver.get("about:blank")
+                self.driver.execute_script("document.open(); document.write(arguments[0]); document.close();", add_base_href(html, self.archived_url))
+                return
+            self.restart_browser_if_needed()
+            try:
+                self.load_page()
+            except PageNotReadyError:
+                raise # the browser is fine, the page rendered too late
+            except Exception as e:
+                if not self.record_driver_error(e):
+                    raise
+                self.load_page() # once more in the restarted browser
+            self.consecutive_errors = 0
+            if page_archive_mode == "capture":
+                page_archive.save(self.url, self.driver.current_url, self.driver.page_source)
         except Exception as e:
+            self.navigation_error = e
             logging.error(f"Failed to navigate to {url}: {e}", exc_info=True)
             print(f"Failed to navigate to {url}: {e}")
 
+    def load_page(self) -> None:
+        host_state = host_rate_limiter.acquire(self.url) # wait for the host's rate and concurrency limits
+        start_time = time.perf_counter()
+        backoff_reason = None
+        self.pages_since_restart += 1
+        watchdog = threading.Timer(browser_navigation_timeout + browser_watchdog_grace_seconds, self.kill_hung_browser)
+        watchdog.daemon = True
+        try:
+            if self.ready_conditions:
+                # The driver's "none" page load strategy doesn't wait for the load event, wait for the step's conditions only
+                self.driver.execute_script("window.isPreviousPage = true;")
+                watchdog.start()
+                self.driver.get(self.url)
+                watchdog.cancel()
+                self.wait_until_ready()
+            else:
+                watchdog.start()
+                self.driver.get(self.url)
+                watchdog.cancel()
+            backoff_reason = "anti_bot" if is_anti_bot_page(self.driver.title) else None
+        except TimeoutException:
+            backoff_reason = "timeout"
+            raise
+        except WebDriverException:
+            backoff_reason = "connection_error"
+            raise
+        finally:
+            watchdog.cancel()
+            host_rate_limiter.release(host_state, time.perf_counter() - start_time, backoff_reason)
+
+    def kill_hung_browser(self) -> None:
+        # Watchdog: the driver's page load timeout didn't end the navigation, the browser is hung. Killing it makes the navigation fail
+        self.is_browser_hung = True
+        logging.error(f"Navigation to {self.url} hung for {browser_navigation_timeout + browser_watchdog_grace_seconds} seconds, killing the browser")
+        print(f"Navigation to {self.url} hung for {browser_navigation_timeout + browser_watchdog_grace_seconds} seconds, killing the browser")
+        kill_processes(get_processes_start_times(get_process_tree_pids(self.get_driver_pid())))
+
+    def record_driver_error(self, e) -> bool:
+        # Returns True if the browser was restarted: it is dead (crashed, killed by the watchdog) or failed too many times in a row
+        self.consecutive_errors += 1
+        is_browser_dead = self.is_browser_hung or any(message in str(e).lower() for message in browser_fatal_error_messages)
+        if is_browser_dead or self.consecutive_errors >= browser_restart_errors:
+            self.restart_browser("crashed" if is_browser_dead else "errors")
+            return True
+        return False
+
+    def get_driver_pid(self):
+        try:
+            return self.driver.service.process.pid
+        except AttributeError:
+            return None # remote driver, no local process
+
+    def get_browser_rss(self) -> int:
+        return get_processes_rss(get_process_tree_pids(self.get_driver_pid()))
+
+    def restart_browser_if_needed(self) -> None:
+        if self.is_browser_hung:
+            self.restart_browser("crashed") # killed by the watchdog during the last navigation
+        elif self.pages_since_restart >= browser_restart_pages:
+            self.restart_browser("pages")
+        elif self.pages_since_restart and self.pages_since_restart % browser_rss_check_pages == 0:
+            browser_rss = self.get_browser_rss()
+            metrics_registry.set_global("scrap_browser_rss_bytes", browser_rss, browser=self.browser_profile)
+            if browser_rss >= browser_restart_rss_bytes:
+                self.restart_browser("rss")
+
+    def restart_browser(self, reason) -> None:
+        # A new browser with the same profile, the cookies of the old one and the same url (navigated to by the caller)
+        logging.info(f"Restarting the browser after {self.pages_since_restart} pages ({reason}), url: {self.url}")
+        print(f"Restarting the browser after {self.pages_since_restart} pages ({reason})")
+        metrics_registry.inc("scrap_browser_restarts_total", reason=reason)
+        cookies = []
+        if not self.is_browser_hung:
+            try:
+                cookies = self.driver.get_cookies()
+            except Exception:
+                pass # crashed browser
+        self.quit_driver()
+        self.driver = create_browser_driver(self.browser_profile, self.page_load_strategy)
+        if cookies:
+            try:
+                self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": [
+                    {**{key: value for key, value in cookie.items() if key != "expiry"}, **({"expires": cookie["expiry"]} if "expiry" in cookie else {})} for cookie in cookies
+                ]})
+            except Exception as e:
+                logging.error(f"Failed to restore the cookies of the browser: {e}", exc_info=True)
+        self.pages_since_restart = 0
+        self.consecutive_errors = 0
+        self.is_browser_hung = False
+
+    def quit_driver(self) -> None:
+        # Quit the browser, then kill its processes still alive (a hung browser never quits)
+        # The processes are collected before quit() (the browser's processes are orphaned once the driver exits), each one is killed only if it is still the same process
+        processes_start_times = get_processes_start_times(get_process_tree_pids(self.get_driver_pid()))
+        quit_thread = threading.Thread(target=self.quit_driver_quietly, daemon=True)
+        quit_thread.start()
+        quit_thread.join(browser_quit_timeout)
+        kill_processes(processes_start_times)
+
+    def quit_driver_quietly(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.error(f"Failed to quit the browser: {e}")
+
+    def wait_until_ready(self) -> None:
+        # Wait for the new page (the previous page's window is replaced), then for every readiness condition with its own timeout
+        with tracer.span("wait", ready_conditions=self.ready_conditions):
+            self.wait_until_ready_conditions()
+
+    def wait_until_ready_conditions(self) -> None:
+        WebDriverWait(self.driver, http_timeout, ready_condition_poll_seconds, ignored_exceptions=[WebDriverException]).until(lambda driver: driver.execute_script("return !window.isPreviousPage;"))
+        for ready_condition in self.ready_conditions:
+            kind = next(kind for kind in ready_condition_scripts if kind in ready_condition)
+            try:
+                WebDriverWait(self.driver, ready_condition.get("timeout", ready_condition_timeout), ready_condition_poll_seconds, ignored_exceptions=[WebDriverException]).until(
+                    lambda driver: driver.execute_script(ready_condition_scripts[kind], ready_condition[kind])
+                )
+            except TimeoutException:
+                if not ready_condition.get("optional"):
+                    raise PageNotReadyError(f"Page not ready: {kind} {ready_condition[kind]} timed out on {self.url}")
+                logging.error(f"Page not ready: {kind} {ready_condition[kind]} (optional) timed out on {self.url}")
+                print(f"Page not ready: {kind} {ready_condition[kind]} (optional) timed out on {self.url}")
+
     def get_current_link(self) -> str:
-        return self.driver.current_url
+        return self.archived_url if page_archive_mode == "replay" else self.driver.current_url
+
+    def get_page_hash(self) -> str:
+        return hashlib.sha256(self.driver.page_source.encode("utf-8")).hexdigest()
     
     def extract_element(self, css_selector) -> WebElement:
         try:
@@ -124,36 +961,46 @@ class WebScraper:
                 texts.append(element.text)
         return texts
     
+    def extract_regexs(self, css_selector, regexs) -> list:
+        # Fetch the text of the elements once (regexs are passed as arguments, not interpolated into the js), then scan it once for all the regexs
+        text = self.driver.execute_script(extract_matching_texts_script, css_selector, list(regexs))
+        return find_regexs_first_data(text, regexs)
+
     def extract_regex(self, css_selector, regex) -> str:
-        script_tag = self.driver.execute_script(
-            f'return [...document.querySelectorAll("{css_selector}")].find(element => /{regex}/.test(element.textContent));'
-        )
-        if script_tag:
-            data = re.findall(regex, script_tag.get_attribute('outerHTML')) 
-        else:
-            print(f"{regex} not found in any script tags")
-            return False
-        return data[0] # return the first matched data that fulfill the regex pattern
+        return self.extract_regexs(css_selector, [regex])[0] # return the first matched data that fulfill the regex pattern
     
     def extract_regex_from_script_tag(self, regex) -> str:
         return self.extract_regex("script", regex) # strictly from "script" tag only
 
+    def extract_regexs_from_script_tag(self, regexs) -> list:
+        return self.extract_regexs("script", regexs) # strictly from "script" tag only
+
     def extract_any_regexs_from_script_tag(self, regexs) -> str:
-        for regex in regexs:
-            data = self.extract_regex_from_script_tag(regex)
-            if data:
-                break
-        return data
+        return next((data for data in self.extract_regexs_from_script_tag(regexs) if data), False)
+
+    def extract_page_url(self, _=None) -> str:
+        # Url of the page the other actions' data comes from (e.g. a vendor's profile link)
+        return self.get_current_link()
+
+    def extract_batch(self, action_names, params) -> list:
+        # Run all the extract actions of a page in one execute_script call, instead of one WebDriver round-trip per element
+        specs = [batch_action_specs[action_name](param) for action_name, param in zip(action_names, params)]
+        regexs = [regex for kind, _, regex in specs if kind == "regex"]
+        results, scripts_text = self.driver.execute_script(extract_batch_script, specs, regexs)
+        regexs_data = iter(find_regexs_first_data(scripts_text, regexs))
+        return [next(regexs_data) if kind == "regex" else self.get_current_link() if kind == "url" else result for (kind, _, _), result in zip(specs, results)]
         
     def safe_click(self, css_selector) -> None:
         element = self.extract_element(css_selector)
         try:
+            if page_archive_mode == "replay":
+                self.navigate_to_page(urljoin(self.archived_url, element.get_attribute("href"))) # follow the link through the archive
+                return
             element.click()
         except Exception as e:
             print(f"Error clicking element: {e}")
 
     def click_next_page_btn(self, btn_css_selector) -> None:
-        self.navigate_to_page(self.url)
         self.safe_click(btn_css_selector)
         self.url = self.get_current_link()
 
@@ -190,7 +1037,315 @@ class WebScraper:
         self.driver.switch_to.window(window_handles[-1])
 
     def close_browser(self) -> None:
-        self.driver.quit()    
+        self.quit_driver()
+
+class HttpScraper:
+    # Browserless engine: fetches the pages over a pooled keep-alive http client and runs the css selectors on the parsed html,
+    # it supports the extract actions used by the steps configs, not the actions that need a real browser (forms, alerts, windows)
+    def __init__(self, url, concurrency=http_concurrency) -> None:
+        self.url = url
+        self.concurrency = concurrency
+        self.http = urllib3.PoolManager(
+            maxsize=concurrency,
+            headers=http_headers,
+            timeout=urllib3.Timeout(total=http_timeout),
+            retries=urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 504], respect_retry_after_header=False) # 429 and 503 are retried by fetch_page after the host's pause
+        )
+        self.page = BeautifulSoup("", html_parser_name)
+        self.page_hash = None
+        self.navigation_error = None
+        self.is_page_not_modified = False # the server answered 304 to a conditional request
+        self.response_headers = {}
+        self.prefetched_pages = {} # {url: (final_url, html, response_headers)} pages fetched in advance by prefetch_pages
+        self.ready_conditions = [] # not waited for: the html is complete once fetched, nothing renders later
+
+    def fetch_page(self, url, request_headers=None) -> tuple:
+        # Returns (final url after redirects, html or None if not modified since the conditional request_headers, response headers)
+        if page_archive_mode == "replay":
+            return page_archive.load(url) + ({},)
+        for attempt in range(http_throttle_retries + 1):
+            host_state = host_rate_limiter.acquire(url) # wait for the host's rate and concurrency limits
+            start_time = time.perf_counter()
+            backoff_reason, retry_after_seconds = None, None
+            try:
+                response = self.http.request("GET", url, headers={**http_headers, **request_headers} if request_headers else None)
+                html = response.data.decode("utf-8", errors="replace") if response.status != 304 else None
+                backoff_reason = get_response_backoff_reason(response.status, html)
+                retry_after_seconds = parse_retry_after(response.headers.get("Retry-After"))
+            except Exception as e:
+                backoff_reason = "timeout" if is_timeout_error(e) else "connection_error"
+                raise
+            finally:
+                host_rate_limiter.release(host_state, time.perf_counter() - start_time, backoff_reason, retry_after_seconds)
+            if not backoff_reason:
+                break
+        if backoff_reason:
+            raise urllib3.exceptions.HTTPError(f"Throttled ({backoff_reason}) by the host of {url}")
+        if response.status == 304:
+            return (url, None, dict(response.headers))
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(f"HTTP {response.status} for {url}")
+        redirects = response.retries.history if response.retries else ()
+        final_url = urljoin(url, redirects[-1].redirect_location) if redirects and redirects[-1].redirect_location else url
+        if page_archive_mode == "capture":
+            page_archive.save(url, final_url, html)
+        return (final_url, html, dict(response.headers))
+
+    def prefetch_pages(self, urls, request_headers_by_url=None) -> None:
+        urls = [url for url in urls if isinstance(url, str) and url not in self.prefetched_pages]
+        if urls:
+            asyncio.run(self.prefetch_pages_async(urls, request_headers_by_url or {}))
+
+    async def prefetch_pages_async(self, urls, request_headers_by_url) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency) # bound the no. of requests in flight
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            async def prefetch_page(url):
+                async with semaphore:
+                    try:
+                        self.prefetched_pages[url] = await loop.run_in_executor(executor, self.fetch_page, url, request_headers_by_url.get(url))
+                    except Exception as e:
+                        # navigate_to_page fetches the page again and logs the error
+                        print(f"Failed to prefetch {url}: {e}")
+            await asyncio.gather(*[prefetch_page(url) for url in urls])
+
+    def navigate_to_page(self, url, request_headers=None) -> None:
+        self.navigation_error = None
+        try:
+            self.url = url if url else self.url
+            print(f"URL: {url}")
+            prefetched_page = self.prefetched_pages.pop(self.url, None)
+            self.url, html, self.response_headers = prefetched_page if prefetched_page else self.fetch_page(self.url, request_headers)
+            self.is_page_not_modified = html is None
+            self.page_hash = hashlib.sha256(html.encode("utf-8")).hexdigest() if html is not None else None
+            self.page = BeautifulSoup(html or "", html_parser_name)
+        except Exception as e:
+            self.page = BeautifulSoup("", html_parser_name) # never extract data from the previous page
+            self.page_hash = None
+            self.is_page_not_modified = False
+            self.navigation_error = e
+            logging.error(f"Failed to navigate to {url}: {e}", exc_info=True)
+            print(f"Failed to navigate to {url}: {e}")
+
+    def get_current_link(self) -> str:
+        return self.url
+
+    def get_page_hash(self) -> str:
+        return self.page_hash
+
+    def extract_element(self, css_selector):
+        element = self.page.select_one(css_selector)
+        if element is None:
+            print(f"Failed to extract element [{css_selector}]: no such element")
+        return element
+
+    def extract_elements(self, css_selectors) -> list:
+        elements = []
+        for css_selector in css_selectors:
+            elements.append(self.extract_element(css_selector))
+        return elements
+
+    def get_element_attr(self, element, attr) -> str:
+        value = element.get(attr)
+        if isinstance(value, list): # multi-valued attributes, e.g. class
+            value = " ".join(value)
+        if value is not None and attr in ["href", "src"]:
+            value = urljoin(self.url, value) # absolute url, same as the browser's element.get_attribute
+        return value
+
+    def extract_element_attr(self, css_selector, attr) -> str:
+        return self.get_element_attr(self.extract_element(css_selector), attr)
+
+    def extract_elements_attrs(self, css_selectors, attr) -> list:
+        attrs = []
+        for css_selector in css_selectors:
+            for element in self.page.select(css_selector):
+                attrs.append(self.get_element_attr(element, attr))
+        return attrs
+
+    def extract_element_link(self, css_selector) -> str:
+        return self.extract_element_attr(css_selector, "href")
+
+    def extract_elements_links(self, css_selectors) -> list:
+        return self.extract_elements_attrs(css_selectors, "href")
+
+    def get_element_text(self, element) -> str:
+        return " ".join(element.get_text(" ").split()) # collapse whitespaces, same as the browser's rendered element.text
+
+    def extract_element_text(self, css_selector) -> str:
+        return self.get_element_text(self.extract_element(css_selector))
+
+    def extract_elements_texts(self, css_selectors) -> list:
+        texts = []
+        for css_selector in css_selectors:
+            for element in self.page.select(css_selector):
+                texts.append(self.get_element_text(element))
+        return texts
+
+    def extract_regexs(self, css_selector, regexs) -> list:
+        text = "\n".join(element.get_text() for element in self.page.select(css_selector))
+        return find_regexs_first_data(text, regexs)
+
+    def extract_regex(self, css_selector, regex) -> str:
+        return self.extract_regexs(css_selector, [regex])[0] # return the first matched data that fulfill the regex pattern
+
+    def extract_regex_from_script_tag(self, regex) -> str:
+        return self.extract_regex("script", regex) # strictly from "script" tag only
+
+    def extract_regexs_from_script_tag(self, regexs) -> list:
+        return self.extract_regexs("script", regexs) # strictly from "script" tag only
+
+    def extract_any_regexs_from_script_tag(self, regexs) -> str:
+        return next((data for data in self.extract_regexs_from_script_tag(regexs) if data), False)
+
+    def extract_page_url(self, _=None) -> str:
+        return self.get_current_link()
+
+    def extract_batch(self, action_names, params) -> list:
+        # The page is already parsed locally, only the regexs are grouped to scan the script tags once
+        specs = [batch_action_specs[action_name](param) for action_name, param in zip(action_names, params)]
+        regexs = [regex for kind, _, regex in specs if kind == "regex"]
+        regexs_data = iter(self.extract_regexs_from_script_tag(regexs) if regexs else [])
+        return [next(regexs_data) if kind == "regex" else getattr(self, action_name)(param) for (kind, _, _), action_name, param in zip(specs, action_names, params)]
+
+    def safe_click(self, css_selector) -> None:
+        # "Clicking" a link = following its href
+        element = self.extract_element(css_selector)
+        try:
+            self.navigate_to_page(self.get_element_attr(element, "href"))
+        except Exception as e:
+            print(f"Error clicking element: {e}")
+
+    def click_next_page_btn(self, btn_css_selector) -> None:
+        self.safe_click(btn_css_selector)
+
+    def close_browser(self) -> None:
+        self.http.clear()
+
+class HostRateState:
+    # Token bucket (rate: tokens per second, None: unlimited) and adaptive concurrency limit of a host
+    def __init__(self, host, rate=None) -> None:
+        self.host = host
+        self.rate = rate
+        self.tokens = 1.0 # bucket of 1 token: requests spaced by 1 / rate, no burst
+        self.last_refill_time = time.monotonic()
+        self.limit = float(http_initial_concurrency_per_host)
+        self.in_flight = 0
+        self.paused_until = 0 # monotonic time until which the host asked not to be requested (Retry-After, backoff)
+        self.consecutive_backoffs = 0
+        self.latency_ewma = None
+        self.baseline_latency = None # latency_ewma of the host when it isn't overloaded: drops to a lower one at once, rises slowly
+        self.latency_samples = 0
+        self.last_decrease_time = 0
+
+    def refill(self, now) -> None:
+        self.tokens = min(1.0, self.tokens + (now - self.last_refill_time) * self.rate) if self.rate else 1.0
+        self.last_refill_time = now
+
+    def get_wait_seconds(self, now) -> float:
+        # Seconds before a request to the host may start (0: now), ignoring the concurrency limit
+        self.refill(now)
+        token_wait_seconds = (1 - self.tokens) / self.rate if self.rate and self.tokens < 1 else 0
+        return max(self.paused_until - now, token_wait_seconds, 0)
+
+class HostRateLimiter:
+    # Scheduler of the requests of all the scrapers, per host: a request waits for a token of the host's bucket (robots.txt
+    # crawl-delay / request-rate, --max-rate) and for a slot under the host's concurrency limit. The limit is adapted (AIMD):
+    # +1 every limit responses answered fast, halved (at most once per round trip) on 429/503, timeouts, connection errors,
+    # anti-bot pages and when the responses get much slower than the host's baseline. 429/503/anti-bot pages also pause the host
+    # for their Retry-After (else an exponential backoff)
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.robots_lock = threading.Lock()
+        self.robots_host_locks = {} # {host: lock}, a host's robots.txt is read once, without blocking the other hosts
+        self.hosts = {}
+        self.http = urllib3.PoolManager(headers=http_headers, timeout=urllib3.Timeout(total=10), retries=False)
+
+    def read_crawl_delay(self, robots_url):
+        # Seconds between 2 requests asked by the host's robots.txt (Crawl-delay, or Request-rate), None if it asks none
+        try:
+            response = self.http.request("GET", robots_url)
+            if response.status != 200:
+                return None
+            robot_file_parser = urllib.robotparser.RobotFileParser(robots_url)
+            robot_file_parser.parse(response.data.decode("utf-8", errors="replace").splitlines())
+            robot_file_parser.modified() # crawl_delay answers only once the file is marked read
+            crawl_delay = robot_file_parser.crawl_delay(http_headers["User-Agent"])
+            request_rate = robot_file_parser.request_rate(http_headers["User-Agent"])
+            if request_rate and request_rate.requests:
+                crawl_delay = max(float(crawl_delay or 0), request_rate.seconds / request_rate.requests)
+            return float(crawl_delay) if crawl_delay else None
+        except Exception as e:
+            logging.error(f"Read {robots_url} failed: {e}", exc_info=True)
+            print(f"Read {robots_url} failed: {e}")
+            return None
+
+    def get_host_state(self, url) -> HostRateState:
+        host = get_host(url)
+        if host in self.hosts:
+            return self.hosts[host]
+        with self.robots_lock:
+            host_lock = self.robots_host_locks.setdefault(host, threading.Lock())
+        with host_lock:
+            if host not in self.hosts:
+                crawl_delay = self.read_crawl_delay(f"{urlsplit(url).scheme}://{host}/robots.txt")
+                rates = [rate for rate in [1 / crawl_delay if crawl_delay else None, http_max_requests_per_second] if rate]
+                self.hosts[host] = HostRateState(host, min(rates) if rates else None)
+                logging.info(f"[rate] {host}: crawl-delay {crawl_delay}, {self.hosts[host].rate or 'unlimited'} requests/s, concurrency limit {self.hosts[host].limit:.0f}")
+                metrics_registry.set_global("scrap_host_concurrency_limit", self.hosts[host].limit, host=host)
+            return self.hosts[host]
+
+    def acquire(self, url) -> HostRateState:
+        # Blocks until a request to the url's host may start, release it with the outcome of the request
+        host_state = self.get_host_state(url)
+        with self.condition:
+            while True:
+                wait_seconds = host_state.get_wait_seconds(time.monotonic())
+                if wait_seconds <= 0 and host_state.in_flight < int(host_state.limit):
+                    host_state.tokens -= 1
+                    host_state.in_flight += 1
+                    return host_state
+                self.condition.wait(wait_seconds if wait_seconds > 0 else None)
+
+    def release(self, host_state, latency_seconds, backoff_reason=None, retry_after_seconds=None) -> None:
+        with self.condition:
+            host_state.in_flight -= 1
+            now = time.monotonic()
+            if not backoff_reason:
+                host_state.latency_ewma = latency_seconds if host_state.latency_ewma is None else 0.9 * host_state.latency_ewma + 0.1 * latency_seconds
+                host_state.latency_samples += 1
+                if host_state.latency_samples >= 10:
+                    if host_state.baseline_latency is None or host_state.latency_ewma < host_state.baseline_latency:
+                        host_state.baseline_latency = host_state.latency_ewma
+                    else:
+                        # Drifts up, else a host that got lastingly slower would be seen overloaded (limit halved) for the rest of the run
+                        host_state.baseline_latency += http_latency_baseline_drift * (host_state.latency_ewma - host_state.baseline_latency)
+                if host_state.baseline_latency and host_state.latency_ewma > host_state.baseline_latency * http_latency_backoff_factor:
+                    backoff_reason = "latency"
+            if backoff_reason:
+                metrics_registry.inc_global("scrap_host_backoffs_total", host=host_state.host, reason=backoff_reason)
+                if now - host_state.last_decrease_time >= max(1.0, 2 * (host_state.latency_ewma or 0)):
+                    # Multiplicative decrease, once per round trip: the requests in flight when the host pushed back say the same
+                    self.set_limit(host_state, max(1.0, host_state.limit / 2), backoff_reason)
+                    host_state.last_decrease_time = now
+                if backoff_reason in ["429", "503", "anti_bot"]:
+                    pause_seconds = retry_after_seconds if retry_after_seconds is not None else http_backoff_seconds * 2 ** host_state.consecutive_backoffs
+                    host_state.paused_until = max(host_state.paused_until, now + min(pause_seconds, http_retry_after_max_seconds))
+                    host_state.consecutive_backoffs += 1
+                    logging.info(f"[rate] {host_state.host}: paused {min(pause_seconds, http_retry_after_max_seconds):.1f} seconds ({backoff_reason})")
+            else:
+                # Additive increase: +1 once limit requests in a row were answered fast
+                host_state.consecutive_backoffs = 0
+                self.set_limit(host_state, min(float(http_max_concurrency_per_host), host_state.limit + 1 / host_state.limit))
+            self.condition.notify_all()
+
+    def set_limit(self, host_state, limit, backoff_reason=None) -> None:
+        previous_limit, host_state.limit = host_state.limit, limit
+        if int(limit) != int(previous_limit):
+            metrics_registry.set_global("scrap_host_concurrency_limit", int(limit), host=host_state.host)
+            logging.info(f"[rate] {host_state.host}: concurrency limit {int(previous_limit)} -> {int(limit)}" + (f" (backoff: {backoff_reason})" if backoff_reason else ""))
+            if backoff_reason:
+                print(f"[rate] {host_state.host}: concurrency limit {int(previous_limit)} -> {int(limit)} (backoff: {backoff_reason})")
 
 class CSVFileManager:
 
@@ -198,10 +1353,9 @@ class CSVFileManager:
         pass
 
     def read(self, filename, cols_name, format="list"):
-        filename = csv_filename_checker(filename)
         if format in ["dict", "list", "series", "split", "tight", "records", "index"]:
             try:
-                df = pd.read_csv(filename, usecols=cols_name)
+                df = self.read_dataframe(filename, cols_name)
             except Exception as e:
                 print(f"Read csv file exception: {e}")
                 return False
@@ -211,6 +1365,40 @@ class CSVFileManager:
         else:
             return False
 
+    def find_output_format(self, filename, output_format=None):
+        # The format a step's output was written in: output_format (the writing step's config) if known, else the only format it exists in
+        if output_format:
+            return output_format
+        existing_output_formats = [output_format for output_format in output_formats_extensions if os.path.exists(output_filename_checker(filename, output_format))]
+        if len(existing_output_formats) > 1:
+            raise ValueError(f'{filename} exists in several output formats {existing_output_formats}, specify its output format')
+        return existing_output_formats[0] if existing_output_formats else "csv"
+
+    def read_dataframe(self, filename, cols_name=None, dtype=None, output_format=None):
+        # Read a step's output in whatever format it was written, only the columns cols_name
+        output_format = output_format if output_format else self.find_output_format(filename)
+        output_filename = output_filename_checker(filename, output_format)
+        if output_format == "csv":
+            return pd.read_csv(output_filename, usecols=cols_name, dtype=dtype)
+        if output_format == "sqlite":
+            with sqlite3.connect(output_filename) as connection:
+                columns = ", ".join(f'"{col_name}"' for col_name in cols_name) if cols_name else "*"
+                return pd.read_sql_query(f"SELECT {columns} FROM rows ORDER BY rowid", connection, dtype=dtype)
+        check_pyarrow(output_format)
+        part_filenames = sorted(glob.glob(os.path.join(glob.escape(output_filename), "*" + output_formats_extensions[output_format])))
+        if output_format == "parquet":
+            tables = [pq.read_table(part_filename, columns=cols_name) for part_filename in part_filenames]
+        else:
+            tables = []
+            for part_filename in part_filenames:
+                with pa.memory_map(part_filename) as source:
+                    table = pa.ipc.open_file(source).read_all()
+                    tables.append(table.select(cols_name) if cols_name else table)
+        if not tables:
+            raise FileNotFoundError(f"No such file or directory: '{output_filename}'")
+        df = pa.concat_tables(tables).to_pandas()
+        return df.astype(dtype) if dtype else df
+
     def write(self, data, headers, filename):
         df = pd.DataFrame(data)
         filename = csv_filename_checker(filename)
@@ -244,193 +1432,2851 @@ class CSVFileManager:
     def is_file_exist(self, filename):
         return pd.io.common.file_exists(csv_filename_checker(filename))
 
-    def remove_null_and_duplicates_from_csv(self, filename):
+    def iter_rows(self, filename, output_format=None, batch_rows=10000):
+        # Stream the rows (tuples of strings) of a step's output without loading it whole
+        output_format = output_format if output_format else self.find_output_format(filename)
+        output_filename = output_filename_checker(filename, output_format)
+        if not os.path.exists(output_filename):
+            return
+        if output_format == "csv":
+            with open(output_filename, "r", encoding="utf-8", newline="") as file:
+                reader = csv.reader(file)
+                next(reader, None) # skip the header row
+                for row in reader:
+                    yield tuple(row)
+            return
+        if output_format == "sqlite":
+            with sqlite3.connect(output_filename) as connection:
+                for row in connection.execute("SELECT * FROM rows ORDER BY rowid"):
+                    yield tuple("" if value is None else value for value in row)
+            return
+        check_pyarrow(output_format)
+        for part_filename in sorted(glob.glob(os.path.join(glob.escape(output_filename), "*" + output_formats_extensions[output_format]))):
+            if output_format == "parquet":
+                batches = pq.ParquetFile(part_filename).iter_batches(batch_size=batch_rows)
+            else:
+                source = pa.memory_map(part_filename)
+                reader = pa.ipc.open_file(source)
+                batches = (reader.get_batch(batch_index) for batch_index in range(reader.num_record_batches))
+            for batch in batches:
+                for row in zip(*[column.to_pylist() for column in batch.columns]):
+                    yield tuple("" if value is None else value for value in row)
+
+    def get_end_position(self, filename, output_format=None):
+        # Position of the end of a step's output: bytes (csv), last rowid (sqlite) or no. of rows (parquet, arrow)
+        output_format = output_format if output_format else self.find_output_format(filename)
+        output_filename = output_filename_checker(filename, output_format)
+        if output_format == "csv":
+            return os.path.getsize(output_filename)
+        if output_format == "sqlite":
+            with sqlite3.connect(output_filename) as connection:
+                return connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM rows").fetchone()[0]
+        check_pyarrow(output_format)
+        part_filenames = sorted(glob.glob(os.path.join(glob.escape(output_filename), "*" + output_formats_extensions[output_format])))
+        if output_format == "parquet":
+            return sum(pq.ParquetFile(part_filename).metadata.num_rows for part_filename in part_filenames)
+        rows_count = 0
+        for part_filename in part_filenames:
+            with pa.memory_map(part_filename) as source:
+                reader = pa.ipc.open_file(source)
+                rows_count += sum(reader.get_batch(batch_index).num_rows for batch_index in range(reader.num_record_batches))
+        return rows_count
+
+    def iter_dataframes(self, filename, cols_name, chunk_rows, output_format=None, start_position=0, end_position=None):
+        # Stream a step's output as DataFrames of up to chunk_rows rows (strings), only the columns cols_name,
+        # from start_position to end_position (see get_end_position): the rows appended since a previous read
+        output_format = output_format if output_format else self.find_output_format(filename)
+        output_filename = output_filename_checker(filename, output_format)
+        end_position = end_position if end_position is not None else self.get_end_position(filename, output_format)
+        if output_format == "csv":
+            with open(output_filename, "rb") as file:
+                header = next(csv.reader([file.readline().decode("utf-8")]))
+                file.seek(max(start_position, file.tell()))
+                if file.tell() >= end_position:
+                    return
+                # Bytes up to end_position only: the rows appended meanwhile are for the next read
+                yield from pd.read_csv(FileRange(file, end_position), header=None, names=header, usecols=cols_name, dtype=str, chunksize=chunk_rows)
+            return
+        if output_format == "sqlite":
+            with sqlite3.connect(output_filename) as connection:
+                columns = ", ".join(f'"{col_name}"' for col_name in cols_name)
+                yield from pd.read_sql_query(f"SELECT {columns} FROM rows WHERE rowid > ? AND rowid <= ? ORDER BY rowid", connection, params=(start_position, end_position), chunksize=chunk_rows)
+            return
+        check_pyarrow(output_format)
+        row_index = 0
+        for part_filename in sorted(glob.glob(os.path.join(glob.escape(output_filename), "*" + output_formats_extensions[output_format]))):
+            if output_format == "parquet":
+                batches = pq.ParquetFile(part_filename).iter_batches(batch_size=chunk_rows, columns=cols_name)
+            else:
+                reader = pa.ipc.open_file(pa.memory_map(part_filename))
+                batches = (reader.get_batch(batch_index).select(cols_name) for batch_index in range(reader.num_record_batches))
+            for batch in batches:
+                batch_start, row_index = row_index, row_index + batch.num_rows
+                if row_index <= start_position or batch_start >= end_position:
+                    continue # rows read by a previous run, or appended after end_position
+                yield batch.slice(max(0, start_position - batch_start), min(end_position, row_index) - max(start_position, batch_start)).to_pandas()
+
+    def replace_output(self, temp_filename, filename, output_format="csv"):
+        # Rename the temporary output over the step's output (a directory output is swapped with 2 renames)
+        temp_filename = output_filename_checker(temp_filename, output_format)
+        filename = output_filename_checker(filename, output_format)
+        if os.path.isdir(temp_filename) and os.path.exists(filename):
+            old_filename = f"{filename}.old{os.getpid()}"
+            os.replace(filename, old_filename)
+            os.replace(temp_filename, filename)
+            shutil.rmtree(old_filename, ignore_errors=True)
+        else:
+            os.replace(temp_filename, filename)
+
+    def remove_null_and_duplicates(self, filename, header, output_format="csv", memory_rows=None):
+        # External sort dedup of an existing output with a fixed memory budget (memory_rows rows hashes at a time), keeps
+        # the first occurrence of every row in the original order:
+        # 1. sorted runs of (row hash, row index)  2. merged runs -> index of the first occurrence of every hash, in sorted runs
+        # 3. merged index runs -> rows copied in order into a temporary output, renamed over the output
+        memory_rows = memory_rows if memory_rows else dedup_external_sort_rows
+        output_dirname = os.path.dirname(os.path.abspath(output_filename_checker(filename, output_format)))
+        with tempfile.TemporaryDirectory(dir=output_dirname) as temp_dirname:
+            hash_run_filenames, hash_run = [], []
+            for row_index, row in enumerate(self.iter_rows(filename, output_format)):
+                if not any(row):
+                    continue # empty row
+                hash_run.append((hash_row(row).hex(), row_index))
+                if len(hash_run) >= memory_rows:
+                    hash_run_filenames.append(write_sorted_run(hash_run, temp_dirname))
+                    hash_run = []
+            hash_run_filenames.append(write_sorted_run(hash_run, temp_dirname))
+
+            index_run_filenames, index_run, last_row_hash = [], [], None
+            for row_hash, row_index in heapq.merge(*[read_sorted_run(run_filename) for run_filename in hash_run_filenames]):
+                if row_hash == last_row_hash:
+                    continue # duplicate, the first occurrence has the lowest index so it came first
+                last_row_hash = row_hash
+                index_run.append(row_index)
+                if len(index_run) >= memory_rows:
+                    index_run_filenames.append(write_sorted_run(index_run, temp_dirname))
+                    index_run = []
+            index_run_filenames.append(write_sorted_run(index_run, temp_dirname))
+
+            temp_filename = temp_output_filename(filename)
+            step_writer = StepWriter(temp_filename, header, output_format, truncate=True)
+            kept_row_indexes = heapq.merge(*[read_sorted_run(run_filename) for run_filename in index_run_filenames])
+            kept_row_index = next(kept_row_indexes, None)
+            for row_index, row in enumerate(self.iter_rows(filename, output_format)):
+                if row_index == kept_row_index:
+                    step_writer.write_rows([row])
+                    kept_row_index = next(kept_row_indexes, None)
+            step_writer.close()
+        self.replace_output(temp_filename, filename, output_format)
+
+    def merge_files(self, filenames, filename):
+        # Concat the csv files (without their header rows) into one file, file by file so rows never interleave
         filename = csv_filename_checker(filename)
-        # Read the CSV file into a pandas DataFrame
-        df = pd.read_csv(filename, dtype=str)        
-        # Remove rows with empty strings in any column
-        df_cleaned = df.dropna(subset=df.columns, how='all', inplace=False)
-        # Remove duplicate rows based on all columns
-        df_cleaned_no_duplicates = df_cleaned.drop_duplicates(subset=df.columns, keep='first')
-        # Save the cleaned DataFrame to a new CSV file
-        df_cleaned_no_duplicates.to_csv(filename, index=False)
-        
-    
-class SavePointManager:
-    def __init__(self)-> None:
-        self.is_save_point_exist = False
-        self.save_point_data = self.read(save_point_filename)
-
-    def write(self, save_point_record)-> None:
-        print(f"save_point_record: {save_point_record}")
-        print(f"save_point_header: {save_point_header}")
-        print(f"save_point_filename: {save_point_filename}")
-        csv_file_manager.write(save_point_record, save_point_header, save_point_filename)
-    
-    def read(self, save_point_filename=save_point_filename)-> None:
-        save_point_filename = csv_filename_checker(save_point_filename)
-        save_point_data_default = reformat_data_list_to_records(save_point_header,[0,None,None])
-        save_point_data_from_file = csv_file_manager.read(save_point_filename, save_point_header, "records")
-        self.save_point_data = save_point_data_from_file[0] if save_point_data_from_file else save_point_data_default
-        # print(f"save_point_data: {self.save_point_data}")
-        if save_point_data_from_file:
-            self.is_save_point_exist = True
-            os.remove(save_point_filename)
-        # print(f"init is_save_point_exist: {self.is_save_point_exist}")
-        return self.save_point_data
-
-    def check_save_point_exist(self):
-        return self.is_save_point_exist
-    
-    def get_link_index(self):
-        return self.save_point_data["link_index"]
-    
-    def get_url(self):
-        return self.save_point_data["url"]
-    
-    def get_desc(self):
-        return self.save_point_data["desc"]
-    
-    def clear(self):
-        save_point_data_default = reformat_data_list_to_records(save_point_header,[0,None,None])
-        self.save_point_data = save_point_data_default
+        try:
+            with open(filename, "a", encoding="utf-8", newline="") as merged_file:
+                for part_filename in filenames:
+                    part_filename = csv_filename_checker(part_filename)
+                    if not self.is_file_exist(part_filename):
+                        continue
+                    with open(part_filename, "r", encoding="utf-8", newline="") as part_file:
+                        next(part_file, None) # skip the header row
+                        for line in part_file:
+                            merged_file.write(line)
+        except Exception as e:
+            logging.error(f"Merge {filenames} into {filename} failed: {e}", exc_info=True)
+            print(f"Merge {filenames} into {filename} failed: {e}")
 
-class Timer:
-    def __init__(self)-> None:
-        self.start_time = time.time()
-        self.stop_time = self.start_time
+    def merge_outputs(self, filenames, filename, header, output_format="csv", dedup="memory"):
+        # Write the workers' outputs into the step's output, output by output so rows never interleave,
+        # the rows duplicated across workers are dropped on the way (the output is replaced atomically)
+        temp_filename = temp_output_filename(filename)
+        if output_format == "csv" and dedup in ["external", "none"]:
+            StepWriter(temp_filename, header, output_format, truncate=True).close()
+            self.merge_files(filenames, temp_filename)
+        else:
+            step_writer = StepWriter(temp_filename, header, output_format, truncate=True, dedup=dedup)
+            for part_filename in filenames:
+                step_writer.write_rows(self.iter_rows(part_filename, output_format))
+            step_writer.close()
+        self.replace_output(temp_filename, filename, output_format)
 
-    def start(self)-> None:
-        self.start_time = time.time()
+    def remove_files(self, filenames):
+        for filename in filenames:
+            filename = filename if os.path.splitext(filename)[1] in output_formats_extensions.values() else csv_filename_checker(filename)
+            if os.path.isdir(filename):
+                shutil.rmtree(filename)
+            elif self.is_file_exist(filename):
+                os.remove(filename)
 
-    def stop(self)-> None:
-        self.stop_time = time.time()
+class FileRange:
+    # Read-only view of a binary file from its current position up to end_position
+    def __init__(self, file, end_position) -> None:
+        self.file = file
+        self.end_position = end_position
 
-    def get_execution_time(self):
-        return self.stop_time-self.start_time
-# END: Classes
+    def read(self, size=-1):
+        remaining_size = max(0, self.end_position - self.file.tell())
+        return self.file.read(remaining_size if size is None or size < 0 else min(size, remaining_size))
 
+    def __iter__(self):
+        return iter(self.readline, b"")
 
-# Classes Configurations
-web_scraper = WebScraper(default_link)
-csv_file_manager = CSVFileManager()
-save_point_manager = SavePointManager()
-# END: Classes Configurations
+    def readline(self):
+        return self.file.readline(max(0, self.end_position - self.file.tell()))
 
+class CSVSink:
+    # Keeps the csv file open in append mode, rows are written with the csv module (no DataFrame per flush)
+    def __init__(self, filename, header) -> None:
+        self.filename = output_filename_checker(filename, "csv")
+        self.header = header
+        self.file = None
 
-# Scraping function
-def repeat_navigate_scrape_data_and_click_next_page_btn(web_scraper, links, web_scraper_actions, web_scraper_params, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, write_csv_file_name="links.csv", write_file_data_header=["link"], desc="step"):
-    default_scraped_data = [[] for _ in web_scraper_actions]
-    scraped_data = copy.deepcopy(default_scraped_data)
+    def truncate(self) -> None:
+        with open(self.filename, "w", encoding="utf-8", newline="") as file:
+            csv.writer(file, lineterminator=os.linesep).writerow(self.header)
 
-    # Check if save point in this step
-    if save_point_manager.get_desc() != desc:
-        csv_file_manager.write_header(write_file_data_header, write_csv_file_name)
-    # END: Check if save point in this step
+    def open(self) -> None:
+        if not os.path.exists(self.filename):
+            self.truncate()
+        self.file = open(self.filename, "a", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file, lineterminator=os.linesep)
 
-    for link_index, link in enumerate(links[save_point_manager.get_link_index():], start=save_point_manager.get_link_index()):
-        is_data_scrap = True # To indicate whether the scraping action scraped some data
-        url = save_point_manager.get_url() if save_point_manager.get_url() else link
-        save_point_manager.clear()
-        print(f"link_index: {link_index}")
-        try:
-            while True:
-                if not url:
-                    continue                
-                web_scraper.navigate_to_page(url) # Navigate to the url
+    def write_rows(self, rows) -> None:
+        self.writer.writerows(rows)
+        self.file.flush()
 
-                try:
-                    # Scrap data actions (can have multiple scrap actions, because might want to scrap different things)
-                    for index, web_scraper_action in enumerate(web_scraper_actions):
-                        param = web_scraper_params[index]
-                        data = remove_urls_parameters(web_scraper_action(param)) if remove_urls_param_flag else web_scraper_action(param)
-                        if not data:
-                            data = ""
-                        list_extend_or_append_data(scraped_data[index], data) # extend if the scraped data is in a list, else append it
-                    # END: Scrap data actions
-                except BaseException as inner_be:
-                    # Handling Error Raised while scraping data
-                    logging.error(f"Error occurred inner exception: {inner_be}")
-                    logging.error(f"Stop at link_index: {link_index}, url: {url}, Error: {inner_be}", exc_info=True) # Log error into a file
-                    save_point_record = reformat_data_list_to_records(save_point_header, [[link_index], [url], [desc]])
-                    save_point_manager.write(save_point_record) # Save point
-                    # END: Handling Error Raised while scraping data
-
-                next_btn_element = web_scraper.extract_element(pagination_next_btn_css_selector) if pagination_next_btn_css_selector else None
-
-                # Write the scraped data into a csv file (if the data list more than 50 items inside)
-                flatten_scraped_data = [element for innerList in scraped_data for element in innerList]
-                if(is_data_scrap and len(flatten_scraped_data) > 50 or not next_btn_element):
-                    write_csv_file_name = write_csv_file_name # The csv file name that we write the data into
-                    write_file_data_header = write_file_data_header # Header(s) column of csv file we write
-                    scraped_records = reformat_data_list_to_records(write_file_data_header, scraped_data) # reformat the headers and scraped_data into this format: {'Header1':["data1","data2"],'Header2':["data3","data4"]}
-                    csv_file_manager.append(scraped_records, write_csv_file_name)
-                    
-                    scraped_data = copy.deepcopy(default_scraped_data) # Reset scraped_data to default empty
-                # END: Write the scraped data into a csv file 
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
 
-                # Click pagination "next page" btn (if "next page" btn not exist, break the loop, continue to scrap data on next link)
-                if not next_btn_element:
-                    break
-                web_scraper.safe_click(pagination_next_btn_css_selector)
-                url = web_scraper.get_current_link()
-                # END: Click pagination "next page" btn
-        except BaseException as outer_be:
-            logging.error(f"Error occurred outside exception: {outer_be}")
-            logging.error(f"Stop at link_index: {link_index}, url: {url}, Error: {outer_be}", exc_info=True) # Log error into a file
-            save_point_record = reformat_data_list_to_records(save_point_header, [[link_index], [url], [desc]])
-            save_point_manager.write(save_point_record) # Save point
-
-def website_scrap_action(read_csv_file_name, web_scraper_action_names, web_scraper_action_params, write_csv_file_name, write_file_data_header, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, desc="Step 1", link=""):
-    if save_point_manager.check_save_point_exist() and save_point_manager.get_desc() != desc:
-        return 
+class ArrowPartsSink:
+    # Parquet / arrow ipc output: a directory of part files, every flush writes one complete part file (renamed in place once written,
+    # so a kill never leaves a corrupted part), and the parts written by this sink are compacted into one part file on close
+    def __init__(self, filename, header, output_format="parquet") -> None:
+        check_pyarrow(output_format)
+        self.output_format = output_format
+        self.dirname = output_filename_checker(filename, output_format)
+        self.extension = output_formats_extensions[output_format]
+        self.schema = pa.schema([(col_name, pa.string()) for col_name in header])
+        self.part_filenames = []
+        self.part_prefix = f"part-{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}"
 
-    # Section 1: Read data from csv file
-    read_csv_file_name = read_csv_file_name 
-    read_csv_file_col = ["link"]
-    csv_file_data = csv_file_manager.read(read_csv_file_name, read_csv_file_col) # Read and get the data from the csv file and desired column
-    link = link if link else default_link
-    links = csv_file_data["link"] if csv_file_data else [link] # only default_link if the csv file not exist, else get the 'link' column from the csv file
-    # END: Section 1: Read data from csv file
+    def truncate(self) -> None:
+        shutil.rmtree(self.dirname, ignore_errors=True)
 
-    # Section 2: Scrap data based on the links retrieved from and then save into csv file [Section 1]
-    web_scraper_action_names = web_scraper_action_names # should in a list, it is the web_scraper action names that have to execute
-    web_scraper_action_params = web_scraper_action_params # should in a list, it is the parameters for the web_scraper action names above (The items inside corresponds to the items in list [web_scraper_action_names], note: it might be a nested list sometimes)
+    def open(self) -> None:
+        os.makedirs(self.dirname, exist_ok=True)
 
-    web_scraper_actions = [getattr(web_scraper, action_name) for action_name in web_scraper_action_names]
-    
-    repeat_navigate_scrape_data_and_click_next_page_btn(
-        web_scraper, 
-        links,
-        web_scraper_actions,
-        web_scraper_action_params,
-        pagination_next_btn_css_selector=pagination_next_btn_css_selector,
-        remove_urls_param_flag=remove_urls_param_flag,
-        write_csv_file_name=write_csv_file_name,
-        write_file_data_header=write_file_data_header,
-        desc=desc
-    )
-    # END: Section 2: Scrap data based on the links retrieved from and then save into csv file [Section 1]    
+    def write_table(self, table, part_filename) -> None:
+        temp_filename = f"{part_filename}.tmp"
+        if self.output_format == "parquet":
+            pq.write_table(table, temp_filename)
+        else:
+            with pa.OSFile(temp_filename, "wb") as sink, pa.ipc.new_file(sink, self.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_filename, part_filename)
 
-    # Section 3: Remove duplicated rows in CSV file
-    csv_file_manager.remove_null_and_duplicates_from_csv(write_csv_file_name)
-    # END: Section 3: Remove duplicated rows in CSV file
-# END: Scraping function
+    def read_table(self, part_filename):
+        if self.output_format == "parquet":
+            return pq.read_table(part_filename)
+        with pa.memory_map(part_filename) as source:
+            return pa.ipc.open_file(source).read_all()
 
+    def write_rows(self, rows) -> None:
+        columns = list(zip(*rows)) if rows else [[] for _ in self.schema]
+        table = pa.Table.from_arrays([pa.array(column, pa.string()) for column in columns], schema=self.schema)
+        part_filename = os.path.join(self.dirname, f"{self.part_prefix}-{len(self.part_filenames):06d}{self.extension}")
+        self.write_table(table, part_filename)
+        self.part_filenames.append(part_filename)
 
-# Main Function
-def main():
-    recommend_web_scrape_steps_params = [
-        # Sample
-        # {
-        #     "desc": "Step 0", ## description for the step (for logging purpose)
-        #     "read_csv_file_name": "", ## the csv file where we read to get all the links to scrap through
+    def close(self) -> None:
+        if len(self.part_filenames) > 1:
+            compacted_filename = os.path.join(self.dirname, f"{self.part_prefix}{self.extension}")
+            self.write_table(pa.concat_tables([self.read_table(part_filename) for part_filename in self.part_filenames]), compacted_filename)
+            for part_filename in self.part_filenames:
+                os.remove(part_filename)
+            self.part_filenames = [compacted_filename]
+
+class SQLiteSink:
+    # Rows appended into the "rows" table of a sqlite file, one transaction per flush
+    def __init__(self, filename, header) -> None:
+        self.filename = output_filename_checker(filename, "sqlite")
+        self.header = header
+        self.connection = None
+
+    def truncate(self) -> None:
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def open(self) -> None:
+        self.connection = sqlite3.connect(self.filename, timeout=60)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS rows ({', '.join(f'{chr(34)}{col_name}{chr(34)} TEXT' for col_name in self.header)})")
+        self.connection.commit()
+
+    def write_rows(self, rows) -> None:
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO rows VALUES ({', '.join('?' for _ in self.header)})", rows)
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+class VendorStoreSink:
+    # --store: the rows of a step are also upserted into the vendor store, with the step and the time they were scraped
+    def __init__(self, desc, header) -> None:
+        self.desc = desc
+        self.header = header
+        self.vendor_store = None
+
+    def truncate(self) -> None:
+        pass # the store keeps the rows of the previous crawls, they're updated by the new ones
+
+    def open(self) -> None:
+        self.vendor_store = VendorStore(vendor_store.filename) # own connection: the workers' sinks write from their own threads
+
+    def write_rows(self, rows) -> None:
+        self.vendor_store.upsert_rows(self.desc, self.header, rows)
+
+    def close(self) -> None:
+        if self.vendor_store:
+            self.vendor_store.close()
+            self.vendor_store = None
+
+class TeeSink:
+    # The same rows written into several sinks (e.g. the output file and the vendor store)
+    def __init__(self, sinks) -> None:
+        self.sinks = sinks
+
+    def truncate(self) -> None:
+        for sink in self.sinks:
+            sink.truncate()
+
+    def open(self) -> None:
+        for sink in self.sinks:
+            sink.open()
+
+    def write_rows(self, rows) -> None:
+        for sink in self.sinks:
+            sink.write_rows(rows)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+def create_output_sink(filename, header, output_format="csv"):
+    if output_format == "csv":
+        return CSVSink(filename, header)
+    if output_format in ["parquet", "arrow"]:
+        return ArrowPartsSink(filename, header, output_format)
+    if output_format == "sqlite":
+        return SQLiteSink(filename, header)
+    raise ValueError(f'Invalid output format specified: {output_format}')
+
+class BloomFilter:
+    # Fixed-size set of hashes that may answer "maybe present" for an absent hash, never "absent" for a present one
+    def __init__(self, bits=None, hashes=None) -> None:
+        self.bits = bits if bits else dedup_bloom_bits
+        self.hashes = hashes if hashes else dedup_bloom_hashes
+        self.bit_array = bytearray((self.bits + 7) // 8)
+
+    def add(self, digest):
+        # Returns True if the digest was maybe added before, False if it surely wasn't
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:16], "little") | 1
+        is_maybe_present = True
+        for hash_index in range(self.hashes):
+            position = (h1 + hash_index * h2) % self.bits
+            if not self.bit_array[position >> 3] & (1 << (position & 7)):
+                is_maybe_present = False
+                self.bit_array[position >> 3] |= 1 << (position & 7)
+        return is_maybe_present
+
+class RowDeduplicator:
+    # Drops the empty rows and the rows already seen, by hash of the row:
+    # memory: every row hash in a set (16 bytes + set overhead per row)
+    # bloom: fixed-memory bloom filter, its "maybe seen" answers are confirmed on an exact on-disk hash index
+    def __init__(self, mode="memory", dirname=".") -> None:
+        self.mode = mode
+        self.row_hashes = set()
+        self.pending_digests = [] # surely new hashes, inserted into the index in batches
+        self.bloom_filter = None
+        self.index_connection = None
+        if mode == "bloom":
+            self.bloom_filter = BloomFilter()
+            index_file_descriptor, self.index_filename = tempfile.mkstemp(suffix=".dedup.sqlite", dir=dirname)
+            os.close(index_file_descriptor)
+            self.index_connection = sqlite3.connect(self.index_filename, check_same_thread=False)
+            self.index_connection.execute("PRAGMA journal_mode = OFF") # scratch index, removed on close
+            self.index_connection.execute("PRAGMA synchronous = OFF")
+            self.index_connection.execute("CREATE TABLE seen (hash BLOB PRIMARY KEY) WITHOUT ROWID")
+
+    def is_duplicate(self, row):
+        if not any(row):
+            return True # empty row
+        digest = hash_row(row)
+        if self.mode == "memory":
+            if digest in self.row_hashes:
+                return True
+            self.row_hashes.add(digest)
+            return False
+        if not self.bloom_filter.add(digest):
+            self.pending_digests.append(digest)
+            if len(self.pending_digests) >= writer_buffer_rows:
+                self.insert_pending_digests()
+            return False
+        self.insert_pending_digests() # the index must have all the hashes seen before confirming (in the same transaction, committed per flush)
+        return self.index_connection.execute("INSERT OR IGNORE INTO seen VALUES (?)", (digest,)).rowcount == 0
+
+    def insert_pending_digests(self) -> None:
+        if self.pending_digests:
+            self.index_connection.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((digest,) for digest in self.pending_digests))
+            self.pending_digests = []
+
+    def commit(self) -> None:
+        # Once per flush of the step's writer
+        if self.index_connection:
+            self.insert_pending_digests()
+            self.index_connection.commit()
+
+    def close(self) -> None:
+        if self.index_connection:
+            self.index_connection.close()
+            self.index_connection = None
+            os.remove(self.index_filename)
+
+class QueueLinks:
+    # Pipeline mode: bounded queue of the links a step emits to the next step, a full queue blocks the emitting step (backpressure).
+    # The workers of the next step share it, each link gets the index of its arrival order.
+    # Once the next step stopped (abort), the links are dropped instead: the emitting step still writes them into its output file
+    def __init__(self, maxsize=None) -> None:
+        self.queue = queue.Queue(maxsize if maxsize else pipeline_queue_links)
+        self.lock = threading.Lock()
+        self.next_link_index = 0
+        self.aborted = threading.Event()
+
+    def put(self, link) -> None:
+        while not self.aborted.is_set():
+            try:
+                self.queue.put(link, timeout=pipeline_put_seconds)
+                return
+            except queue.Full:
+                pass
+
+    def close(self) -> None:
+        self.put(None) # end marker, no more links
+
+    def abort(self) -> None:
+        self.aborted.set()
+
+    def iter_windows(self, size):
+        while True:
+            links = [self.queue.get()] # wait for the next link
+            while len(links) < size and links[-1] is not None:
+                try:
+                    links.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            is_closed = links[-1] is None
+            if is_closed:
+                links.pop()
+                self.queue.put(None) # leave the end marker to the other workers
+            with self.lock:
+                links_window = list(enumerate(links, start=self.next_link_index))
+                self.next_link_index += len(links)
+            if links_window:
+                yield links_window
+            if is_closed:
+                return
+
+class FileLinks:
+    # The links of a step's input file (any output format), read lazily: only a sparse index of the rows positions is held in memory.
+    # A row's position is its byte offset in a csv file, its rowid in a sqlite file, its row number in parquet/arrow part files.
+    # Slicing it gives a view of a contiguous range of links (a worker's chunk). While a view is iterated it tracks its save point:
+    # the position of its first link not done yet, all the links before it are done or in its list of failed links.
+    def __init__(self, filename, col_name="link", output_format=None) -> None:
+        self.output_format = csv_file_manager.find_output_format(filename, output_format)
+        self.filename = output_filename_checker(filename, self.output_format)
+        self.col_name = col_name
+        if not os.path.exists(self.filename):
+            raise FileNotFoundError(f"No such file or directory: '{self.filename}'")
+        self.index_positions = [] # position of the links 0, file_links_index_rows, 2 * file_links_index_rows...
+        self.rows_count = 0
+        self.checksum = self.scan()
+        self.save_points = {} # {first link index of a worker's chunk: save point of the chunk} of the previous runs
+        self.done_link_indexes = set() # links done by the previous runs (after their chunks' save points)
+        self.start, self.stop = 0, self.rows_count
+        self.reset_progress()
+
+    def reset_progress(self) -> None:
+        self.lock = threading.Lock()
+        self.pending_positions = {} # {link index: position} of the links iterated but not done or failed yet
+        self.failed_positions = {} # {link index: position} of the failed links (and of the links failed before, retried first)
+        self.next_link_index, self.next_position = None, None # first link not iterated yet
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"] # sent to a worker process
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, links_slice):
+        start, stop, _ = links_slice.indices(len(self))
+        links_view = copy.copy(self)
+        links_view.start, links_view.stop = self.start + start, self.start + max(start, stop)
+        links_view.reset_progress()
+        return links_view
+
+    def __iter__(self):
+        # The links of the view, without tracking them (e.g. added to the work queue)
+        link_index = self.start // file_links_index_rows * file_links_index_rows
+        start_position = self.index_positions[link_index // file_links_index_rows] if self.index_positions else None
+        for _, _, link in self.iter_rows_from(start_position):
+            if link_index >= self.stop:
+                return
+            if link_index >= self.start:
+                yield link
+            link_index += 1
+
+    def read_csv_header(self, csv_file):
+        header_row = self.read_csv_row(csv_file)
+        header = next(csv.reader([header_row.decode("utf-8-sig")])) if header_row else []
+        if self.col_name not in header:
+            raise ValueError(f"Usecols do not match columns, columns expected but not found: ['{self.col_name}']")
+        return header_row, header.index(self.col_name)
+
+    def read_csv_row(self, csv_file) -> bytes:
+        # The bytes of the next csv row, a quoted value can span several lines
+        row = csv_file.readline()
+        while row.count(b'"') % 2:
+            line = csv_file.readline()
+            if not line:
+                break
+            row += line
+        return row
+
+    def iter_csv_rows(self, csv_file, col_index):
+        # (position, next position, link) of the rows from the current position of the file
+        position = csv_file.tell()
+        while True:
+            row = self.read_csv_row(csv_file)
+            if not row:
+                return
+            if b'"' in row:
+                values = next(csv.reader([row.decode("utf-8")]), [])
+            else:
+                values = row.rstrip(b"\r\n").decode("utf-8").split(",") # no quoted value (most rows)
+            yield position, position + len(row), values[col_index] if col_index < len(values) else ""
+            position += len(row)
+
+    def scan(self) -> str:
+        # One pass over the file: no. of links, sparse index of their positions and sha256 of the file
+        if self.output_format == "csv":
+            sha256 = hashlib.sha256()
+            with open(self.filename, "rb", buffering=file_links_buffer_bytes) as csv_file:
+                header_row, _ = self.read_csv_header(csv_file)
+                sha256.update(header_row)
+                position = len(header_row)
+                for row in iter(lambda: self.read_csv_row(csv_file), b""):
+                    self.add_row_position(position)
+                    sha256.update(row)
+                    position += len(row)
+            return sha256.hexdigest()
+        for position, _, _ in self.iter_rows_from(None):
+            self.add_row_position(position)
+        return hash_output_file(self.filename, self.output_format)
+
+    def add_row_position(self, position) -> None:
+        if self.rows_count % file_links_index_rows == 0:
+            self.index_positions.append(position)
+        self.rows_count += 1
+
+    def iter_rows_from(self, position):
+        # (position, next position, link) of the rows from position (None: the first row)
+        if self.output_format == "csv":
+            with open(self.filename, "rb", buffering=file_links_buffer_bytes) as csv_file:
+                _, col_index = self.read_csv_header(csv_file)
+                if position is not None:
+                    csv_file.seek(position)
+                yield from self.iter_csv_rows(csv_file, col_index)
+            return
+        if self.output_format == "sqlite":
+            with contextlib.closing(sqlite3.connect(self.filename)) as connection:
+                cursor = connection.execute(f'SELECT rowid, "{self.col_name}" FROM rows WHERE rowid >= ? ORDER BY rowid', (position if position is not None else 0,))
+                for rowid, link in cursor:
+                    yield rowid, rowid + 1, link
+            return
+        check_pyarrow(self.output_format)
+        row_number = 0
+        position = position if position is not None else 0
+        for part_filename in sorted(glob.glob(os.path.join(glob.escape(self.filename), "*" + output_formats_extensions[self.output_format]))):
+            if self.output_format == "parquet":
+                parquet_file = pq.ParquetFile(part_filename)
+                part_rows_count = parquet_file.metadata.num_rows
+                batches = lambda: parquet_file.iter_batches(columns=[self.col_name])
+            else:
+                reader = pa.ipc.open_file(pa.memory_map(part_filename))
+                part_rows_count = sum(reader.get_batch(batch_index).num_rows for batch_index in range(reader.num_record_batches))
+                batches = lambda: (reader.get_batch(batch_index).select([self.col_name]) for batch_index in range(reader.num_record_batches))
+            if row_number + part_rows_count <= position:
+                row_number += part_rows_count # the part files before position are not read
+                continue
+            for batch in batches():
+                for link in batch.column(0).to_pylist():
+                    if row_number >= position:
+                        yield row_number, row_number + 1, link
+                    row_number += 1
+
+    def set_checkpoint(self, save_points, done_link_indexes) -> None:
+        self.save_points, self.done_link_indexes = save_points, done_link_indexes
+
+    def get_start(self):
+        # (link index, position, links to retry) the view starts from: the save points of the previous runs are chained from its first link
+        link_index, position, retry_positions = self.start, None, {}
+        is_save_point_found = True
+        while is_save_point_found and link_index < self.stop:
+            is_save_point_found = False
+            for start, save_point in self.save_points.items():
+                if start <= link_index < save_point["link_index"]:
+                    retry_positions.update({failed_link_index: failed_position for failed_link_index, failed_position in save_point["failed"] if link_index <= failed_link_index < min(save_point["link_index"], self.stop)})
+                    link_index, position = save_point["link_index"], save_point["position"]
+                    is_save_point_found = True
+                    break
+        return link_index, position, retry_positions
+
+    def iter_windows(self, size):
+        # Windows of up to size (link index, link): the failed links of the previous runs first, then the links from the save point
+        start_link_index, start_position, retry_positions = self.get_start()
+        with self.lock:
+            self.failed_positions.update(retry_positions)
+        links_window = []
+        for link_index, position in sorted(retry_positions.items()):
+            _, _, link = next(self.iter_rows_from(position), (None, None, None))
+            if self.is_link_resolved(link_index, link):
+                self.resolve(link_index)
+            else:
+                links_window.append((link_index, link))
+            if len(links_window) == size:
+                yield links_window
+                links_window = []
+        if start_link_index >= self.stop:
+            with self.lock:
+                self.next_link_index, self.next_position = start_link_index, start_position
+            if links_window:
+                yield links_window
+            return
+        if start_position is None:
+            # No save point: seek to the closest indexed link before the view's first link (see __iter__)
+            link_index = start_link_index // file_links_index_rows * file_links_index_rows
+            start_position = self.index_positions[link_index // file_links_index_rows] if self.index_positions else None
+        else:
+            link_index = start_link_index
+        for position, next_position, link in self.iter_rows_from(start_position):
+            if link_index >= self.stop:
+                break
+            if link_index >= start_link_index:
+                with self.lock:
+                    if not self.is_link_resolved(link_index, link):
+                        self.pending_positions[link_index] = position
+                        links_window.append((link_index, link))
+                    self.next_link_index, self.next_position = link_index + 1, next_position
+            link_index += 1
+            if len(links_window) == size:
+                yield links_window
+                links_window = []
+        if links_window:
+            yield links_window
+
+    def is_link_resolved(self, link_index, link) -> bool:
+        # Done by a previous run, or nothing to scrap
+        return link_index in self.done_link_indexes or not link
+
+    def resolve(self, link_index, is_done=True) -> None:
+        # The link is done (its last page is flushed), or failed
+        with self.lock:
+            position = self.pending_positions.pop(link_index, None)
+            if is_done:
+                self.failed_positions.pop(link_index, None)
+            elif position is not None:
+                self.failed_positions[link_index] = position
+
+    def get_save_point(self):
+        # Position the view resumes from, None before it is iterated
+        with self.lock:
+            if self.next_link_index is None:
+                return None
+            if self.pending_positions:
+                link_index = min(self.pending_positions)
+                position = self.pending_positions[link_index]
+            else:
+                link_index, position = self.next_link_index, self.next_position
+            failed = sorted([failed_link_index, failed_position] for failed_link_index, failed_position in self.failed_positions.items() if failed_link_index < link_index)
+        return {"start": self.start, "link_index": link_index, "position": position, "failed": failed}
+
+class StepWriter:
+    # Long-lived writer of a step's output: rows are buffered and written to the sink once the buffer is full or old enough.
+    # Flush callbacks (e.g. checkpoint journal entries) run only after all the rows given before them are written.
+    # dedup "memory" / "bloom": the empty and duplicated rows are dropped before they're buffered (seeded with the rows
+    # already in the output when appending to it), "external" / "none": rows written as is
+    # downstream_links (pipeline mode): the "link" column of the rows is emitted to the next step as soon as the rows are given
+    # sink: where the rows are written instead of the output file (e.g. a WorkQueueSink)
+    # checkpoint_journal: synced right after the rows are written, with the entries of their flush callbacks
+    def __init__(self, filename, header, output_format="csv", truncate=False, buffer_rows=None, flush_seconds=None, dedup="none", downstream_links=None, sink=None, checkpoint_journal=None) -> None:
+        self.header = header
+        self.checkpoint_journal = checkpoint_journal
+        self.downstream_links = downstream_links
+        if downstream_links and "link" not in header:
+            raise ValueError(f'No "link" column to emit to the next step in {header}')
+        self.link_column_index = header.index("link") if downstream_links else None
+        self.sink = sink if sink else create_output_sink(filename, header, output_format)
+        self.buffer_rows = buffer_rows if buffer_rows else writer_buffer_rows
+        self.flush_seconds = flush_seconds if flush_seconds is not None else writer_flush_seconds
+        self.buffer = []
+        self.flush_callbacks = []
+        self.last_flush_time = time.time()
+        self.deduplicator = None
+        if truncate:
+            self.sink.truncate()
+        if dedup in ["memory", "bloom"]:
+            self.deduplicator = RowDeduplicator(dedup, os.path.dirname(os.path.abspath(output_filename_checker(filename, output_format))))
+            if not truncate:
+                for row in csv_file_manager.iter_rows(filename, output_format):
+                    self.deduplicator.is_duplicate(row)
+        self.sink.open()
+
+    def write_rows(self, rows) -> None:
+        rows = (tuple("" if value is None else str(value) for value in row) for row in rows)
+        while True:
+            rows_chunk = list(itertools.islice(rows, self.buffer_rows)) # bounded memory for long row streams (merges)
+            if not rows_chunk:
+                break
+            if self.deduplicator:
+                with metrics_registry.measure("dedup"):
+                    unique_rows_chunk = [row for row in rows_chunk if not self.deduplicator.is_duplicate(row)]
+                metrics_registry.inc("scrap_duplicate_rows_total", len(rows_chunk) - len(unique_rows_chunk))
+                rows_chunk = unique_rows_chunk
+            for row in rows_chunk:
+                self.buffer.append(row)
+                if self.downstream_links and row[self.link_column_index]:
+                    self.downstream_links.put(row[self.link_column_index])
+                if len(self.buffer) >= self.buffer_rows:
+                    self.flush()
+        self.flush_if_needed()
+
+    def write_columns(self, columns) -> None:
+        # columns: one list of values per header column (the scraping loop's format)
+        if len(set(len(column) for column in columns)) > 1:
+            logging.error(f"Write data into {self.sink} failed: columns of different lengths {[len(column) for column in columns]}")
+            print(f"Write data failed: columns of different lengths {[len(column) for column in columns]}")
+            return
+        self.write_rows(zip(*columns))
+
+    def add_flush_callback(self, flush_callback) -> None:
+        self.flush_callbacks.append(flush_callback)
+        self.flush_if_needed()
+
+    def flush_if_needed(self) -> None:
+        if len(self.buffer) >= self.buffer_rows or time.time() - self.last_flush_time >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            with metrics_registry.measure("flush"):
+                self.sink.write_rows(self.buffer)
+            metrics_registry.inc("scrap_rows_written_total", len(self.buffer))
+            self.buffer = []
+        if self.deduplicator:
+            self.deduplicator.commit()
+        flush_callbacks, self.flush_callbacks = self.flush_callbacks, []
+        for flush_callback in flush_callbacks:
+            flush_callback()
+        if flush_callbacks and self.checkpoint_journal:
+            self.checkpoint_journal.sync() # journal the rows in the same step as their append, not up to sync_seconds later (a kill in between wrote them twice)
+        self.last_flush_time = time.time()
+
+    def close(self) -> None:
+        self.flush()
+        self.sink.close()
+        if self.deduplicator:
+            self.deduplicator.close()
+        
+    
+def get_checkpoint_journal_filename(desc, worker_index):
+    return os.path.join(checkpoint_dirname, f"{desc_to_filename(desc)}{worker_file_suffix}{worker_index}.journal")
+
+def apply_checkpoint_entry(entry, done_link_indexes, resume_urls, save_points=None):
+    # Apply a checkpoint journal entry on the done links, resume urls and save points, returns the no. of rows it flushed
+    if entry["type"] == "compact":
+        for start_link_index, end_link_index in entry["done"]:
+            done_link_indexes.update(range(start_link_index, end_link_index + 1))
+        resume_urls.update({int(link_index): url for link_index, url in entry["resume_urls"].items()})
+        if save_points is not None:
+            save_points.update({int(start): save_point for start, save_point in entry.get("save_points", {}).items()})
+    elif entry["type"] == "save_point":
+        if save_points is not None:
+            save_points[entry["start"]] = {key: entry[key] for key in ["link_index", "position", "failed"]}
+    elif entry["type"] == "resume_url":
+        resume_urls[entry["link_index"]] = entry["url"]
+    elif entry["type"] == "flush" and entry["done"] is not None:
+        done_link_indexes.add(entry["done"])
+        resume_urls.pop(entry["done"], None)
+    return entry.get("rows", 0)
+
+def read_checkpoint_journal(filename):
+    # Returns (done link indexes, {link index: url to resume the link from}, no. of flushed rows, no. of entries, {chunk's first link index: save point})
+    done_link_indexes, resume_urls, flushed_rows, entries_count, save_points = set(), {}, 0, 0, {}
+    if not os.path.exists(filename):
+        return done_link_indexes, resume_urls, flushed_rows, entries_count, save_points
+    with open(filename, "r", encoding="utf-8") as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue # partially written last line of a killed run
+            flushed_rows += apply_checkpoint_entry(entry, done_link_indexes, resume_urls, save_points)
+            entries_count += 1
+    return done_link_indexes, resume_urls, flushed_rows, entries_count, save_points
+
+def read_step_checkpoint(desc):
+    # The work done by all the workers of a step: (done link indexes, resume urls, no. of flushed rows, save points of the input file's chunks)
+    done_link_indexes, resume_urls, flushed_rows, save_points = set(), {}, 0, {}
+    for filename in glob.glob(get_checkpoint_journal_filename(desc, "*")):
+        worker_done_link_indexes, worker_resume_urls, worker_flushed_rows, _, worker_save_points = read_checkpoint_journal(filename)
+        done_link_indexes.update(worker_done_link_indexes)
+        resume_urls.update(worker_resume_urls)
+        flushed_rows += worker_flushed_rows
+        save_points.update(worker_save_points)
+    for link_index in done_link_indexes:
+        resume_urls.pop(link_index, None)
+    return done_link_indexes, resume_urls, flushed_rows, save_points
+
+def get_step_input_filename(desc):
+    return os.path.join(checkpoint_dirname, f"{desc_to_filename(desc)}.input")
+
+def read_step_input_checksum(desc):
+    # Checksum of the input file the step's checkpoint journals index (None if the step has none)
+    if not os.path.exists(get_step_input_filename(desc)):
+        return None
+    with open(get_step_input_filename(desc), "r", encoding="utf-8") as input_file:
+        return input_file.read().strip()
+
+def write_step_input_checksum(desc, checksum):
+    os.makedirs(checkpoint_dirname, exist_ok=True)
+    with open(get_step_input_filename(desc), "w", encoding="utf-8") as input_file:
+        input_file.write(checksum)
+
+def is_step_checkpoint_done(desc):
+    return os.path.exists(os.path.join(checkpoint_dirname, f"{desc_to_filename(desc)}.done"))
+
+def mark_step_checkpoint_done(desc):
+    os.makedirs(checkpoint_dirname, exist_ok=True)
+    with open(os.path.join(checkpoint_dirname, f"{desc_to_filename(desc)}.done"), "w") as done_file:
+        done_file.write(str(time.time()))
+
+def reset_step_checkpoint(desc):
+    for filename in glob.glob(get_checkpoint_journal_filename(desc, "*")) + [os.path.join(checkpoint_dirname, f"{desc_to_filename(desc)}.done"), get_step_input_filename(desc)]:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+def remove_checkpoints():
+    url_frontier.close()
+    shutil.rmtree(checkpoint_dirname, ignore_errors=True)
+
+class CheckpointJournal:
+    # Append-only journal of a worker's finished work in a step: the links done and the rows flushed into the output file.
+    # It is synced to disk by the step's writer right after every flush (the rows and their entries), every sync_seconds
+    # by a background thread for the other entries, and compacted into one entry once it has too many entries.
+    # A worker reading its links from the input file (FileLinks) also journals the save point of its chunk, the done links before it are dropped.
+    def __init__(self, desc, worker_index=0, step_checkpoint=None, sync_seconds=None, links=None) -> None:
+        self.desc = desc
+        self.filename = get_checkpoint_journal_filename(desc, worker_index)
+        self.sync_seconds = sync_seconds if sync_seconds else checkpoint_sync_seconds
+        self.lock = threading.Lock()
+        self.pending_entries = []
+        # Work of every worker of the step (to skip it), and work of this worker only (to compact its journal)
+        self.done_link_indexes, self.resume_urls, _, _ = step_checkpoint if step_checkpoint else read_step_checkpoint(desc)
+        self.own_done_link_indexes, self.own_resume_urls, self.own_flushed_rows, self.entries_count, self.own_save_points = read_checkpoint_journal(self.filename)
+        self.links = links if isinstance(links, FileLinks) else None
+        os.makedirs(checkpoint_dirname, exist_ok=True)
+        self.closed = threading.Event()
+        self.sync_thread = threading.Thread(target=self.sync_periodically, daemon=True)
+        self.sync_thread.start()
+
+    def is_link_done(self, link_index) -> bool:
+        return link_index in self.done_link_indexes
+
+    def get_resume_url(self, link_index) -> str:
+        return self.resume_urls.get(link_index)
+
+    def append(self, entry) -> None:
+        with self.lock:
+            self.pending_entries.append(entry)
+            apply_checkpoint_entry(entry, self.done_link_indexes, self.resume_urls)
+            self.own_flushed_rows += apply_checkpoint_entry(entry, self.own_done_link_indexes, self.own_resume_urls, self.own_save_points)
+            if self.links and entry["type"] == "flush" and entry["done"] is not None:
+                self.links.resolve(entry["done"])
+
+    def record_flush(self, rows_count, done_link_index=None) -> None:
+        # rows_count rows were appended to the output file, done_link_index: the link whose last page is in these rows
+        self.append({"type": "flush", "rows": rows_count, "done": done_link_index, "at": time.time()})
+
+    def record_resume_url(self, link_index, url) -> None:
+        # The pages of the link before this url are flushed, a resumed run continues the link from this url
+        self.append({"type": "resume_url", "link_index": link_index, "url": url})
+
+    def record_failure(self, link_index) -> None:
+        # A failed link is not journaled as done, the next run scraps it again
+        if self.links:
+            self.links.resolve(link_index, is_done=False)
+
+    def append_save_point(self) -> None:
+        # Journal the chunk's save point if it moved, the done links before it are covered by it
+        save_point = self.links.get_save_point()
+        start = save_point["start"] if save_point else None
+        if not save_point or self.own_save_points.get(start) == {key: save_point[key] for key in ["link_index", "position", "failed"]}:
+            return
+        entry = {"type": "save_point", **save_point}
+        self.pending_entries.append(entry)
+        apply_checkpoint_entry(entry, self.own_done_link_indexes, self.own_resume_urls, self.own_save_points)
+        covered_link_indexes = {link_index for link_index in self.own_done_link_indexes if start <= link_index < save_point["link_index"]}
+        self.own_done_link_indexes -= covered_link_indexes
+        self.done_link_indexes -= covered_link_indexes
+
+    def sync_periodically(self) -> None:
+        while not self.closed.wait(self.sync_seconds):
+            self.sync()
+
+    def sync(self) -> None:
+        with self.lock:
+            if self.links:
+                self.append_save_point()
+            if not self.pending_entries:
+                return
+            with open(self.filename, "a", encoding="utf-8") as journal_file:
+                journal_file.write("".join(json.dumps(entry) + "\n" for entry in self.pending_entries))
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self.entries_count += len(self.pending_entries)
+            self.pending_entries = []
+            if self.entries_count > checkpoint_compact_entries:
+                self.compact()
+
+    def compact(self) -> None:
+        # Rewrite the journal as one entry (done links as ranges), then swap it in atomically
+        entry = {"type": "compact", "done": link_indexes_to_ranges(self.own_done_link_indexes), "resume_urls": self.own_resume_urls, "rows": self.own_flushed_rows, "save_points": self.own_save_points}
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, "w", encoding="utf-8") as journal_file:
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(temp_filename, self.filename)
+        self.entries_count = 1
+
+    def close(self) -> None:
+        self.closed.set()
+        self.sync()
+
+class PageArchive:
+    # Content-addressed archive of the fetched pages: every page body is stored once, gzipped, under its sha256,
+    # and the index file maps the canonical url of every fetched page to its body (the last fetch of an url wins)
+    def __init__(self, archive_dirname=page_archive_dirname) -> None:
+        self.archive_dirname = archive_dirname
+        self.index_filename = os.path.join(archive_dirname, page_archive_index_filename)
+        self.index = {}
+        self.lock = threading.Lock()
+        os.makedirs(archive_dirname, exist_ok=True)
+        self.read_index()
+
+    def read_index(self) -> None:
+        if not os.path.exists(self.index_filename):
+            return
+        with open(self.index_filename, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # partially written last line
+                self.index[entry["url"]] = entry
+
+    def get_body_filename(self, sha256) -> str:
+        return os.path.join(self.archive_dirname, "objects", sha256[:2], f"{sha256}.html.gz")
+
+    def save(self, url, final_url, html) -> None:
+        body = html.encode("utf-8")
+        sha256 = hashlib.sha256(body).hexdigest()
+        body_filename = self.get_body_filename(sha256)
+        if not os.path.exists(body_filename):
+            os.makedirs(os.path.dirname(body_filename), exist_ok=True)
+            temp_filename = f"{body_filename}.{threading.get_ident()}.tmp"
+            with gzip.open(temp_filename, "wb") as body_file:
+                body_file.write(body)
+            os.replace(temp_filename, body_filename) # never leave a half written body behind
+        entry = {"url": canonicalize_url(url), "final_url": final_url, "sha256": sha256, "fetched_at": time.time()}
+        with self.lock:
+            with open(self.index_filename, "a", encoding="utf-8") as index_file:
+                index_file.write(json.dumps(entry) + "\n")
+            self.index[entry["url"]] = entry
+
+    def load(self, url) -> tuple:
+        entry = self.index.get(canonicalize_url(url))
+        if not entry:
+            raise KeyError(f"{url} not found in the page archive")
+        with gzip.open(self.get_body_filename(entry["sha256"]), "rb") as body_file:
+            return (entry["final_url"], body_file.read().decode("utf-8"))
+
+class ProcessConnection:
+    # sqlite connection of a store used by the threads of the main process and of the forked worker processes: one connection per
+    # process (a connection can't be shared with a forked worker process, it would share the parent's locks and transaction), opened
+    # with connect on the first use in the process, used by one thread at a time
+    def __init__(self, connect) -> None:
+        self.connect = connect # returns a new connection to the store, its tables created
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connection_pid = None
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self.lock:
+            if self.connection_pid != os.getpid():
+                self.connection = self.connect()
+                self.connection_pid = os.getpid()
+            yield self.connection
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection and self.connection_pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+            self.connection_pid = None
+
+class CrawlStateStore:
+    # Incremental mode: last fetch time, content hash, validators (ETag/Last-Modified) and extracted record of every url of every step
+    def __init__(self, filename=crawl_state_filename) -> None:
+        self.filename = filename
+        self.process_connection = ProcessConnection(self.connect)
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.filename, check_same_thread=False)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_state (
+                desc TEXT, url TEXT, fetched_at REAL, content_hash TEXT, etag TEXT, last_modified TEXT, record TEXT,
+                PRIMARY KEY (desc, url)
+            )
+        """)
+        connection.commit()
+        return connection
+
+    def execute(self, sql, params=()) -> list:
+        with self.process_connection.acquire() as connection:
+            rows = connection.execute(sql, params).fetchall()
+            connection.commit()
+            return rows
+
+    def get(self, desc, url) -> dict:
+        rows = self.execute("SELECT fetched_at, content_hash, etag, last_modified, record FROM crawl_state WHERE desc = ? AND url = ?", (desc, canonicalize_url(url)))
+        if not rows:
+            return None
+        fetched_at, content_hash, etag, last_modified, record = rows[0]
+        return {"fetched_at": fetched_at, "content_hash": content_hash, "etag": etag, "last_modified": last_modified, "record": json.loads(record)}
+
+    def save(self, desc, url, content_hash, response_headers, record) -> None:
+        self.execute(
+            "INSERT OR REPLACE INTO crawl_state (desc, url, fetched_at, content_hash, etag, last_modified, record) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (desc, canonicalize_url(url), time.time(), content_hash, response_headers.get("ETag"), response_headers.get("Last-Modified"), json.dumps(record))
+        )
+
+    def touch(self, desc, url) -> None:
+        self.execute("UPDATE crawl_state SET fetched_at = ? WHERE desc = ? AND url = ?", (time.time(), desc, canonicalize_url(url)))
+
+    def is_fresh(self, state, freshness_seconds) -> bool:
+        return bool(state) and time.time() - state["fetched_at"] < freshness_seconds
+
+    def get_request_headers(self, state) -> dict:
+        # Conditional request headers, the server answers 304 if the page didn't change
+        request_headers = {}
+        if state and state["etag"]:
+            request_headers["If-None-Match"] = state["etag"]
+        if state and state["last_modified"]:
+            request_headers["If-Modified-Since"] = state["last_modified"]
+        return request_headers
+
+    def get_stale_urls_request_headers(self, desc, urls, freshness_seconds) -> dict:
+        # {url: conditional request headers} of the urls that have to be fetched again
+        stale_urls_request_headers = {}
+        for url in urls:
+            if not isinstance(url, str):
+                continue
+            state = self.get(desc, url)
+            if not self.is_fresh(state, freshness_seconds):
+                stale_urls_request_headers[url] = self.get_request_headers(state)
+        return stale_urls_request_headers
+
+class VendorStore:
+    # Indexed store of the rows of the steps (--store), merged crawl after crawl with upserts, WAL mode (readers never block the writers):
+    # - vendors: one row per profile link (rows with a "profile_link" column), the last scrape wins except for the values it didn't find
+    # - phones: one row per normalized phone number of the vendors ("*_number" columns), the profile link it was last seen on
+    # - links: the links of the link steps (header ["link"]), per step
+    # - step_rows: the rows of the other steps, per step and row hash
+    def __init__(self, filename=vendor_store_filename) -> None:
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=vendor_store_busy_seconds, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL") # WAL: durable at the checkpoints, a crash loses at most the last transactions
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS vendors (
+                profile_link TEXT NOT NULL, name TEXT, whatsapp_number TEXT, phonecall_number TEXT, step TEXT, scraped_at REAL, first_scraped_at REAL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS vendors_profile_link ON vendors (profile_link);
+            CREATE INDEX IF NOT EXISTS vendors_name ON vendors (name COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS phones (phone TEXT NOT NULL, profile_link TEXT, step TEXT, scraped_at REAL);
+            CREATE UNIQUE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+            CREATE TABLE IF NOT EXISTS links (step TEXT NOT NULL, link TEXT NOT NULL, scraped_at REAL, first_scraped_at REAL);
+            CREATE UNIQUE INDEX IF NOT EXISTS links_step_link ON links (step, link);
+            CREATE TABLE IF NOT EXISTS step_rows (step TEXT NOT NULL, row_hash TEXT NOT NULL, row TEXT, scraped_at REAL);
+            CREATE UNIQUE INDEX IF NOT EXISTS step_rows_step_row_hash ON step_rows (step, row_hash);
+        """)
+        self.connection.commit()
+
+    def upsert_rows(self, desc, header, rows) -> int:
+        # One transaction per batch, its cost is proportional to the batch (index lookups, no table scan); returns the rows stored
+        records = [dict(zip(header, row)) for row in rows]
+        scraped_at = time.time()
+        with self.connection:
+            if "profile_link" in header:
+                # A page without any data (e.g. not loaded) only has its url: it would store an empty vendor
+                records = [record for record in records if record["profile_link"] and any(value for col_name, value in record.items() if col_name != "profile_link")]
+                self.connection.executemany("""
+                    INSERT INTO vendors (profile_link, name, whatsapp_number, phonecall_number, step, scraped_at, first_scraped_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (profile_link) DO UPDATE SET
+                        name = COALESCE(NULLIF(excluded.name, ''), name), whatsapp_number = COALESCE(NULLIF(excluded.whatsapp_number, ''), whatsapp_number),
+                        phonecall_number = COALESCE(NULLIF(excluded.phonecall_number, ''), phonecall_number), step = excluded.step, scraped_at = excluded.scraped_at
+                """, [
+                    (record["profile_link"], record.get("name") or None, normalize_phone_number(record.get("whatsapp_number")) or None, normalize_phone_number(record.get("phonecall_number")) or None, desc, scraped_at, scraped_at)
+                    for record in records
+                ])
+                self.connection.executemany("""
+                    INSERT INTO phones (phone, profile_link, step, scraped_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (phone) DO UPDATE SET profile_link = excluded.profile_link, step = excluded.step, scraped_at = excluded.scraped_at
+                """, [
+                    (phone, record["profile_link"], desc, scraped_at)
+                    for record in records for phone in {normalize_phone_number(value) for col_name, value in record.items() if col_name.endswith("_number")} if phone
+                ])
+            elif header == ["link"]:
+                records = [record for record in records if record["link"]]
+                self.connection.executemany("""
+                    INSERT INTO links (step, link, scraped_at, first_scraped_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (step, link) DO UPDATE SET scraped_at = excluded.scraped_at
+                """, [(desc, record["link"], scraped_at, scraped_at) for record in records])
+            else:
+                records = [record for record in records if any(record.values())]
+                self.connection.executemany("""
+                    INSERT INTO step_rows (step, row_hash, row, scraped_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (step, row_hash) DO UPDATE SET scraped_at = excluded.scraped_at
+                """, [(desc, hash_row(list(record.values())).hex(), json.dumps(record), scraped_at) for record in records])
+        return len(records)
+
+    def query(self, sql, params=()) -> list:
+        cursor = self.connection.execute(sql, params)
+        col_names = [column[0] for column in cursor.description]
+        return [dict(zip(col_names, row)) for row in cursor.fetchall()]
+
+    def get_vendor(self, profile_link) -> dict:
+        vendors = self.query("SELECT * FROM vendors WHERE profile_link = ?", (profile_link,))
+        return vendors[0] if vendors else None
+
+    def find_vendor_by_phone(self, phone_number) -> dict:
+        vendors = self.query("SELECT vendors.* FROM phones JOIN vendors ON vendors.profile_link = phones.profile_link WHERE phones.phone = ?", (normalize_phone_number(phone_number),))
+        return vendors[0] if vendors else None
+
+    def find_vendors_by_name(self, name_prefix, limit=100) -> list:
+        # Prefix match (uses the name index), case insensitive
+        name_prefix = name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return self.query("SELECT * FROM vendors WHERE name LIKE ? ESCAPE '\\' ORDER BY name COLLATE NOCASE LIMIT ?", (f"{name_prefix}%", limit))
+
+    def iter_table(self, table, batch_rows=10000):
+        # Rows of a table in batches (keyset pagination on the rowid, bounded memory)
+        if table not in ["vendors", "phones", "links", "step_rows"]:
+            raise ValueError(f'Invalid table specified: {table}')
+        last_rowid = 0
+        while True:
+            rows = self.query(f"SELECT rowid AS store_rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_rows))
+            if not rows:
+                break
+            last_rowid = rows[-1]["store_rowid"]
+            for row in rows:
+                del row["store_rowid"]
+            yield rows
+
+    def get_table_header(self, table) -> list:
+        return [column[1] for column in self.connection.execute(f"PRAGMA table_info({table})")]
+
+    def export(self, table, filename, output_format="csv") -> None:
+        # A table into a csv or parquet file, written to a temporary file first then renamed over filename
+        header = self.get_table_header(table)
+        temp_filename = f"{filename}.tmp{os.getpid()}"
+        if output_format == "csv":
+            with open(temp_filename, "w", encoding="utf-8", newline="") as export_file:
+                writer = csv.writer(export_file, lineterminator="\n")
+                writer.writerow(header)
+                for rows in self.iter_table(table):
+                    writer.writerows([row[col_name] for col_name in header] for row in rows)
+        elif output_format == "parquet":
+            check_pyarrow(output_format)
+            with pq.ParquetWriter(temp_filename, pa.schema([(col_name, pa.string()) for col_name in header])) as writer:
+                for rows in self.iter_table(table):
+                    writer.write_table(pa.Table.from_arrays([pa.array([None if row[col_name] is None else str(row[col_name]) for row in rows], pa.string()) for col_name in header], names=header))
+        else:
+            raise ValueError(f'Invalid export format specified: {output_format}')
+        os.replace(temp_filename, filename)
+
+    def close(self) -> None:
+        self.connection.close()
+
+class UrlFrontier:
+    # Seen-set of the urls of the steps of a run: an url is fetched by the first link that claims it, the other links (and pagination pages)
+    # with the same canonical url (per step rules, see canonicalize_url) are skipped before any navigation. Compact (64 bits hash of the
+    # canonical url per url), kept with the checkpoints (a resumed link claims its urls again), cleared when a step starts from scratch
+    def __init__(self, filename=url_frontier_filename) -> None:
+        self.filename = filename
+        self.process_connection = ProcessConnection(self.connect)
+        self.steps_url_rules = {}
+
+    def connect(self) -> sqlite3.Connection:
+        if self.filename != ":memory:":
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        connection = sqlite3.connect(self.filename, timeout=60, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS seen_urls (step TEXT, url_key INTEGER, link_index INTEGER, PRIMARY KEY (step, url_key)) WITHOUT ROWID")
+        connection.commit()
+        return connection
+
+    def set_step_url_rules(self, desc, url_rules=None) -> None:
+        self.steps_url_rules[desc] = {**default_url_rules, **(url_rules if url_rules else {})}
+
+    def get_url_key(self, desc, url) -> int:
+        canonical_url = canonicalize_url(url, self.steps_url_rules.get(desc, default_url_rules))
+        return int.from_bytes(hashlib.blake2b(canonical_url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+    def claim_urls(self, desc, link_urls) -> list:
+        # link_urls: [(link index, url)], returns for each url True if it's new in the step or already claimed by the same link (resumed),
+        # False if another link claimed it: a duplicate not to be fetched. One transaction for all the urls
+        url_keys = [self.get_url_key(desc, url) for _, url in link_urls]
+        with self.process_connection.acquire() as connection:
+            with connection:
+                connection.executemany("INSERT OR IGNORE INTO seen_urls VALUES (?, ?, ?)", [(desc, url_key, link_index) for url_key, (link_index, _) in zip(url_keys, link_urls)])
+                claimed_link_indexes = [connection.execute("SELECT link_index FROM seen_urls WHERE step = ? AND url_key = ?", (desc, url_key)).fetchone()[0] for url_key in url_keys]
+        is_urls_claimed = [claimed_link_index == link_index for claimed_link_index, (link_index, _) in zip(claimed_link_indexes, link_urls)]
+        if not all(is_urls_claimed):
+            metrics_registry.inc("scrap_duplicate_urls_total", is_urls_claimed.count(False))
+        return is_urls_claimed
+
+    def reset_step(self, desc) -> None:
+        with self.process_connection.acquire() as connection:
+            with connection:
+                connection.execute("DELETE FROM seen_urls WHERE step = ?", (desc,))
+
+    def close(self) -> None:
+        self.process_connection.close()
+
+class StepCache:
+    # Memoization of the steps: the output of a finished step is copied into the cache under the fingerprint of the step (see
+    # get_step_fingerprint), a next run of the step with the same fingerprint restores it instead of scraping again.
+    # The index file holds the entries' times and sizes; the expired entries and the least recently used ones beyond the limits are evicted
+    def __init__(self, cache_dirname=step_cache_dirname, ttl_seconds=step_cache_ttl_seconds, max_entries=step_cache_max_entries, max_bytes=step_cache_max_bytes) -> None:
+        self.cache_dirname = cache_dirname
+        self.index_filename = os.path.join(cache_dirname, "index.json")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index = {}
+        os.makedirs(cache_dirname, exist_ok=True)
+        if os.path.exists(self.index_filename):
+            try:
+                with open(self.index_filename, "r", encoding="utf-8") as index_file:
+                    self.index = json.load(index_file)
+            except ValueError:
+                self.index = {} # corrupted index: the cache starts empty
+
+    def write_index(self) -> None:
+        temp_index_filename = f"{self.index_filename}.tmp{os.getpid()}"
+        with open(temp_index_filename, "w", encoding="utf-8") as index_file:
+            json.dump(self.index, index_file)
+        os.replace(temp_index_filename, self.index_filename)
+
+    def get_entry_dirname(self, fingerprint) -> str:
+        return os.path.join(self.cache_dirname, fingerprint)
+
+    def is_expired(self, entry) -> bool:
+        return time.time() - entry["created_at"] >= self.ttl_seconds
+
+    def remove_entry(self, fingerprint) -> None:
+        self.index.pop(fingerprint, None)
+        shutil.rmtree(self.get_entry_dirname(fingerprint), ignore_errors=True)
+
+    def evict(self) -> None:
+        for fingerprint, entry in list(self.index.items()):
+            if self.is_expired(entry) or not os.path.exists(self.get_entry_dirname(fingerprint)):
+                self.remove_entry(fingerprint)
+        least_recently_used_fingerprints = sorted(self.index, key=lambda fingerprint: self.index[fingerprint]["used_at"])
+        while least_recently_used_fingerprints and (len(self.index) > self.max_entries or sum(entry["bytes"] for entry in self.index.values()) > self.max_bytes):
+            self.remove_entry(least_recently_used_fingerprints.pop(0))
+        # Entries of an interrupted store
+        for entry_dirname in glob.glob(os.path.join(glob.escape(self.cache_dirname), "*.tmp*")):
+            shutil.rmtree(entry_dirname, ignore_errors=True)
+        self.write_index()
+
+    def restore(self, step_params) -> bool:
+        # Copy the cached output of the step over its output file if its fingerprint didn't change and it didn't expire
+        fingerprint = get_step_fingerprint(step_params)
+        entry = self.index.get(fingerprint)
+        if not entry or self.is_expired(entry):
+            return False
+        output_format = step_params.get("output_format", "csv")
+        filename = output_filename_checker(step_params["write_csv_file_name"], output_format)
+        cached_filename = os.path.join(self.get_entry_dirname(fingerprint), os.path.basename(filename))
+        temp_filename = output_filename_checker(temp_output_filename(filename), output_format)
+        try:
+            if os.path.isdir(cached_filename):
+                shutil.copytree(cached_filename, temp_filename)
+            else:
+                shutil.copyfile(cached_filename, temp_filename)
+        except OSError as e:
+            logging.error(f"<{step_params['desc']}> restore of the cached output failed: {e}", exc_info=True)
+            print(f"<{step_params['desc']}> restore of the cached output failed: {e}")
+            self.remove_entry(fingerprint)
+            self.write_index()
+            return False
+        csv_file_manager.replace_output(temp_filename, filename, output_format)
+        entry["used_at"] = time.time()
+        self.write_index()
+        return True
+
+    def store(self, step_params) -> None:
+        # Copy the output of the finished step into the cache (the fingerprint is taken now: in pipeline mode the input was written meanwhile)
+        fingerprint = get_step_fingerprint(step_params)
+        output_format = step_params.get("output_format", "csv")
+        filename = output_filename_checker(step_params["write_csv_file_name"], output_format)
+        if not os.path.exists(filename):
+            return
+        entry_dirname = self.get_entry_dirname(fingerprint)
+        temp_entry_dirname = f"{entry_dirname}.tmp{os.getpid()}"
+        cached_filename = os.path.join(temp_entry_dirname, os.path.basename(filename))
+        os.makedirs(temp_entry_dirname, exist_ok=True)
+        if os.path.isdir(filename):
+            shutil.copytree(filename, cached_filename)
+        else:
+            shutil.copyfile(filename, cached_filename)
+        shutil.rmtree(entry_dirname, ignore_errors=True)
+        os.replace(temp_entry_dirname, entry_dirname)
+        cached_bytes = sum(os.path.getsize(part_filename) for part_filename in glob.glob(os.path.join(glob.escape(entry_dirname), "**"), recursive=True) if os.path.isfile(part_filename))
+        self.index[fingerprint] = {"desc": step_params["desc"], "created_at": time.time(), "used_at": time.time(), "bytes": cached_bytes}
+        self.evict()
+
+class SQLiteWorkQueue:
+    # Distributed mode: work queue shared by the nodes of a crawl through a sqlite file on a shared filesystem. It holds the links of
+    # every step, leased in batches by the nodes' workers, and the rows they scraped, deduplicated across the nodes.
+    # Rollback journal (WAL needs shared memory between the processes, not possible across machines) and immediate transactions.
+    # The leases expire on the nodes' wall clocks, which should be in sync (ntp)
+    def __init__(self, filename) -> None:
+        self.filename = filename
+        self.process_connection = ProcessConnection(self.connect)
+        with self.process_connection.acquire():
+            pass # the queue's file is created (or found unreachable) before any step starts
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.filename, timeout=60, isolation_level=None, check_same_thread=False)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS links (
+                desc TEXT, link_index INTEGER, link TEXT, status TEXT DEFAULT 'pending', node TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0, resume_url TEXT,
+                PRIMARY KEY (desc, link_index)
+            );
+            CREATE INDEX IF NOT EXISTS links_status ON links (desc, status);
+            CREATE TABLE IF NOT EXISTS results (desc TEXT, hash BLOB, row TEXT, UNIQUE (desc, hash));
+        """)
+        return connection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.process_connection.acquire() as connection:
+            connection.execute("BEGIN IMMEDIATE") # write lock taken upfront: 2 nodes never deadlock upgrading their read locks
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def add_links(self, desc, links) -> None:
+        # Every node adds the same links (links already added are kept), the links failed in a previous run are retried
+        with self.transaction() as connection:
+            connection.executemany("INSERT OR IGNORE INTO links (desc, link_index, link) VALUES (?, ?, ?)", ((desc, link_index, link) for link_index, link in enumerate(links)))
+            connection.execute("UPDATE links SET status = 'pending', attempts = 0 WHERE desc = ? AND status = 'failed'", (desc,))
+
+    def lease(self, desc, node_id, count, lease_seconds) -> list:
+        # Lease up to count links, pending or whose lease expired (their node died): [(link index, link, resume url)]
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute("UPDATE links SET status = 'failed', node = NULL WHERE desc = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?", (desc, now, work_queue_max_attempts))
+            leased_links = connection.execute("SELECT link_index, link, resume_url FROM links WHERE desc = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) ORDER BY link_index LIMIT ?", (desc, now, count)).fetchall()
+            connection.executemany("UPDATE links SET status = 'leased', node = ?, lease_expires = ?, attempts = attempts + 1 WHERE desc = ? AND link_index = ?", ((node_id, now + lease_seconds, desc, link_index) for link_index, _, _ in leased_links))
+        return leased_links
+
+    def heartbeat(self, desc, node_id, lease_seconds, resume_urls=None) -> None:
+        # Extend the leases of the node, and store the urls its paginated links are continued from if they're reissued
+        resume_urls = resume_urls if resume_urls else {}
+        with self.transaction() as connection:
+            connection.execute("UPDATE links SET lease_expires = ? WHERE desc = ? AND node = ? AND status = 'leased'", (time.time() + lease_seconds, desc, node_id))
+            connection.executemany("UPDATE links SET resume_url = ? WHERE desc = ? AND link_index = ? AND node = ? AND status = 'leased'", ((url, desc, link_index, node_id) for link_index, url in resume_urls.items()))
+
+    def ack(self, desc, node_id, done_link_indexes, failed_link_indexes=None) -> None:
+        # done: the rows of the links are in the results, failed: released for a retry by any node until their attempts run out.
+        # Only the links still leased by the node are acked: a link whose lease expired and was leased again is the other node's
+        failed_link_indexes = failed_link_indexes if failed_link_indexes else []
+        with self.transaction() as connection:
+            connection.executemany("UPDATE links SET status = 'done', node = NULL, resume_url = NULL WHERE desc = ? AND link_index = ? AND node = ? AND status = 'leased'", ((desc, link_index, node_id) for link_index in done_link_indexes))
+            connection.executemany("UPDATE links SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, node = NULL WHERE desc = ? AND link_index = ? AND node = ? AND status = 'leased'", ((work_queue_max_attempts, desc, link_index, node_id) for link_index in failed_link_indexes))
+
+    def release_node_leases(self, desc, node_id) -> None:
+        # The node stops working on the step, its links not done are left to the other nodes without waiting for their leases to expire
+        with self.transaction() as connection:
+            connection.execute("UPDATE links SET status = 'pending', node = NULL WHERE desc = ? AND node = ? AND status = 'leased'", (desc, node_id))
+
+    def is_leased_by_other_nodes(self, desc, node_id) -> bool:
+        with self.transaction() as connection:
+            return connection.execute("SELECT 1 FROM links WHERE desc = ? AND status = 'leased' AND node != ? LIMIT 1", (desc, node_id)).fetchone() is not None
+
+    def get_status_counts(self, desc) -> dict:
+        with self.transaction() as connection:
+            return dict(connection.execute("SELECT status, COUNT(*) FROM links WHERE desc = ? GROUP BY status", (desc,)).fetchall())
+
+    def add_results(self, desc, rows) -> int:
+        # Returns the no. of rows added, the empty rows and the rows already added by any node are dropped
+        with self.transaction() as connection:
+            return sum(connection.execute("INSERT OR IGNORE INTO results VALUES (?, ?, ?)", (desc, hash_row(row), json.dumps(row))).rowcount for row in rows if any(row))
+
+    def iter_results(self, desc, batch_rows=10000):
+        # The rows of the step in the order they were added, batch by batch
+        last_rowid = 0
+        while True:
+            with self.transaction() as connection:
+                results = connection.execute("SELECT rowid, row FROM results WHERE desc = ? AND rowid > ? ORDER BY rowid LIMIT ?", (desc, last_rowid, batch_rows)).fetchall()
+            if not results:
+                return
+            last_rowid = results[-1][0]
+            for _, row in results:
+                yield tuple(json.loads(row))
+
+    def reset(self) -> None:
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM links")
+            connection.execute("DELETE FROM results")
+
+class MemoryWorkQueue:
+    # Stand-in for a Redis server in the process (same operations as SQLiteWorkQueue): for a single node, or to try the distributed mode
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.links = {} # {desc: {link index: {"link", "status", "node", "lease_expires", "attempts", "resume_url"}}}
+        self.results = {} # {desc: {row hash: row}}, in the order the rows were added
+
+    def add_links(self, desc, links) -> None:
+        with self.lock:
+            step_links = self.links.setdefault(desc, {})
+            for link_index, link in enumerate(links):
+                step_links.setdefault(link_index, {"link": link, "status": "pending", "node": None, "lease_expires": 0, "attempts": 0, "resume_url": None})
+            for link_state in step_links.values():
+                if link_state["status"] == "failed":
+                    link_state.update(status="pending", attempts=0)
+
+    def lease(self, desc, node_id, count, lease_seconds) -> list:
+        now = time.time()
+        leased_links = []
+        with self.lock:
+            for link_index, link_state in sorted(self.links.get(desc, {}).items()):
+                is_expired = link_state["status"] == "leased" and link_state["lease_expires"] < now
+                if is_expired and link_state["attempts"] >= work_queue_max_attempts:
+                    link_state.update(status="failed", node=None)
+                elif len(leased_links) < count and (link_state["status"] == "pending" or is_expired):
+                    link_state.update(status="leased", node=node_id, lease_expires=now + lease_seconds, attempts=link_state["attempts"] + 1)
+                    leased_links.append((link_index, link_state["link"], link_state["resume_url"]))
+        return leased_links
+
+    def heartbeat(self, desc, node_id, lease_seconds, resume_urls=None) -> None:
+        resume_urls = resume_urls if resume_urls else {}
+        with self.lock:
+            for link_index, link_state in self.links.get(desc, {}).items():
+                if link_state["status"] == "leased" and link_state["node"] == node_id:
+                    link_state["lease_expires"] = time.time() + lease_seconds
+                    link_state["resume_url"] = resume_urls.get(link_index, link_state["resume_url"])
+
+    def ack(self, desc, node_id, done_link_indexes, failed_link_indexes=None) -> None:
+        failed_link_indexes = failed_link_indexes if failed_link_indexes else []
+        with self.lock:
+            step_links = self.links.get(desc, {})
+            is_leased_by_node = lambda link_index: step_links[link_index]["status"] == "leased" and step_links[link_index]["node"] == node_id
+            for link_index in done_link_indexes:
+                if is_leased_by_node(link_index):
+                    step_links[link_index].update(status="done", node=None, resume_url=None)
+            for link_index in failed_link_indexes:
+                if is_leased_by_node(link_index):
+                    step_links[link_index].update(status="failed" if step_links[link_index]["attempts"] >= work_queue_max_attempts else "pending", node=None)
+
+    def release_node_leases(self, desc, node_id) -> None:
+        with self.lock:
+            for link_state in self.links.get(desc, {}).values():
+                if link_state["status"] == "leased" and link_state["node"] == node_id:
+                    link_state.update(status="pending", node=None)
+
+    def is_leased_by_other_nodes(self, desc, node_id) -> bool:
+        with self.lock:
+            return any(link_state["status"] == "leased" and link_state["node"] != node_id for link_state in self.links.get(desc, {}).values())
+
+    def get_status_counts(self, desc) -> dict:
+        with self.lock:
+            status_counts = {}
+            for link_state in self.links.get(desc, {}).values():
+                status_counts[link_state["status"]] = status_counts.get(link_state["status"], 0) + 1
+            return status_counts
+
+    def add_results(self, desc, rows) -> int:
+        with self.lock:
+            step_results = self.results.setdefault(desc, {})
+            results_count = len(step_results)
+            for row in rows:
+                if any(row):
+                    step_results.setdefault(hash_row(row), tuple(row))
+            return len(step_results) - results_count
+
+    def iter_results(self, desc, batch_rows=10000):
+        with self.lock:
+            rows = list(self.results.get(desc, {}).values())
+        yield from rows
+
+    def reset(self) -> None:
+        with self.lock:
+            self.links = {}
+            self.results = {}
+
+def create_work_queue(url):
+    # "sqlite:///path/on/shared/filesystem.sqlite" (or a path) to share the work between several nodes, "memory://" in the process
+    if url.startswith("memory://"):
+        return MemoryWorkQueue()
+    return SQLiteWorkQueue(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url)
+
+class WorkQueueSink:
+    # Distributed mode: the rows are written into the work queue's results, deduplicated across all the nodes
+    def __init__(self, work_queue, desc) -> None:
+        self.work_queue = work_queue
+        self.desc = desc
+
+    def truncate(self) -> None:
+        pass
+
+    def open(self) -> None:
+        pass
+
+    def write_rows(self, rows) -> None:
+        rows_count = self.work_queue.add_results(self.desc, rows)
+        metrics_registry.inc("scrap_duplicate_rows_total", len(rows) - rows_count)
+
+    def close(self) -> None:
+        pass
+
+class WorkQueueLinks:
+    # Distributed mode: the links of a step leased from the work queue by the workers of this node (shared by them like a QueueLinks),
+    # a heartbeat thread keeps the leases alive while the links are scraped. It is also the workers' checkpoint journal: a link is
+    # acked once its last page is flushed into the work queue's results, a failed link is released for a retry
+    def __init__(self, work_queue, desc, node_id=None, lease_seconds=None) -> None:
+        self.work_queue = work_queue
+        self.desc = desc
+        self.node_id = node_id if node_id else work_queue_node_id
+        self.lease_seconds = lease_seconds if lease_seconds else work_queue_lease_seconds
+        self.lock = threading.Lock()
+        self.resume_urls = {}
+        self.pending_resume_urls = {}
+        self.done_link_indexes = []
+        self.failed_link_indexes = []
+        self.stopped = threading.Event()
+        self.heartbeat_thread = threading.Thread(target=self.heartbeat_periodically, daemon=True)
+        self.heartbeat_thread.start()
+
+    def iter_windows(self, size):
+        while True:
+            self.commit()
+            leased_links = self.work_queue.lease(self.desc, self.node_id, size, self.lease_seconds)
+            if leased_links:
+                with self.lock:
+                    self.resume_urls.update({link_index: resume_url for link_index, _, resume_url in leased_links if resume_url})
+                yield [(link_index, link) for link_index, link, _ in leased_links]
+            elif self.work_queue.is_leased_by_other_nodes(self.desc, self.node_id):
+                time.sleep(work_queue_poll_seconds) # the links of a node that dies are reissued once its leases expire
+            else:
+                return
+
+    def is_link_done(self, link_index) -> bool:
+        return False # only the links not done are leased
+
+    def get_resume_url(self, link_index) -> str:
+        return self.resume_urls.get(link_index)
+
+    def record_flush(self, rows_count, done_link_index=None) -> None:
+        if done_link_index is not None:
+            with self.lock:
+                self.done_link_indexes.append(done_link_index)
+
+    def record_resume_url(self, link_index, url) -> None:
+        with self.lock:
+            self.pending_resume_urls[link_index] = url
+
+    def record_failure(self, link_index) -> None:
+        with self.lock:
+            self.failed_link_indexes.append(link_index)
+
+    def commit(self) -> None:
+        # Ack the done and failed links in one transaction (with the next lease)
+        with self.lock:
+            done_link_indexes, self.done_link_indexes = self.done_link_indexes, []
+            failed_link_indexes, self.failed_link_indexes = self.failed_link_indexes, []
+        if done_link_indexes or failed_link_indexes:
+            self.work_queue.ack(self.desc, self.node_id, done_link_indexes, failed_link_indexes)
+
+    def heartbeat_periodically(self) -> None:
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                resume_urls, self.pending_resume_urls = self.pending_resume_urls, {}
+            try:
+                self.work_queue.heartbeat(self.desc, self.node_id, self.lease_seconds, resume_urls)
+            except Exception as e:
+                logging.error(f"Work queue heartbeat of {self.desc} failed: {e}", exc_info=True)
+                print(f"Work queue heartbeat of {self.desc} failed: {e}")
+
+    def create_sink(self):
+        return WorkQueueSink(self.work_queue, self.desc)
+
+    def close(self) -> None:
+        self.commit() # a worker is done, the other workers of the node may still be leasing
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.heartbeat_thread.join()
+        self.close()
+        self.work_queue.release_node_leases(self.desc, self.node_id)
+
+    def is_step_finished(self) -> bool:
+        # Every link of the step is done on one node or another
+        status_counts = self.work_queue.get_status_counts(self.desc)
+        print(f"<{self.desc}> work queue: {status_counts}")
+        return set(status_counts) <= {"done"}
+
+    def export_results(self, filename, header, output_format="csv") -> None:
+        # The rows of all the nodes into this node's output file (the next step reads it), replaced atomically
+        temp_filename = temp_output_filename(filename)
+        step_writer = StepWriter(temp_filename, header, output_format, truncate=True)
+        step_writer.write_rows(self.work_queue.iter_results(self.desc))
+        step_writer.close()
+        csv_file_manager.replace_output(temp_filename, filename, output_format)
+
+web_scraper_engines = {"browser": WebScraper, "http": HttpScraper}
+
+def create_browser_driver(browser_profile="default", page_load_strategy=None):
+    # Chrome driver set up from a profile of browser_profiles (page_load_strategy overrides the profile's)
+    if browser_profile not in browser_profiles:
+        raise ValueError(f'Invalid browser profile specified: {browser_profile}')
+    profile = browser_profiles[browser_profile]
+    options = webdriver.ChromeOptions()
+    if profile.get("headless"):
+        options.add_argument("--headless=new")
+    if page_load_strategy or profile.get("page_load_strategy"):
+        options.page_load_strategy = page_load_strategy if page_load_strategy else profile["page_load_strategy"]
+    if profile.get("disable_images"):
+        options.add_argument("--blink-settings=imagesEnabled=false") # no image decoding
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    if profile.get("disk_cache_bytes"):
+        options.add_argument(f"--disk-cache-size={profile['disk_cache_bytes']}")
+    if profile.get("media_cache_bytes"):
+        options.add_argument(f"--media-cache-size={profile['media_cache_bytes']}")
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(browser_navigation_timeout)
+    if profile.get("blocked_url_patterns"):
+        # The requests are blocked by the browser's network stack (DevTools), they never leave the browser
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": profile["blocked_url_patterns"]})
+        except Exception as e:
+            logging.error(f"Failed to block the urls of the browser profile {browser_profile}: {e}", exc_info=True)
+            print(f"Failed to block the urls of the browser profile {browser_profile}: {e}")
+    return driver
+
+def create_web_scraper(engine, url, browser_profile="default", ready_conditions=None):
+    if engine not in web_scraper_engines:
+        raise ValueError(f'Invalid engine specified: {engine}')
+    if engine == "browser":
+        web_scraper = WebScraper(url, browser_profile, "none" if ready_conditions else None) # the ready conditions replace the load event
+        web_scraper.ready_conditions = ready_conditions if ready_conditions else []
+        return web_scraper
+    return web_scraper_engines[engine](url)
+
+def set_page_archive(mode, archive_dirname=page_archive_dirname):
+    # mode: None (no archive), "capture" (store every fetched page) or "replay" (serve every page from the archive)
+    global page_archive, page_archive_mode
+    page_archive_mode = mode
+    page_archive = PageArchive(archive_dirname) if mode else None
+
+class MetricsRegistry:
+    # Counters and latency histograms labelled by step (the recording thread's step, see set_metrics_step) and phase,
+    # rendered in the prometheus text format for the metrics endpoint and summarized into a json file at the end of the run.
+    # The workers processes of a replay step record into their own copy, lost when they exit
+    def __init__(self, buckets=None) -> None:
+        self.buckets = buckets if buckets else metrics_latency_buckets
+        self.lock = threading.Lock()
+        self.counters = {} # {(name, labels): value}
+        self.histograms = {} # {(name, labels): {"buckets": counts per bucket (+Inf last), "sum": seconds, "count": n}}
+        self.gauges = {} # {(name, labels): last value}
+        self.steps_activity = {} # {step: [first, last record time]}, for the per second rates
+
+    def get_labels(self, labels) -> tuple:
+        return tuple(sorted({"step": get_metrics_step(), **labels}.items()))
+
+    def record_activity(self, labels) -> None:
+        step = dict(labels)["step"]
+        now = time.time()
+        self.steps_activity.setdefault(step, [now, now])[1] = now
+
+    def inc(self, name, value=1, **labels) -> None:
+        labels = self.get_labels(labels)
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+            self.record_activity(labels)
+
+    def set(self, name, value, **labels) -> None:
+        labels = self.get_labels(labels)
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def inc_global(self, name, value=1, **labels) -> None:
+        # A metric of the whole run (a host, a browser), not of the step of the thread that happens to record it.
+        # Rendered on the metrics endpoint, not in the per step summary
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def set_global(self, name, value, **labels) -> None:
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name, seconds, **labels) -> None:
+        labels = self.get_labels(labels)
+        bucket_index = next((index for index, upper_bound in enumerate(self.buckets) if seconds <= upper_bound), len(self.buckets))
+        with self.lock:
+            histogram = self.histograms.setdefault((name, labels), {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+            histogram["buckets"][bucket_index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            self.record_activity(labels)
+
+    @contextlib.contextmanager
+    def measure(self, phase, trace_attributes=None, **labels):
+        # Time the block into scrap_phase_duration_seconds, count it into scrap_phase_errors_total if it raises.
+        # With --trace the block is a span too (trace_attributes: its attributes that aren't metric labels, e.g. an action's selectors)
+        start_time = time.perf_counter()
+        span = tracer.start_span(phase, **labels, **(trace_attributes if trace_attributes else {}))
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            self.inc("scrap_phase_errors_total", phase=phase, **labels)
+            raise
+        finally:
+            self.observe("scrap_phase_duration_seconds", time.perf_counter() - start_time, phase=phase, **labels)
+            tracer.end_span(span, error)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{format_metric_labels(labels)} {value}" for (counter_name, labels), value in sorted(self.counters.items()) if counter_name == name)
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{format_metric_labels(labels)} {value}" for (gauge_name, labels), value in sorted(self.gauges.items()) if gauge_name == name)
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative_counts = itertools.accumulate(histogram["buckets"])
+                    for upper_bound, cumulative_count in zip(self.buckets + ["+Inf"], cumulative_counts):
+                        lines.append(f"{name}_bucket{format_metric_labels(labels + (('le', upper_bound),))} {cumulative_count}")
+                    lines.append(f"{name}_sum{format_metric_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{format_metric_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def get_summary(self) -> dict:
+        # {step: {"pages", "page_errors", "error_rate", "pages_per_second", "p50/p95_page_seconds", "counters", "gauges", "phases"}}
+        summary = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if "step" not in labels:
+                    continue # inc_global counters
+                step_summary = summary.setdefault(labels["step"], {"counters": {}, "gauges": {}, "phases": {}})
+                counter_key = "/".join([name] + [str(value) for key, value in sorted(labels.items()) if key != "step"])
+                step_summary["counters"][counter_key] = value
+            for (name, labels), value in self.gauges.items():
+                labels = dict(labels)
+                if "step" not in labels:
+                    continue
+                step_summary = summary.setdefault(labels["step"], {"counters": {}, "gauges": {}, "phases": {}})
+                step_summary["gauges"]["/".join([name] + [str(value) for key, value in sorted(labels.items()) if key != "step"])] = value
+            for (name, labels), histogram in self.histograms.items():
+                labels = dict(labels)
+                step_summary = summary.setdefault(labels["step"], {"counters": {}, "gauges": {}, "phases": {}})
+                phase_key = "/".join([labels["phase"]] + [str(value) for key, value in sorted(labels.items()) if key not in ["step", "phase"]]) if name == "scrap_phase_duration_seconds" else name
+                step_summary["phases"][phase_key] = {
+                    "count": histogram["count"],
+                    "sum_seconds": round(histogram["sum"], 6),
+                    "p50_seconds": round(histogram_quantile(self.buckets, histogram["buckets"], histogram["count"], 0.5), 6),
+                    "p95_seconds": round(histogram_quantile(self.buckets, histogram["buckets"], histogram["count"], 0.95), 6),
+                }
+            for step, step_summary in summary.items():
+                first_time, last_time = self.steps_activity.get(step, [0, 0])
+                pages = step_summary["counters"].get("scrap_pages_total", 0)
+                page_errors = step_summary["counters"].get("scrap_page_errors_total", 0)
+                page_latency = step_summary["phases"].get("scrap_page_duration_seconds", {})
+                step_summary.update({
+                    "pages": pages,
+                    "page_errors": page_errors,
+                    "error_rate": page_errors / pages if pages else 0,
+                    "pages_per_second": pages / (last_time - first_time) if last_time > first_time else 0,
+                    "p50_page_seconds": page_latency.get("p50_seconds", 0),
+                    "p95_page_seconds": page_latency.get("p95_seconds", 0),
+                })
+        return summary
+
+    def write_summary(self, filename=metrics_summary_filename) -> None:
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(self.get_summary(), file, indent=2, sort_keys=True)
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    # GET /metrics: prometheus text format, GET /metrics.json: the json summary so far
+    def do_GET(self) -> None:
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(metrics_registry.get_summary()).encode("utf-8"), "application/json"
+        else:
+            body, content_type = metrics_registry.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass # no access log on stderr
+
+def start_metrics_server(port):
+    # Local metrics endpoint, served by a daemon thread until the run exits
+    metrics_server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+    threading.Thread(target=metrics_server.serve_forever, name="metrics_server", daemon=True).start()
+    print(f"Metrics: http://127.0.0.1:{metrics_server.server_address[1]}/metrics")
+    return metrics_server
+
+class MemorySink:
+    # Daemon mode: the rows of an urls job are answered to the client instead of written into a file
+    def __init__(self) -> None:
+        self.rows = []
+
+    def truncate(self) -> None:
+        pass
+
+    def open(self) -> None:
+        pass
+
+    def write_rows(self, rows) -> None:
+        self.rows.extend(rows)
+
+    def close(self) -> None:
+        pass
+
+class JobJournal:
+    # Daemon mode: an urls job has nothing to resume, only its failed links are kept (answered to the client)
+    def __init__(self, links) -> None:
+        self.links = links
+        self.failed_links = []
+
+    def is_link_done(self, link_index) -> bool:
+        return False
+
+    def get_resume_url(self, link_index) -> str:
+        return None
+
+    def record_flush(self, rows_count, done_link_index=None) -> None:
+        pass
+
+    def record_resume_url(self, link_index, url) -> None:
+        pass
+
+    def record_failure(self, link_index) -> None:
+        self.failed_links.append(self.links[link_index])
+
+    def close(self) -> None:
+        pass
+
+class ScraperPool:
+    # Daemon mode: scrapers kept warm between the jobs (browser started, session cookies set by the start url), per scraper config.
+    # A job borrows an idle one, or a new one if they're all busy; the pool keeps up to size idle scrapers of a config
+    def __init__(self, size=daemon_browsers) -> None:
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle_scrapers = {} # {scraper config: queue of idle scrapers}
+
+    def get_key(self, step_params) -> tuple:
+        return (step_params.get("engine", "browser"), step_params.get("browser_profile", "default"), json.dumps(step_params.get("ready_conditions")))
+
+    def get_idle_scrapers(self, step_params) -> queue.Queue:
+        with self.lock:
+            return self.idle_scrapers.setdefault(self.get_key(step_params), queue.Queue())
+
+    def get_idle_counts(self) -> dict:
+        # {scraper config: no. of idle scrapers}, under the lock: a job may add a config meanwhile
+        with self.lock:
+            return {" ".join(key): idle_scrapers.qsize() for key, idle_scrapers in self.idle_scrapers.items()}
+
+    def create_scraper(self, step_params):
+        return create_web_scraper(step_params.get("engine", "browser"), default_link, step_params.get("browser_profile", "default"), step_params.get("ready_conditions"))
+
+    def warm_up(self, steps_params) -> None:
+        for step_params in {self.get_key(step_params): step_params for step_params in steps_params}.values():
+            idle_scrapers = self.get_idle_scrapers(step_params)
+            while idle_scrapers.qsize() < self.size:
+                pool_web_scraper = self.create_scraper(step_params)
+                pool_web_scraper.navigate_to_page(default_link)
+                idle_scrapers.put(pool_web_scraper)
+            print(f"Warm scrapers: {self.size} {self.get_key(step_params)}")
+
+    @contextlib.contextmanager
+    def borrow(self, step_params):
+        idle_scrapers = self.get_idle_scrapers(step_params)
+        try:
+            pool_web_scraper = idle_scrapers.get_nowait()
+        except queue.Empty:
+            pool_web_scraper = self.create_scraper(step_params) # all busy: a cold one, kept if the pool has room when it's given back
+        try:
+            yield pool_web_scraper
+        finally:
+            if idle_scrapers.qsize() < self.size:
+                idle_scrapers.put(pool_web_scraper)
+            else:
+                pool_web_scraper.close_browser()
+
+    def close(self) -> None:
+        with self.lock:
+            for idle_scrapers in self.idle_scrapers.values():
+                while not idle_scrapers.empty():
+                    idle_scrapers.get_nowait().close_browser()
+
+class ScraperDaemonRequestHandler(http.server.BaseHTTPRequestHandler):
+    # GET /health: the steps and the idle scrapers of the pool
+    # POST /jobs {"step": N, "urls": [...]}: scrap the urls with the actions of step N on a warm scraper, answers the rows (no output file)
+    # POST /jobs {"step": N, "force": false}: run step N as a normal run does (output file, checkpoint, step cache), one step job at a time
+    def do_GET(self) -> None:
+        if not self.path.startswith("/health"):
+            self.send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        self.send_json(200, {"steps": [step_params["desc"] for step_params in self.server.steps_params], "idle_scrapers": scraper_pool.get_idle_counts()})
+
+    def do_POST(self) -> None:
+        if not self.path.startswith("/jobs"):
+            self.send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            step_number = int(job["step"])
+            if not 1 <= step_number <= len(self.server.steps_params):
+                raise ValueError(f"Invalid step specified: {step_number}")
+            step_params = self.server.steps_params[step_number - 1]
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": f"Invalid job: {e}"})
+            return
+        try:
+            result = run_urls_job(step_params, job["urls"]) if job.get("urls") else run_step_job(step_params, job.get("force", False))
+        except Exception as e:
+            logging.error(f"Daemon job {job} failed: {e}", exc_info=True)
+            print(f"Daemon job {job} failed: {e}")
+            self.send_json(500, {"error": str(e)})
+            return
+        self.send_json(200, result)
+
+    def send_json(self, status, data) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass # no access log on stderr
+
+class Tracer:
+    # Opt-in tracing (--trace): a span tree per link (link > page > navigate, wait, extract actions, pagination click, flush), the phases
+    # timed by metrics_registry.measure are spans too. The finished spans are buffered and exported into a jsonl or otlp file.
+    # The spans are nested per thread, a worker process (replay) buffers its own spans and exports them at the end of its chunk
+    def __init__(self) -> None:
+        self.filename = None
+        self.exporter_format = "jsonl"
+        self.lock = threading.Lock()
+        self.context = threading.local() # stack of the open spans of the current thread
+        self.finished_spans = []
+        self.flush_time = time.time()
+        self.pid = os.getpid()
+
+    def start(self, filename, exporter_format="jsonl") -> None:
+        if exporter_format not in trace_exporter_formats:
+            raise ValueError(f'Invalid trace format specified: {exporter_format}')
+        self.filename, self.exporter_format = filename, exporter_format
+        open(self.filename, "w").close() # a new trace per run
+
+    def get_open_spans(self) -> list:
+        if not hasattr(self.context, "spans"):
+            self.context.spans = []
+        return self.context.spans
+
+    def start_span(self, name, root=False, **attributes):
+        # Child of the current thread's innermost open span (root: a new trace), None if tracing is off
+        if not self.filename:
+            return None
+        open_spans = self.get_open_spans()
+        parent_span = open_spans[-1] if open_spans and not root else None
+        span = {
+            "trace_id": parent_span["trace_id"] if parent_span else f"{random.getrandbits(128):032x}", # not os.urandom: it releases the GIL
+            "span_id": f"{random.getrandbits(64):016x}",
+            "parent_span_id": parent_span["span_id"] if parent_span else None,
+            "name": name,
+            "start_unix_nano": time.time_ns(),
+            "attributes": {key: format_trace_attribute(value) for key, value in attributes.items()},
+        }
+        open_spans.append(span)
+        return span
+
+    def end_span(self, span, error=None, **attributes) -> None:
+        # The span's children still open (e.g. left by an exception) are ended with it
+        if not span:
+            return
+        open_spans = self.get_open_spans()
+        span_index = next((index for index, open_span in enumerate(open_spans) if open_span is span), None)
+        ended_spans = open_spans[span_index:] if span_index is not None else [span]
+        del open_spans[len(open_spans) - len(ended_spans):]
+        span["attributes"].update({key: format_trace_attribute(value) for key, value in attributes.items()})
+        end_unix_nano = time.time_ns()
+        for ended_span in reversed(ended_spans):
+            ended_span.update({
+                "end_unix_nano": end_unix_nano,
+                "duration_seconds": (end_unix_nano - ended_span["start_unix_nano"]) / 1e9,
+                "status": "error" if error else "ok",
+                "error": f"{type(error).__name__}: {error}" if error else None,
+            })
+        with self.lock:
+            if self.pid != os.getpid():
+                self.finished_spans, self.pid = [], os.getpid() # forked worker process: the parent's buffered spans are the parent's to export
+            self.finished_spans.extend(reversed(ended_spans))
+            is_flush_needed = len(self.finished_spans) >= trace_flush_spans or time.time() - self.flush_time >= trace_flush_seconds
+        if is_flush_needed:
+            self.flush()
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        self.end_span(span)
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.filename or not self.finished_spans or self.pid != os.getpid():
+                return
+            finished_spans, self.finished_spans, self.flush_time = self.finished_spans, [], time.time()
+            with open(self.filename, "a", encoding="utf-8") as trace_file:
+                if self.exporter_format == "otlp":
+                    trace_file.write(json.dumps({"resourceSpans": [{
+                        "resource": {"attributes": to_otlp_attributes({"service.name": "python-scrap", "process.pid": os.getpid()})},
+                        "scopeSpans": [{"scope": {"name": "scrap"}, "spans": [to_otlp_span(span) for span in finished_spans]}],
+                    }]}) + "\n")
+                else:
+                    trace_file.write("".join(json.dumps(span, ensure_ascii=False) + "\n" for span in finished_spans))
+
+    def close(self) -> None:
+        self.flush()
+        self.filename = None
+
+class SamplingProfiler:
+    # --profile: a background thread samples the python stacks of the threads running a step every profile_sample_seconds (wall clock:
+    # the time waiting for a page is sampled too), the stacks are counted per step and written as folded stacks and a flamegraph.
+    # The threads are attributed to their step by set_metrics_step, the other threads (and the worker processes of a replay step) are not sampled.
+    # A thread idle in a step (waiting for its workers, or for the links of the step before in pipeline mode) is not sampled either
+    def __init__(self, dirname=profile_dirname, sample_seconds=profile_sample_seconds) -> None:
+        self.dirname = dirname
+        self.sample_seconds = sample_seconds
+        self.idle_codes = {Future.result.__code__, queue.Queue.get.__code__}
+        self.steps_folded_stacks = {} # {step: {"frame;frame;...": samples}}
+        self.steps_idle_samples = {} # {step: samples of its idle threads}
+        self.stopped = threading.Event()
+        self.sample_thread = threading.Thread(target=self.sample_periodically, daemon=True)
+
+    def start(self) -> None:
+        self.sample_thread.start()
+
+    def sample_periodically(self) -> None:
+        while not self.stopped.wait(self.sample_seconds):
+            self.sample()
+
+    def sample(self) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            step = metrics_threads_steps.get(thread_id)
+            if not step:
+                continue
+            frames_labels = []
+            is_thread_idle = False
+            while frame:
+                frames_labels.append(get_frame_label(frame.f_code))
+                is_thread_idle = is_thread_idle or frame.f_code in self.idle_codes
+                frame = frame.f_back
+            if is_thread_idle:
+                self.steps_idle_samples[step] = self.steps_idle_samples.get(step, 0) + 1
+                continue
+            stack = ";".join(reversed(frames_labels))
+            folded_stacks = self.steps_folded_stacks.setdefault(step, {})
+            folded_stacks[stack] = folded_stacks.get(stack, 0) + 1
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.sample_thread.join()
+
+    def write_profiles(self) -> None:
+        # profiles/<step>.folded (flamegraph.pl, speedscope) and profiles/<step>.svg, and the hottest functions of every step
+        os.makedirs(self.dirname, exist_ok=True)
+        for step, folded_stacks in self.steps_folded_stacks.items():
+            profile_filename = os.path.join(self.dirname, desc_to_filename(step))
+            with open(f"{profile_filename}.folded", "w", encoding="utf-8") as folded_file:
+                folded_file.write("".join(f"{stack} {samples}\n" for stack, samples in sorted(folded_stacks.items())))
+            samples_count = sum(folded_stacks.values())
+            with open(f"{profile_filename}.svg", "w", encoding="utf-8") as svg_file:
+                svg_file.write(render_flamegraph_svg(folded_stacks, f"{step}: {samples_count} wall clock samples every {self.sample_seconds * 1000:g} ms"))
+            self_samples = {}
+            for stack, samples in folded_stacks.items():
+                leaf_frame = stack.rsplit(";", 1)[-1]
+                self_samples[leaf_frame] = self_samples.get(leaf_frame, 0) + samples
+            hottest_frames = ", ".join(f"{frame} {samples / samples_count:.1%}" for frame, samples in sorted(self_samples.items(), key=lambda item: item[1], reverse=True)[:3])
+            logging.info(f"<{step}> profile: {samples_count} wall clock samples ({self.steps_idle_samples.get(step, 0)} idle not counted), hottest: {hottest_frames}, flamegraph: {profile_filename}.svg")
+            print(f"<{step}> profile: {samples_count} wall clock samples ({self.steps_idle_samples.get(step, 0)} idle not counted), hottest: {hottest_frames}, flamegraph: {profile_filename}.svg")
+
+class Timer:
+    def __init__(self)-> None:
+        self.start_time = time.time()
+        self.stop_time = self.start_time
+
+    def start(self)-> None:
+        self.start_time = time.time()
+
+    def stop(self)-> None:
+        self.stop_time = time.time()
+
+    def get_execution_time(self):
+        return self.stop_time-self.start_time
+# END: Classes
+
+
+# Classes Configurations
+web_scrapers = {} # one shared scraper per engine, created when a step first uses the engine (no browser started by an import or a run without browser step)
+csv_file_manager = CSVFileManager()
+crawl_state_store = None # set in incremental mode
+page_archive = None
+page_archive_mode = None
+work_queue = None # set in distributed mode
+step_cache = None # set unless --step-cache-ttl 0
+scraper_pool = None # set in daemon mode
+url_frontier = UrlFrontier()
+vendor_store = None # set by --store
+daemon_step_jobs_lock = threading.Lock() # daemon mode: the step jobs run one at a time (they share the checkpoints and output files)
+metrics_registry = MetricsRegistry()
+host_rate_limiter = HostRateLimiter() # shared by all the scrapers, a host's limits apply to all the requests to it
+metrics_context = threading.local() # the step of the current thread, see set_metrics_step
+metrics_threads_steps = {} # {thread id: step of the thread}, see set_metrics_step
+tracer = Tracer() # started by --trace
+# END: Classes Configurations
+
+
+# Scraping function
+def scrap_page_data(web_scraper, web_scraper_actions, web_scraper_params):
+    # Several extract actions on the same page are collapsed into one extract_batch call when the engine supports it
+    if web_scraper.navigation_error:
+        raise web_scraper.navigation_error # never extract data from the blank page of a failed navigation
+    action_names = [web_scraper_action.__name__ for web_scraper_action in web_scraper_actions]
+    if len(action_names) > 1 and hasattr(web_scraper, "extract_batch") and all(action_name in batch_action_specs for action_name in action_names):
+        try:
+            with metrics_registry.measure("extract", trace_attributes={"selector": list(zip(action_names, web_scraper_params))}, action="extract_batch"):
+                return web_scraper.extract_batch(action_names, web_scraper_params)
+        except Exception as e:
+            logging.error(f"Batch extraction failed, fallback to one action at a time: {e}", exc_info=True)
+            print(f"Batch extraction failed, fallback to one action at a time: {e}")
+    page_data = []
+    for index, web_scraper_action in enumerate(web_scraper_actions):
+        with metrics_registry.measure("extract", trace_attributes={"selector": web_scraper_params[index]}, action=web_scraper_action.__name__):
+            page_data.append(web_scraper_action(web_scraper_params[index]))
+    return page_data
+
+def scrap_page_data_incrementally(web_scraper, url, web_scraper_actions, web_scraper_params, pagination_next_btn_css_selector=None, desc="step", freshness_seconds=crawl_freshness_seconds):
+    # Incremental mode: returns (page data, next page url), carrying forward the last record of the url if the page is still fresh or didn't change
+    state = crawl_state_store.get(desc, url)
+    if crawl_state_store.is_fresh(state, freshness_seconds):
+        print(f"Fresh, not fetched again: {url}")
+        return state["record"]["data"], state["record"]["next_url"]
+
+    with metrics_registry.measure("navigate"):
+        web_scraper.navigate_to_page(url, crawl_state_store.get_request_headers(state))
+    if web_scraper.navigation_error:
+        raise web_scraper.navigation_error
+    page_hash = None if web_scraper.is_page_not_modified else web_scraper.get_page_hash()
+    if state and (web_scraper.is_page_not_modified or page_hash == state["content_hash"]):
+        print(f"Unchanged, record carried forward: {url}")
+        crawl_state_store.touch(desc, url)
+        return state["record"]["data"], state["record"]["next_url"]
+
+    page_data = scrap_page_data(web_scraper, web_scraper_actions, web_scraper_params)
+    next_url = web_scraper.extract_element_link(pagination_next_btn_css_selector) if pagination_next_btn_css_selector and web_scraper.extract_element(pagination_next_btn_css_selector) else None
+    crawl_state_store.save(desc, url, page_hash, web_scraper.response_headers, {"data": page_data, "next_url": next_url})
+    return page_data, next_url
+
+def repeat_navigate_scrape_data_and_click_next_page_btn(web_scraper, links, web_scraper_actions, web_scraper_params, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, write_csv_file_name="links.csv", write_file_data_header=["link"], desc="step", checkpoint_journal=None, link_index_offset=0, freshness_seconds=crawl_freshness_seconds, output_format="csv", dedup="memory", downstream_links=None, pagination_mode="pattern"):
+    # Returns True if every link was scraped without error
+    checkpoint_journal = checkpoint_journal if checkpoint_journal else CheckpointJournal(desc)
+    sink = links.create_sink() if isinstance(links, WorkQueueLinks) else create_output_sink(write_csv_file_name, write_file_data_header, output_format)
+    sink = TeeSink([sink, VendorStoreSink(desc, write_file_data_header)]) if vendor_store else sink
+    if isinstance(links, WorkQueueLinks):
+        step_writer = StepWriter(write_csv_file_name, write_file_data_header, output_format, downstream_links=downstream_links, sink=sink) # deduplicated by the work queue
+    else:
+        step_writer = StepWriter(write_csv_file_name, write_file_data_header, output_format, dedup=dedup, downstream_links=downstream_links, sink=sink, checkpoint_journal=checkpoint_journal if isinstance(checkpoint_journal, CheckpointJournal) else None) # appends to the output file of a resumed step
+    try:
+        is_all_links_scraped = scrap_links(web_scraper, links, web_scraper_actions, web_scraper_params, step_writer, checkpoint_journal, pagination_next_btn_css_selector, remove_urls_param_flag, write_file_data_header, desc, link_index_offset, freshness_seconds, pagination_mode, url_frontier)
+    finally:
+        step_writer.close()
+    return is_all_links_scraped
+
+def scrap_links(web_scraper, links, web_scraper_actions, web_scraper_params, step_writer, checkpoint_journal, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, write_file_data_header=["link"], desc="step", link_index_offset=0, freshness_seconds=crawl_freshness_seconds, pagination_mode="pattern", url_frontier=None):
+    default_scraped_data = [[] for _ in web_scraper_actions]
+    scraped_data = copy.deepcopy(default_scraped_data)
+    is_all_links_scraped = True
+
+    for links_window in iter_links_windows(links, http_prefetch_pages, link_index_offset):
+        links_to_scrap = [(link_index, link) for link_index, link in links_window if not checkpoint_journal.is_link_done(link_index)] # skip exactly the links done before
+        if url_frontier:
+            # A link whose url another link claimed is a duplicate: done without being fetched
+            link_urls = [(link_index, link) for link_index, link in links_to_scrap if isinstance(link, str)]
+            duplicate_link_indexes = {link_index for (link_index, _), is_url_claimed in zip(link_urls, url_frontier.claim_urls(desc, link_urls)) if not is_url_claimed}
+            for duplicate_link_index in duplicate_link_indexes:
+                checkpoint_journal.record_flush(0, duplicate_link_index)
+            links_to_scrap = [(link_index, link) for link_index, link in links_to_scrap if link_index not in duplicate_link_indexes]
+        if hasattr(web_scraper, "prefetch_pages") and links_to_scrap:
+            # http engine: fetch the next links concurrently (incremental mode: only the stale ones, with conditional requests)
+            next_links = [checkpoint_journal.get_resume_url(next_link_index) or next_link for next_link_index, next_link in links_to_scrap]
+            with metrics_registry.measure("prefetch"):
+                if crawl_state_store:
+                    stale_links_request_headers = crawl_state_store.get_stale_urls_request_headers(desc, next_links, freshness_seconds)
+                    web_scraper.prefetch_pages(list(stale_links_request_headers), stale_links_request_headers)
+                else:
+                    web_scraper.prefetch_pages(next_links)
+        for link_index, link in links_to_scrap:
+            is_data_scrap = True # To indicate whether the scraping action scraped some data
+            url = checkpoint_journal.get_resume_url(link_index) or link # resume a paginated link from its first page not flushed yet
+            pagination_pages_urls = [] # pattern pagination: urls of the next pages of the link, generated from the paginator
+            is_page_loaded = False # To indicate whether the page of url is already loaded in the scraper (by a click)
+            is_link_scraped = True # To indicate whether all the pages of the link were scraped without error
+            is_resume_url_pending = False # To indicate whether the next page url has to be journaled (the pages before it are flushed)
+            print(f"link_index: {link_index}")
+            link_span = tracer.start_span("link", root=True, step=desc, link_index=link_index, url=link) # a trace per link
+            pages_count = 0
+            try:
+                while True:
+                    if not url:
+                        continue                
+                    next_url = None
+                    page_start_time = time.perf_counter()
+                    page_span = tracer.start_span("page", step=desc, url=url)
+                    pages_count += 1
+                    is_page_navigated = True # To indicate whether the page of url was loaded without error
+                    is_page_scraped = True # To indicate whether the data of the page was scraped without error
+                    if not crawl_state_store and not is_page_loaded:
+                        with metrics_registry.measure("navigate"):
+                            web_scraper.navigate_to_page(url) # Navigate to the url (incremental mode navigates only to the stale pages)
+                        is_page_navigated = not web_scraper.navigation_error
+                    is_page_loaded = False
+
+                    try:
+                        if not is_page_navigated:
+                            raise web_scraper.navigation_error # the link failed, no data extracted from a page not loaded
+                        # Scrap data actions (can have multiple scrap actions, because might want to scrap different things)
+                        if crawl_state_store:
+                            page_data, next_url = scrap_page_data_incrementally(web_scraper, url, web_scraper_actions, web_scraper_params, pagination_next_btn_css_selector, desc, freshness_seconds)
+                        else:
+                            page_data = scrap_page_data(web_scraper, web_scraper_actions, web_scraper_params)
+                        for index, data in enumerate(page_data):
+                            data = remove_urls_parameters(data) if remove_urls_param_flag else data
+                            if not data:
+                                data = ""
+                            list_extend_or_append_data(scraped_data[index], data) # extend if the scraped data is in a list, else append it
+                        # END: Scrap data actions
+                    except BaseException as inner_be:
+                        # Handling Error Raised while scraping data (the link is not journaled as done, a resumed run scraps it again)
+                        is_link_scraped = False
+                        is_page_scraped = False
+                        metrics_registry.inc("scrap_page_errors_total")
+                        logging.error(f"Error occurred inner exception: {inner_be}")
+                        logging.error(f"Stop at link_index: {link_index}, url: {url}, Error: {inner_be}", exc_info=True) # Log error into a file
+                        # END: Handling Error Raised while scraping data
+                    metrics_registry.inc("scrap_pages_total")
+                    metrics_registry.observe("scrap_page_duration_seconds", time.perf_counter() - page_start_time)
+                    page_span_error = None if is_page_scraped else RuntimeError("scraping the page failed") # the page span ends after its flush and pagination
+
+                    if crawl_state_store:
+                        next_btn_element = next_url # the next page is navigated to by its link, it may not be loaded in the scraper
+                    elif not is_page_navigated:
+                        next_btn_element = None # the previous page may still be loaded in the browser, its next page is not this page's
+                    else:
+                        next_btn_element = web_scraper.extract_element(pagination_next_btn_css_selector) if pagination_next_btn_css_selector else None
+
+                    # Write the scraped data into a csv file (if the data list more than 50 items inside)
+                    flatten_scraped_data = [element for innerList in scraped_data for element in innerList]
+                    if(is_data_scrap and len(flatten_scraped_data) > 50 or not next_btn_element):
+                        write_file_data_header = write_file_data_header # Header(s) column of csv file we write
+                        scraped_records = reformat_data_list_to_records(write_file_data_header, scraped_data) # reformat the headers and scraped_data into this format: {'Header1':["data1","data2"],'Header2':["data3","data4"]}
+                        step_writer.write_columns(list(scraped_records.values())) # buffered, written to the file by the writer
+                        # Journal the flushed rows, and the link as done once its last page is flushed (once the writer wrote the rows to the file)
+                        rows_count = max(len(column) for column in scraped_data)
+                        done_link_index = link_index if not next_btn_element and is_link_scraped else None
+                        step_writer.add_flush_callback(lambda rows_count=rows_count, done_link_index=done_link_index: checkpoint_journal.record_flush(rows_count, done_link_index))
+                        is_resume_url_pending = bool(next_btn_element)
+                    
+                        scraped_data = copy.deepcopy(default_scraped_data) # Reset scraped_data to default empty
+                    # END: Write the scraped data into a csv file 
+
+                    # Click pagination "next page" btn (if "next page" btn not exist, break the loop, continue to scrap data on next link)
+                    if not next_btn_element:
+                        tracer.end_span(page_span, page_span_error)
+                        break
+                    if pagination_mode == "pattern" and not pagination_pages_urls and not crawl_state_store:
+                        pagination_pages_urls = get_pagination_pages_urls(web_scraper, pagination_next_btn_css_selector)
+                        if pagination_pages_urls and url_frontier:
+                            # The pages another link claimed are not fetched again (e.g. 2 categories linking to the same listing)
+                            is_pages_urls_claimed = url_frontier.claim_urls(desc, [(link_index, page_url) for page_url in pagination_pages_urls])
+                            pagination_pages_urls = [page_url for page_url, is_page_url_claimed in zip(pagination_pages_urls, is_pages_urls_claimed) if is_page_url_claimed]
+                            if not pagination_pages_urls:
+                                if is_link_scraped:
+                                    step_writer.add_flush_callback(lambda link_index=link_index: checkpoint_journal.record_flush(0, link_index)) # its next pages are another link's
+                                tracer.end_span(page_span, page_span_error)
+                                break
+                    if pagination_pages_urls:
+                        url = pagination_pages_urls.pop(0)
+                        if hasattr(web_scraper, "prefetch_pages") and url not in web_scraper.prefetched_pages:
+                            with metrics_registry.measure("pagination_prefetch"):
+                                web_scraper.prefetch_pages([url] + pagination_pages_urls[:http_prefetch_pages-1]) # http engine: fetch the next pages concurrently
+                    elif crawl_state_store:
+                        url = next_url
+                    else:
+                        # No page urls pattern: click through (the clicked page is loaded, no need to navigate to it again)
+                        with metrics_registry.measure("pagination_click"):
+                            web_scraper.safe_click(pagination_next_btn_css_selector)
+                        url = web_scraper.get_current_link()
+                        is_page_loaded = True
+                    if is_resume_url_pending:
+                        step_writer.add_flush_callback(lambda link_index=link_index, url=url: checkpoint_journal.record_resume_url(link_index, url))
+                        is_resume_url_pending = False
+                    tracer.end_span(page_span, page_span_error)
+                    # END: Click pagination "next page" btn
+            except BaseException as outer_be:
+                is_link_scraped = False
+                logging.error(f"Error occurred outside exception: {outer_be}")
+                logging.error(f"Stop at link_index: {link_index}, url: {url}, Error: {outer_be}", exc_info=True) # Log error into a file
+            if not is_link_scraped:
+                checkpoint_journal.record_failure(link_index)
+            tracer.end_span(link_span, None if is_link_scraped else RuntimeError("scraping the link failed"), pages=pages_count)
+            is_all_links_scraped = is_all_links_scraped and is_link_scraped
+        if hasattr(web_scraper, "prefetched_pages"):
+            web_scraper.prefetched_pages.clear() # the pages prefetched for the links of the window that failed or stopped early are never navigated to
+    return is_all_links_scraped
+
+def scrap_links_worker(worker_index, links, link_index_offset, step_checkpoint, web_scraper_action_names, web_scraper_action_params, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, write_csv_file_name="links.csv", write_file_data_header=["link"], desc="step", engine="browser", freshness_seconds=crawl_freshness_seconds, output_format="csv", dedup="memory", downstream_links=None, pagination_mode="pattern", browser_profile="default", ready_conditions=None):
+    # Every worker owns a browser, a part file and a checkpoint journal, so a crashed worker only affects its own chunk of links
+    set_metrics_step(desc)
+    checkpoint_journal = links if isinstance(links, WorkQueueLinks) else CheckpointJournal(desc, worker_index, step_checkpoint, links=links)
+    worker_web_scraper = None
+    is_worker_finished = False
+    try:
+        worker_web_scraper = create_web_scraper(engine, links[0] if isinstance(links, list) and links else default_link, browser_profile, ready_conditions)
+        web_scraper_actions = [getattr(worker_web_scraper, action_name) for action_name in web_scraper_action_names]
+        is_worker_finished = repeat_navigate_scrape_data_and_click_next_page_btn(
+            worker_web_scraper,
+            links,
+            web_scraper_actions,
+            web_scraper_action_params,
+            pagination_next_btn_css_selector=pagination_next_btn_css_selector,
+            remove_urls_param_flag=remove_urls_param_flag,
+            write_csv_file_name=worker_filename(write_csv_file_name, worker_index),
+            write_file_data_header=write_file_data_header,
+            desc=desc,
+            checkpoint_journal=checkpoint_journal,
+            link_index_offset=link_index_offset,
+            freshness_seconds=freshness_seconds,
+            output_format=output_format,
+            dedup=dedup,
+            downstream_links=downstream_links,
+            pagination_mode=pagination_mode
+        )
+    except BaseException as be:
+        logging.error(f"Error occurred in worker {worker_index} ({desc}): {be}", exc_info=True)
+        print(f"Error occurred in worker {worker_index} ({desc}): {be}")
+    finally:
+        if worker_web_scraper:
+            worker_web_scraper.close_browser()
+        checkpoint_journal.close()
+        tracer.flush() # a worker process exports its spans before exiting
+        clear_metrics_step() # the pool's thread idles or runs another step's worker
+    return is_worker_finished
+
+def repeat_navigate_scrape_data_in_workers_pool(links, web_scraper_action_names, web_scraper_action_params, workers, step_checkpoint, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, write_csv_file_name="links.csv", write_file_data_header=["link"], desc="step", engine="browser", freshness_seconds=crawl_freshness_seconds, output_format="csv", dedup="memory", downstream_links=None, pagination_mode="pattern", browser_profile="default", ready_conditions=None):
+    # Returns True if every worker scraped all its links without error
+    if is_shared_links(links):
+        # Pipeline mode: the workers take the links from the shared queue as they arrive (distributed mode: lease them)
+        links_chunks = [links for _ in range(workers)]
+        links_chunks_offsets = [0 for _ in range(workers)]
+    else:
+        links_chunks = split_list_into_chunks(links, workers)
+        links_chunks_offsets = [sum(len(links_chunk) for links_chunk in links_chunks[:worker_index]) for worker_index in range(workers)] # index of the chunk's first link in links
+
+    if page_archive_mode == "replay" and engine == "http" and not is_shared_links(links):
+        # Replaying is pure html parsing (cpu bound), use processes to spread it across the cores
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=set_page_archive, initargs=(page_archive_mode, page_archive.archive_dirname))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        futures = [
+            executor.submit(
+                scrap_links_worker,
+                worker_index,
+                links_chunk,
+                links_chunks_offsets[worker_index],
+                step_checkpoint,
+                web_scraper_action_names,
+                web_scraper_action_params,
+                pagination_next_btn_css_selector=pagination_next_btn_css_selector,
+                remove_urls_param_flag=remove_urls_param_flag,
+                write_csv_file_name=write_csv_file_name,
+                write_file_data_header=write_file_data_header,
+                desc=desc,
+                engine=engine,
+                freshness_seconds=freshness_seconds,
+                output_format=output_format,
+                dedup=dedup,
+                downstream_links=downstream_links,
+                pagination_mode=pagination_mode,
+                browser_profile=browser_profile,
+                ready_conditions=ready_conditions
+            )
+            for worker_index, links_chunk in enumerate(links_chunks)
+        ]
+        is_workers_finished = [future.result() for future in futures]
+
+    if isinstance(links, WorkQueueLinks):
+        return all(is_workers_finished) # the rows are in the work queue, exported once the step is finished on every node
+
+    merge_workers_outputs(write_csv_file_name, write_file_data_header, output_format, dedup, all(is_workers_finished))
+    return all(is_workers_finished)
+
+def merge_workers_outputs(write_csv_file_name, write_file_data_header, output_format="csv", dedup="memory", is_step_scraped=True):
+    # Merge the workers' part files in worker order (= original links order) into the step's output file, replaced atomically
+    part_filenames = get_worker_filenames(write_csv_file_name, output_format)
+    with metrics_registry.measure("merge"):
+        if is_step_scraped and len(part_filenames) == 1:
+            csv_file_manager.replace_output(part_filenames[0], write_csv_file_name, output_format) # already deduplicated while written
+            return
+        csv_file_manager.merge_outputs(part_filenames, write_csv_file_name, write_file_data_header, output_format, dedup)
+
+    # Keep the part files of an unfinished step, the next run resumes the step and appends the missing links to them
+    if is_step_scraped:
+        csv_file_manager.remove_files(part_filenames)
+
+def website_scrap_action(read_csv_file_name, web_scraper_action_names, web_scraper_action_params, write_csv_file_name, write_file_data_header, pagination_next_btn_css_selector=None, remove_urls_param_flag=False, desc="Step 1", link="", workers=1, engine="browser", freshness_seconds=None, output_format="csv", dedup="memory", pagination_mode="pattern", browser_profile="default", ready_conditions=None, url_rules=None, links_source=None, downstream_links=None, read_output_format=None):
+    set_metrics_step(desc)
+    url_frontier.set_step_url_rules(desc, url_rules)
+    # Section 1: Read data from csv file
+    read_csv_file_name = read_csv_file_name 
+    read_csv_file_col = "link"
+    link = link if link else default_link
+    links = [link] # only default_link if the csv file not exist, else the 'link' column of the csv file
+    if not links_source and os.path.exists(output_filename_checker(read_csv_file_name, csv_file_manager.find_output_format(read_csv_file_name, read_output_format))):
+        try:
+            links = FileLinks(read_csv_file_name, read_csv_file_col, read_output_format) # read lazily, a resumed step seeks to the save points of its chunks
+        except Exception as e:
+            print(f"Read csv file exception: {e}")
+    links = links_source if links_source else links # pipeline mode: the links emitted by the previous step as it scraps them
+    if isinstance(links, FileLinks):
+        # The checkpoint indexes the links by their rows in the input file, they are other links once the file is rewritten (e.g. the previous step ran again)
+        input_checksum = read_step_input_checksum(desc)
+        if input_checksum and input_checksum != links.checksum:
+            print(f"<{desc}> input file changed since the checkpoint, the step starts again")
+            reset_step_checkpoint(desc)
+        write_step_input_checksum(desc, links.checksum)
+    if work_queue:
+        # Distributed mode: the links are leased from the work queue shared by all the nodes
+        work_queue.add_links(desc, links)
+        links = WorkQueueLinks(work_queue, desc)
+    # END: Section 1: Read data from csv file
+
+    # Section 2: Scrap data based on the links retrieved from and then save into csv file [Section 1]
+    web_scraper_action_names = web_scraper_action_names # should in a list, it is the web_scraper action names that have to execute
+    web_scraper_action_params = web_scraper_action_params # should in a list, it is the parameters for the web_scraper action names above (The items inside corresponds to the items in list [web_scraper_action_names], note: it might be a nested list sometimes)
+
+    if dedup not in dedup_modes:
+        raise ValueError(f'Invalid dedup specified: {dedup}')
+    if pagination_mode not in ["pattern", "click"]:
+        raise ValueError(f'Invalid pagination mode specified: {pagination_mode}')
+    for ready_condition in ready_conditions if ready_conditions else []:
+        if not any(kind in ready_condition for kind in ready_condition_scripts):
+            raise ValueError(f'Invalid ready condition specified: {ready_condition}')
+    freshness_seconds = freshness_seconds if freshness_seconds is not None else crawl_freshness_seconds
+
+    # Resume the step from its checkpoint journals, else start the output files from scratch
+    step_checkpoint = read_step_checkpoint(desc)
+    done_link_indexes, _, flushed_rows, save_points = step_checkpoint
+    if done_link_indexes or flushed_rows or save_points:
+        print(f"<{desc}> resumed: {len(done_link_indexes)} links done after the save points, {flushed_rows} rows flushed")
+    else:
+        StepWriter(write_csv_file_name, write_file_data_header, output_format, truncate=True).close()
+        csv_file_manager.remove_files(get_worker_filenames(write_csv_file_name, output_format))
+        url_frontier.reset_step(desc)
+    if isinstance(links, FileLinks):
+        links.set_checkpoint(save_points, done_link_indexes)
+
+    try:
+        if workers > 1 and (is_shared_links(links) or len(links) > 1):
+            # Each worker runs its own browser on a contiguous chunk of the links
+            is_step_scraped = repeat_navigate_scrape_data_in_workers_pool(
+                links,
+                web_scraper_action_names,
+                web_scraper_action_params,
+                workers if is_shared_links(links) else min(workers, len(links)),
+                step_checkpoint,
+                pagination_next_btn_css_selector=pagination_next_btn_css_selector,
+                remove_urls_param_flag=remove_urls_param_flag,
+                write_csv_file_name=write_csv_file_name,
+                write_file_data_header=write_file_data_header,
+                desc=desc,
+                engine=engine,
+                freshness_seconds=freshness_seconds,
+                output_format=output_format,
+                dedup=dedup,
+                downstream_links=downstream_links,
+                pagination_mode=pagination_mode,
+                browser_profile=browser_profile,
+                ready_conditions=ready_conditions
+            )
+        else:
+            web_scraper_key = engine if engine != "browser" or (browser_profile == "default" and not ready_conditions) else f"{engine}:{browser_profile}:{json.dumps(ready_conditions)}"
+            web_scraper_key = (web_scraper_key, desc) if links_source or downstream_links else web_scraper_key # steps running at the same time don't share a scraper
+            if web_scraper_key not in web_scrapers:
+                web_scrapers[web_scraper_key] = create_web_scraper(engine, link, browser_profile, ready_conditions)
+            step_web_scraper = web_scrapers[web_scraper_key]
+            web_scraper_actions = [getattr(step_web_scraper, action_name) for action_name in web_scraper_action_names]
+            checkpoint_journal = links if isinstance(links, WorkQueueLinks) else CheckpointJournal(desc, 0, step_checkpoint, links=links)
+
+            try:
+                # Written into a part file like a worker's, the step's output is replaced by it atomically once written
+                is_step_scraped = repeat_navigate_scrape_data_and_click_next_page_btn(
+                    step_web_scraper, 
+                    links,
+                    web_scraper_actions,
+                    web_scraper_action_params,
+                    pagination_next_btn_css_selector=pagination_next_btn_css_selector,
+                    remove_urls_param_flag=remove_urls_param_flag,
+                    write_csv_file_name=write_csv_file_name if isinstance(links, WorkQueueLinks) else worker_filename(write_csv_file_name, 0),
+                    write_file_data_header=write_file_data_header,
+                    desc=desc,
+                    checkpoint_journal=checkpoint_journal,
+                    freshness_seconds=freshness_seconds,
+                    output_format=output_format,
+                    dedup=dedup,
+                    downstream_links=downstream_links,
+                    pagination_mode=pagination_mode
+                )
+            finally:
+                checkpoint_journal.close()
+            if not isinstance(links, WorkQueueLinks):
+                merge_workers_outputs(write_csv_file_name, write_file_data_header, output_format, dedup, is_step_scraped)
+    finally:
+        if isinstance(links, WorkQueueLinks):
+            links.stop()
+
+    if isinstance(links, WorkQueueLinks):
+        # The step is finished on every node (or by this node only if the others died): export the rows of all the nodes
+        is_step_scraped = links.is_step_finished()
+        with metrics_registry.measure("merge"):
+            links.export_results(write_csv_file_name, write_file_data_header, output_format)
+
+    # A step with links that failed stays unfinished, the next run resumes it and scraps only these links again
+    if is_step_scraped:
+        mark_step_checkpoint_done(desc)
+    # END: Section 2: Scrap data based on the links retrieved from and then save into csv file [Section 1]    
+
+    # Section 3: Remove duplicated rows in CSV file (the "memory" and "bloom" dedups dropped them while writing)
+    if dedup == "external":
+        with metrics_registry.measure("dedup", action="external_sort"):
+            csv_file_manager.remove_null_and_duplicates(write_csv_file_name, write_file_data_header, output_format)
+    # END: Section 3: Remove duplicated rows in CSV file
+# END: Scraping function
+
+
+# Main Function
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrap the professionals and vendors contacts from recommend.my")
+    parser.add_argument("--archive", choices=["capture", "replay"], default=None, help="capture: store every fetched page in the page archive, replay: re-run the steps on the archived pages without network access")
+    parser.add_argument("--archive-dir", default=page_archive_dirname, help="directory of the page archive")
+    parser.add_argument("--incremental", action="store_true", help="only fetch the urls that are stale or changed since the last run, carry forward the records of the others")
+    parser.add_argument("--freshness", type=float, default=crawl_freshness_seconds, help="incremental mode: seconds an url stays fresh after being fetched (a step's freshness_seconds overrides it)")
+    parser.add_argument("--pipeline", action="store_true", help="run the steps at the same time, each step scraps the links of the previous step as soon as they're scraped (the output files are still written)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve the live metrics on http://127.0.0.1:PORT/metrics (prometheus text format) and /metrics.json")
+    parser.add_argument("--start-url", default=default_link, help="url of the page Step 1 scraps the categories links from (e.g. a local fixture site)")
+    parser.add_argument("--engine", choices=list(web_scraper_engines), default=None, help="engine of every step (overrides the steps' engine)")
+    parser.add_argument("--workers", type=int, default=None, help="no. of workers (browsers, or http scrapers) scraping the links of every step in parallel (overrides the steps' workers, default: 1)")
+    parser.add_argument("--steps", type=int, nargs="+", default=None, help="numbers of the steps to run (default: all)")
+    parser.add_argument("--max-rate", type=float, default=http_max_requests_per_second, help="max. requests per second to a host (default: no limit but the host's robots.txt crawl-delay, the concurrency adapts to the host's answers)")
+    parser.add_argument("--checkpoint-interval", type=float, default=checkpoint_sync_seconds, help="seconds between two syncs of the checkpoint journals to disk (max. work lost on a kill)")
+    parser.add_argument("--work-queue", default=None, help="distributed mode: lease the links of every step from this work queue shared by the nodes (sqlite:///path/on/shared/filesystem.sqlite, or memory:// in the process), the rows of all the nodes are deduplicated into it")
+    parser.add_argument("--node-id", default=work_queue_node_id, help="distributed mode: name of this node (default: hostname-pid)")
+    parser.add_argument("--lease-seconds", type=float, default=work_queue_lease_seconds, help="distributed mode: the links leased by a node that stops heartbeating are reissued after this long")
+    parser.add_argument("--reset-work-queue", action="store_true", help="distributed mode: clear the links and rows of the previous crawl from the work queue before starting (on one node)")
+    parser.add_argument("--step-cache-ttl", type=float, default=step_cache_ttl_seconds, help="seconds the output of a step is reused by the next runs whose step config and input file are the same (0: no step cache)")
+    parser.add_argument("--force", type=int, nargs="+", default=[], metavar="STEP", help="numbers of the steps to scrap again even if their cached output is still valid")
+    parser.add_argument("--store", nargs="?", const=vendor_store_filename, default=None, help=f"also upsert the rows of every step into the indexed vendor store (default file: {vendor_store_filename}), see vendor_store.py for the lookups and exports")
+    parser.add_argument("--daemon", action="store_true", help="keep running with warm scrapers and take step or urls jobs on http://127.0.0.1:PORT/jobs instead of running the steps")
+    parser.add_argument("--daemon-port", type=int, default=daemon_port, help="daemon mode: port of the jobs api")
+    parser.add_argument("--daemon-browsers", type=int, default=daemon_browsers, help="daemon mode: warm scrapers kept for every scraper config of the steps")
+    parser.add_argument("--daemon-url", default=None, help="submit the jobs to the daemon running at this url (e.g. http://127.0.0.1:8766) instead of running them here: the --steps, or the --urls with the actions of the (first of the) --steps")
+    parser.add_argument("--urls", nargs="+", default=[], help="urls of a daemon job (default step: the last one)")
+    parser.add_argument("--urls-file", default=None, help="file with a 'link' column (any output format) of the urls of a daemon job")
+    parser.add_argument("--trace", default=None, metavar="FILE", help="record a span tree per link (link > page > navigate, wait, extract actions, pagination click, flush) into FILE")
+    parser.add_argument("--trace-format", choices=trace_exporter_formats, default="jsonl", help="--trace: one span per line (jsonl) or OTLP/JSON export requests (otlp, the OpenTelemetry collector's file exporter format)")
+    parser.add_argument("--trace-report", default=None, metavar="FILE", help="print the slowest urls, pages and selectors of a --trace file (either format) instead of running the steps")
+    parser.add_argument("--trace-report-top", type=int, default=20, help="no. of rows of every list of the trace report")
+    parser.add_argument("--profile", action="store_true", help=f"sample the python stacks of the steps every {profile_sample_seconds * 1000:g} ms, write the folded stacks and a flamegraph (svg) of every step into --profile-dir")
+    parser.add_argument("--profile-dir", default=profile_dirname, help="directory of the --profile flamegraphs")
+    args = parser.parse_args(argv)
+    if args.pipeline and args.work_queue:
+        parser.error("--pipeline can't be used with --work-queue")
+    if (args.urls or args.urls_file) and not args.daemon_url:
+        parser.error("--urls and --urls-file need --daemon-url")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+def run_step(step_params, links_source=None, downstream_links=None):
+    each_step_timer = Timer()
+    step_span = tracer.start_span("step", root=True, step=step_params["desc"])
+    try:
+        website_scrap_action(**step_params, links_source=links_source, downstream_links=downstream_links)
+        tracer.end_span(step_span)
+    except BaseException as be:
+        tracer.end_span(step_span, be)
+        logging.error(f"Error occurred in main exception: {be}", exc_info=True)
+        print(f"Error occurred in main exception: {be}")
+    finally:
+        if downstream_links:
+            downstream_links.close() # the next step ends once it scraped all the links, even if this step failed
+        if links_source:
+            links_source.abort() # the step before stops waiting for room in the queue, even if this step failed
+        clear_metrics_step()
+        each_step_timer.stop()
+        logging.info(f"<{step_params['desc']}> execution time: {each_step_timer.get_execution_time():.2f} seconds") # Log info into a file
+        print(f"<{step_params['desc']}> execution time: {each_step_timer.get_execution_time():.2f} seconds")
+
+def restore_cached_step(step_params, forced_steps_descs) -> bool:
+    # Skip the step if its output is cached for the same config and input file, its checkpoint is marked done as if it ran
+    if not step_cache or step_params["desc"] in forced_steps_descs or not step_cache.restore(step_params):
+        return False
+    mark_step_checkpoint_done(step_params["desc"])
+    logging.info(f"<{step_params['desc']}> config and input unchanged, cached output restored")
+    print(f"<{step_params['desc']}> config and input unchanged, cached output restored")
+    return True
+
+def store_cached_step(step_params) -> None:
+    if not step_cache or not is_step_checkpoint_done(step_params["desc"]):
+        return # a step with failed links is not cached
+    try:
+        step_cache.store(step_params)
+    except Exception as e:
+        logging.error(f"<{step_params['desc']}> caching of the output failed: {e}", exc_info=True)
+        print(f"<{step_params['desc']}> caching of the output failed: {e}")
+
+def run_urls_job(step_params, urls):
+    # Daemon mode: scrap the urls with the actions of the step on a warm scraper of the pool, returns the rows and the failed links
+    set_metrics_step(step_params["desc"])
+    memory_sink = MemorySink()
+    job_journal = JobJournal(urls)
+    job_url_frontier = UrlFrontier(":memory:") # the urls of the job only
+    job_url_frontier.set_step_url_rules(step_params["desc"], step_params.get("url_rules"))
+    with scraper_pool.borrow(step_params) as job_web_scraper:
+        web_scraper_actions = [getattr(job_web_scraper, action_name) for action_name in step_params["web_scraper_action_names"]]
+        step_writer = StepWriter(None, step_params["write_file_data_header"], sink=memory_sink)
+        try:
+            scrap_links(
+                job_web_scraper,
+                urls,
+                web_scraper_actions,
+                step_params["web_scraper_action_params"],
+                step_writer,
+                job_journal,
+                pagination_next_btn_css_selector=step_params.get("pagination_next_btn_css_selector"),
+                remove_urls_param_flag=step_params.get("remove_urls_param_flag", False),
+                write_file_data_header=step_params["write_file_data_header"],
+                desc=step_params["desc"],
+                pagination_mode=step_params.get("pagination_mode", "pattern"),
+                url_frontier=job_url_frontier
+            )
+        finally:
+            step_writer.close()
+            job_url_frontier.close()
+            clear_metrics_step()
+    return {"header": step_params["write_file_data_header"], "rows": memory_sink.rows, "failed_links": job_journal.failed_links}
+
+def run_step_job(step_params, force=False):
+    # Daemon mode: a new run of the step (not a resume of the previous job's), its scrapers stay warm in web_scrapers for the next jobs
+    with daemon_step_jobs_lock:
+        is_cached = restore_cached_step(step_params, [step_params["desc"]] if force else [])
+        if not is_cached:
+            reset_step_checkpoint(step_params["desc"])
+            run_step(step_params)
+            store_cached_step(step_params)
+    return {"desc": step_params["desc"], "done": is_step_checkpoint_done(step_params["desc"]), "cached": is_cached, "output": output_filename_checker(step_params["write_csv_file_name"], step_params.get("output_format", "csv"))}
+
+def run_scraper_daemon(port, steps_params, browsers=daemon_browsers):
+    # Serve the jobs until stopped (ctrl-c or SIGTERM), then close the browsers
+    global scraper_pool
+    def stop_daemon(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop_daemon)
+    scraper_pool = ScraperPool(browsers)
+    daemon_server = http.server.ThreadingHTTPServer(("127.0.0.1", port), ScraperDaemonRequestHandler)
+    daemon_server.daemon_threads = True
+    daemon_server.steps_params = steps_params
+    try:
+        scraper_pool.warm_up(steps_params)
+        print(f"Scraper daemon: http://127.0.0.1:{daemon_server.server_address[1]}/jobs")
+        daemon_server.serve_forever()
+    except KeyboardInterrupt:
+        print("Scraper daemon stopped")
+    finally:
+        daemon_server.server_close()
+        scraper_pool.close()
+        for step_web_scraper in web_scrapers.values():
+            step_web_scraper.close_browser()
+
+def request_daemon(daemon_url, method, path, job=None):
+    response = urllib3.request(method, daemon_url.rstrip("/") + path, json=job, timeout=urllib3.Timeout(connect=http_timeout, read=None), retries=False)
+    result = response.json()
+    if response.status != 200:
+        raise RuntimeError(f"Daemon request {method} {path} {job if job else ''} failed: {result.get('error')}")
+    return result
+
+def submit_daemon_jobs(args):
+    # Client of the daemon: an urls job (its rows printed as csv on stdout), or one job per step
+    steps_count = len(request_daemon(args.daemon_url, "GET", "/health")["steps"])
+    urls = args.urls + (csv_file_manager.read_dataframe(args.urls_file, ["link"])["link"].dropna().tolist() if args.urls_file else [])
+    if urls:
+        result = request_daemon(args.daemon_url, "POST", "/jobs", {"step": args.steps[0] if args.steps else steps_count, "urls": urls})
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(result["header"])
+        writer.writerows(result["rows"])
+        for failed_link in result["failed_links"]:
+            logging.error(f"Daemon job: failed link {failed_link}")
+            print(f"Failed link: {failed_link}", file=sys.stderr)
+        return
+    for step_number in args.steps if args.steps else range(1, steps_count + 1):
+        result = request_daemon(args.daemon_url, "POST", "/jobs", {"step": step_number, "force": step_number in args.force})
+        print(f"<{result['desc']}> {'cached output restored' if result['cached'] else 'done' if result['done'] else 'unfinished'}: {result['output']}")
+
+def run_steps_pipeline(steps_params):
+    # Every step runs in its own thread, a step reading the output file of the step before it takes its links from a bounded queue instead
+    steps_links = [None] + [QueueLinks() if step_params["read_csv_file_name"] == previous_step_params["write_csv_file_name"] else None for previous_step_params, step_params in zip(steps_params, steps_params[1:])]
+    steps_threads = [
+        threading.Thread(target=run_step, args=(step_params, steps_links[step_index], steps_links[step_index+1] if step_index+1 < len(steps_params) else None), name=step_params["desc"])
+        for step_index, step_params in enumerate(steps_params)
+    ]
+    for step_thread in steps_threads:
+        step_thread.start()
+    for step_thread in steps_threads:
+        step_thread.join()
+
+    # The links indexes of a step fed by a queue follow the arrival order, its journals can't resume it: an unfinished one reruns from scratch
+    for step_params, links_source in zip(steps_params, steps_links):
+        if links_source and not is_step_checkpoint_done(step_params["desc"]):
+            reset_step_checkpoint(step_params["desc"])
+
+def main(args=None):
+    global crawl_state_store, crawl_freshness_seconds, checkpoint_sync_seconds, default_link, work_queue, work_queue_node_id, work_queue_lease_seconds, http_max_requests_per_second, step_cache, vendor_store
+    args = args if args else parse_args([])
+    if args.trace_report:
+        print_trace_report(args.trace_report, args.trace_report_top)
+        return
+    if args.daemon_url:
+        submit_daemon_jobs(args) # the daemon runs the jobs with its own settings
+        return
+    http_max_requests_per_second = args.max_rate
+    default_link = args.start_url
+    work_queue = create_work_queue(args.work_queue) if args.work_queue else None
+    work_queue_node_id = args.node_id
+    work_queue_lease_seconds = args.lease_seconds
+    if work_queue and args.reset_work_queue:
+        work_queue.reset()
+    checkpoint_sync_seconds = args.checkpoint_interval
+    set_page_archive(args.archive, args.archive_dir)
+    crawl_state_store = CrawlStateStore() if args.incremental else None
+    crawl_freshness_seconds = args.freshness
+    step_cache = StepCache(ttl_seconds=args.step_cache_ttl) if args.step_cache_ttl > 0 else None
+    vendor_store = VendorStore(args.store) if args.store else None
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    if args.trace:
+        tracer.start(args.trace, args.trace_format)
+
+    recommend_web_scrape_steps_params = [
+        # Sample
+        # {
+        #     "desc": "Step 0", ## description for the step (for logging purpose)
+        #     "read_csv_file_name": "", ## the csv file where we read to get all the links to scrap through
         #     "web_scraper_action_names": ["extract_elements_links"], ## should in a list
         #     "web_scraper_action_params": [["div.left-side-content div.flickity-cell a"]],  ## should in a list, no. item inside should correspond to the no. item of variable [web_scraper_action_names] above
         #     "write_csv_file_name": "professional_categories_links", ## The csv file where we read to get all the links to scrap through
         #     "write_file_data_header": ["link"], ## should in a list
         #     "pagination_next_btn_css_selector": None, ## indicate whats the pagination next page button css, if None means need not to click the button
-        #     "remove_urls_param_flag": False ## indicate whether is there a need to remove the url's param from the scraped data
+        #     "pagination_mode": "pattern", ## "pattern": generate the urls of all the pages from the paginator's page urls and fetch them concurrently (click through if no pattern found), "click": click the next page button page by page
+        #     "remove_urls_param_flag": False, ## indicate whether is there a need to remove the url's param from the scraped data
+        #     "workers": 1, ## no. of browsers scraping the links in parallel, each worker scraps a contiguous chunk of the links (and journals its own checkpoint)
+        #     "freshness_seconds": None, ## incremental mode: the urls fetched less than this ago are not fetched again (None: --freshness)
+        #     "engine": "browser", ## "browser" renders the pages in chrome, "http" fetches and parses the html without a browser (static pages only)
+        #     "browser_profile": "default", ## browser engine: a profile of browser_profiles, "lean" runs chrome headless without downloading images, fonts, media, analytics and ads
+        #     "ready_conditions": [{"selector": "h4.provider__name", "timeout": 5}, {"script_regex": r'\.btn-phone-call\b'}, {"network_idle": 0.5, "optional": True}], ## browser engine: the pages are scraped as soon as these hold (not at the load event), each waited for up to its "timeout" seconds; a page whose condition times out fails (its link is retried by the next run), unless the condition is "optional"
+        #     "output_format": "csv", ## "csv", "parquet", "arrow" (both need pyarrow) or "sqlite", the next step reads any of them
+        #     "url_rules": {"drop_params": url_tracking_params + ["ref"]}, ## how the urls are canonicalized to find the duplicated links and pages of the step before fetching them (see default_url_rules)
+        #     "store_profile_link": False, ## --store only: also extract the url of the page into a "profile_link" column, the vendor store keys the vendors by it
+        #     "dedup": "memory" ## drop the empty and duplicated rows while writing: "memory" (set of rows hashes), "bloom" (fixed memory + on-disk index), or after the step: "external" (external sort, fixed memory), "none" keeps them
         # },
         {
             "desc": "Step 1",
@@ -440,7 +4286,8 @@ def main():
             "write_csv_file_name": "professional_categories_links",
             "write_file_data_header": ["link"],
             "pagination_next_btn_css_selector": None,
-            "remove_urls_param_flag": False
+            "remove_urls_param_flag": False,
+            "engine": "browser",
         },
         {
             "desc": "Step 2",
@@ -451,6 +4298,7 @@ def main():
             "write_file_data_header": ["link"],
             "pagination_next_btn_css_selector": None,
             "remove_urls_param_flag": True,
+            "engine": "browser",
         },
         {
             "desc": "Step 3",
@@ -461,6 +4309,7 @@ def main():
             "write_file_data_header": ["link"],
             "pagination_next_btn_css_selector": "ul.pagination li.pagination-next a",
             "remove_urls_param_flag": True,
+            "engine": "browser",
         },
         {
             "desc": "Step 4",
@@ -471,29 +4320,96 @@ def main():
             "write_file_data_header": ["name", "whatsapp_number", "phonecall_number"],
             "pagination_next_btn_css_selector": None,
             "remove_urls_param_flag": False,
+            "store_profile_link": True,
+            "engine": "browser",
         }
     ]    
 
+    if args.engine:
+        recommend_web_scrape_steps_params = [{**step_params, "engine": args.engine} for step_params in recommend_web_scrape_steps_params]
+    if args.workers:
+        recommend_web_scrape_steps_params = [{**step_params, "workers": args.workers} for step_params in recommend_web_scrape_steps_params]
+    # --store: the url of the page in a "profile_link" column (not a param of website_scrap_action, popped)
+    steps_store_profile_link = [step_params.pop("store_profile_link", False) for step_params in recommend_web_scrape_steps_params]
+    if vendor_store:
+        recommend_web_scrape_steps_params = [{
+            **step_params,
+            "web_scraper_action_names": step_params["web_scraper_action_names"] + ["extract_page_url"],
+            "web_scraper_action_params": step_params["web_scraper_action_params"] + [None],
+            "write_file_data_header": step_params["write_file_data_header"] + ["profile_link"],
+        } if store_profile_link else step_params for step_params, store_profile_link in zip(recommend_web_scrape_steps_params, steps_store_profile_link)]
+    # A step reads its input in the output format of the step writing it
+    steps_output_formats = {step_params["write_csv_file_name"]: step_params.get("output_format", "csv") for step_params in recommend_web_scrape_steps_params}
+    recommend_web_scrape_steps_params = [{**step_params, "read_output_format": steps_output_formats.get(step_params["read_csv_file_name"])} for step_params in recommend_web_scrape_steps_params]
+    if args.daemon:
+        run_scraper_daemon(args.daemon_port, recommend_web_scrape_steps_params, args.daemon_browsers)
+        tracer.close()
+        return
+    selected_steps_params = [step_params for step_number, step_params in enumerate(recommend_web_scrape_steps_params, start=1) if not args.steps or step_number in args.steps]
+    forced_steps_descs = [step_params["desc"] for step_number, step_params in enumerate(recommend_web_scrape_steps_params, start=1) if step_number in args.force]
+
     whole_script_timer = Timer()
+    sampling_profiler = SamplingProfiler(args.profile_dir) if args.profile else None
+    if sampling_profiler:
+        sampling_profiler.start()
+    is_previous_step_run = False # once a step runs, the steps after it run from scratch (their input files may have changed)
+    steps_params_to_run = []
 
-    for step_params in recommend_web_scrape_steps_params:
-        each_step_timer = Timer()
-        try:
-            website_scrap_action(**step_params)
-        except BaseException as be:
-            logging.error(f"Error occurred in main exception: {be}", exc_info=True)
-            print(f"Error occurred in main exception: {be}")
-        finally:
-            each_step_timer.stop()
-            logging.info(f"<{step_params['desc']}> execution time: {each_step_timer.get_execution_time():.2f} seconds") # Log info into a file
-            print(f"<{step_params['desc']}> execution time: {each_step_timer.get_execution_time():.2f} seconds")    
+    for step_params in selected_steps_params:
+        if is_previous_step_run:
+            reset_step_checkpoint(step_params["desc"])
+        elif is_step_checkpoint_done(step_params["desc"]):
+            print(f"<{step_params['desc']}> done in the interrupted run, skipped")
+            continue
+        is_previous_step_run = True
+        steps_params_to_run.append(step_params)
+
+    if args.pipeline:
+        # The steps with a cached output are restored until the first one without, the steps after it run in the pipeline
+        while steps_params_to_run and restore_cached_step(steps_params_to_run[0], forced_steps_descs):
+            steps_params_to_run.pop(0)
+        run_steps_pipeline(steps_params_to_run)
+        for step_params in steps_params_to_run:
+            store_cached_step(step_params)
+    else:
+        # A step is restored from the cache once the steps before it ran: its input file is final
+        for step_params in steps_params_to_run:
+            if not restore_cached_step(step_params, forced_steps_descs):
+                run_step(step_params)
+                store_cached_step(step_params)
+
+    if sampling_profiler:
+        sampling_profiler.stop()
+        sampling_profiler.write_profiles()
+    tracer.close()
+
+    # The selected steps are all finished, the next run of them starts from scratch
+    if all(is_step_checkpoint_done(step_params["desc"]) for step_params in selected_steps_params):
+        if len(selected_steps_params) == len(recommend_web_scrape_steps_params):
+            remove_checkpoints()
+        else:
+            for step_params in selected_steps_params:
+                reset_step_checkpoint(step_params["desc"])
 
     whole_script_timer.stop()
     logging.info(f"Whole script execution time: {whole_script_timer.get_execution_time():.2f} seconds") # Log info into a file
     print(f"Whole script execution time: {whole_script_timer.get_execution_time():.2f} seconds")
 
-    web_scraper.close_browser()
+    # Metrics summary of the run
+    metrics_registry.write_summary(metrics_summary_filename)
+    for step, step_summary in metrics_registry.get_summary().items():
+        logging.info(f"<{step}> {step_summary['pages']} pages, {step_summary['pages_per_second']:.2f} pages/s, error rate {step_summary['error_rate']:.2%}, p95 page latency {step_summary['p95_page_seconds']:.3f} seconds")
+        print(f"<{step}> {step_summary['pages']} pages, {step_summary['pages_per_second']:.2f} pages/s, error rate {step_summary['error_rate']:.2%}, p95 page latency {step_summary['p95_page_seconds']:.3f} seconds")
+        if step_summary["counters"].get("scrap_duplicate_urls_total"):
+            logging.info(f"<{step}> {step_summary['counters']['scrap_duplicate_urls_total']} duplicated urls not fetched (url frontier)")
+            print(f"<{step}> {step_summary['counters']['scrap_duplicate_urls_total']} duplicated urls not fetched (url frontier)")
+    for host, host_state in host_rate_limiter.hosts.items():
+        logging.info(f"[rate] {host}: final concurrency limit {int(host_state.limit)}, {host_state.rate or 'unlimited'} requests/s")
+        print(f"[rate] {host}: final concurrency limit {int(host_state.limit)}, {host_state.rate or 'unlimited'} requests/s")
+
+    for step_web_scraper in web_scrapers.values():
+        step_web_scraper.close_browser()
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
 # END: Main Function
\ No newline at end of file
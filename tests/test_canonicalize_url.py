@@ -0,0 +1,34 @@
+import pytest
+
+from scrap import UrlFrontier, canonicalize_url, default_url_rules
+
+
+@pytest.mark.parametrize("url, canonical_url", [
+    ("HTTP://Example.COM:80/a?b=2#top", "http://example.com/a?b=2"),
+    ("https://example.com:443", "https://example.com/"),
+    ("https://example.com:8443/a", "https://example.com:8443/a"),
+    ("  https://example.com/Path/?b=2&a=1  ", "https://example.com/Path/?b=2&a=1"),
+])
+def test_without_rules_only_the_scheme_host_port_and_fragment_change(url, canonical_url):
+    assert canonicalize_url(url) == canonical_url
+
+@pytest.mark.parametrize("url, canonical_url", [
+    ("https://example.com/services/?utm_source=x&name=aircon&fbclid=1", "https://example.com/services?name=aircon"),
+    ("https://example.com/services?page=2&name=aircon", "https://example.com/services?name=aircon&page=2"),
+    ("https://example.com/?utm_medium=email", "https://example.com/"),
+    ("https://example.com/Services?q=", "https://example.com/Services?q="),
+])
+def test_default_rules(url, canonical_url):
+    assert canonicalize_url(url, default_url_rules) == canonical_url
+
+def test_step_rules_override_the_defaults():
+    url_rules = {**default_url_rules, "drop_params": default_url_rules["drop_params"] + ["ref"], "lowercase_path": True, "sort_params": False}
+    assert canonicalize_url("https://example.com/Businesses/ABC/?ref=list&z=1&a=2", url_rules) == "https://example.com/businesses/abc?z=1&a=2"
+
+def test_url_frontier_claims_an_url_once_per_step():
+    url_frontier = UrlFrontier(":memory:")
+    url_frontier.set_step_url_rules("Step 3", {"drop_params": ["ref"]})
+    assert url_frontier.claim_urls("Step 3", [(0, "https://example.com/p?ref=a"), (1, "https://EXAMPLE.com/p/?ref=b#x"), (2, "https://example.com/q")]) == [True, False, True]
+    assert url_frontier.claim_urls("Step 3", [(0, "https://example.com/p")]) == [True] # the same link resumed
+    assert url_frontier.claim_urls("Step 4", [(1, "https://example.com/p")]) == [True]
+    url_frontier.close()
@@ -0,0 +1,59 @@
+import pytest
+
+import scrap
+from scrap import CheckpointJournal, StepWriter, read_step_checkpoint
+
+
+@pytest.fixture(autouse=True)
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # checkpoints/ and the output files in a scratch directory
+    return tmp_path
+
+def test_resume_from_the_journals_of_every_worker():
+    for worker_index, link_indexes in enumerate([[0, 1, 2], [3, 4]]):
+        checkpoint_journal = CheckpointJournal("Step T", worker_index)
+        for link_index in link_indexes:
+            checkpoint_journal.record_flush(2, link_index)
+        checkpoint_journal.record_resume_url(5 + worker_index, f"http://host/page{worker_index}")
+        checkpoint_journal.close()
+
+    done_link_indexes, resume_urls, flushed_rows, _ = read_step_checkpoint("Step T")
+    assert done_link_indexes == {0, 1, 2, 3, 4}
+    assert resume_urls == {5: "http://host/page0", 6: "http://host/page1"}
+    assert flushed_rows == 10
+
+    checkpoint_journal = CheckpointJournal("Step T", 0)
+    assert checkpoint_journal.is_link_done(3) and not checkpoint_journal.is_link_done(5)
+    assert checkpoint_journal.get_resume_url(5) == "http://host/page0"
+    checkpoint_journal.close()
+
+def test_done_link_drops_its_resume_url():
+    checkpoint_journal = CheckpointJournal("Step T")
+    checkpoint_journal.record_resume_url(0, "http://host/page2")
+    checkpoint_journal.record_flush(3, 0)
+    checkpoint_journal.close()
+    assert read_step_checkpoint("Step T")[:2] == ({0}, {})
+
+def test_compacted_journal_resumes_the_same(monkeypatch):
+    monkeypatch.setattr(scrap, "checkpoint_compact_entries", 3)
+    checkpoint_journal = CheckpointJournal("Step T")
+    for link_index in [0, 1, 2, 5, 6]:
+        checkpoint_journal.record_flush(1, link_index)
+        checkpoint_journal.sync()
+    checkpoint_journal.record_resume_url(7, "http://host/page3")
+    checkpoint_journal.close()
+
+    assert read_step_checkpoint("Step T")[:3] == ({0, 1, 2, 5, 6}, {7: "http://host/page3"}, 5)
+    with open(scrap.get_checkpoint_journal_filename("Step T", 0), encoding="utf-8") as journal_file:
+        assert len(journal_file.readlines()) <= 3
+
+def test_flushed_rows_are_journaled_with_their_flush():
+    # The journal is on disk as soon as the writer wrote the rows, without waiting for the periodic sync
+    checkpoint_journal = CheckpointJournal("Step T", sync_seconds=3600)
+    step_writer = StepWriter("out", ["name"], truncate=True, buffer_rows=2, checkpoint_journal=checkpoint_journal)
+    step_writer.write_rows([("a",), ("b",)])
+    step_writer.add_flush_callback(lambda: checkpoint_journal.record_flush(2, 0))
+    step_writer.write_rows([("c",), ("d",)])
+    assert read_step_checkpoint("Step T")[:3] == ({0}, {}, 2)
+    step_writer.close()
+    checkpoint_journal.close()
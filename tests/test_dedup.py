@@ -0,0 +1,82 @@
+import csv
+import glob
+import os
+
+import pytest
+
+import scrap
+from scrap import BloomFilter, CSVFileManager, RowDeduplicator, hash_row
+
+
+rows = [("A", "1"), ("B", "2"), ("A", "1"), ("", ""), ("C", "3"), ("B", "2"), ("A", "2"), ("", ""), ("D", "4"), ("A", "1"), ("E", "5")]
+unique_rows = [("A", "1"), ("B", "2"), ("C", "3"), ("A", "2"), ("D", "4"), ("E", "5")]
+
+def test_bloom_filter_never_misses_an_added_hash():
+    bloom_filter = BloomFilter(bits=1024, hashes=3)
+    digests = [hash_row((str(row_index),)) for row_index in range(50)]
+    assert not any(bloom_filter.add(digest) for digest in digests)
+    assert all(bloom_filter.add(digest) for digest in digests)
+
+@pytest.mark.parametrize("mode", ["memory", "bloom"])
+def test_empty_and_duplicated_rows_are_dropped(tmp_path, mode):
+    row_deduplicator = RowDeduplicator(mode, str(tmp_path))
+    assert [row for row in rows if not row_deduplicator.is_duplicate(row)] == unique_rows
+    row_deduplicator.close()
+    assert os.listdir(tmp_path) == [] # the bloom mode's on-disk index is removed
+
+def test_bloom_false_positives_are_confirmed_on_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(scrap, "dedup_bloom_bits", 1) # the one bit set by the first row: every next row is "maybe seen"
+    row_deduplicator = RowDeduplicator("bloom", str(tmp_path))
+    bloom_answers = []
+    bloom_filter_add = row_deduplicator.bloom_filter.add
+    monkeypatch.setattr(row_deduplicator.bloom_filter, "add", lambda digest: bloom_answers.append(bloom_filter_add(digest)) or bloom_answers[-1])
+    kept_rows = []
+    for row in rows:
+        if not row_deduplicator.is_duplicate(row):
+            kept_rows.append(row)
+        row_deduplicator.commit()
+    assert kept_rows == unique_rows
+    assert bloom_answers == [False] + [True] * 8 # the new rows after the first one are all false positives
+    row_deduplicator.close()
+
+def write_csv(filename, header, csv_rows):
+    with open(filename, "w", encoding="utf-8", newline="") as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        csv_writer.writerows(csv_rows)
+
+def read_csv(filename):
+    with open(filename, "r", encoding="utf-8", newline="") as csv_file:
+        return [tuple(row) for row in csv.reader(csv_file)]
+
+@pytest.mark.parametrize("memory_rows", [2, 3, 100])
+def test_external_sort_keeps_the_first_occurrences_in_order(tmp_path, monkeypatch, memory_rows):
+    monkeypatch.chdir(tmp_path)
+    write_csv("vendors.csv", ["name", "number"], rows)
+    runs_dirnames = []
+    write_sorted_run = scrap.write_sorted_run
+    monkeypatch.setattr(scrap, "write_sorted_run", lambda items, dirname: runs_dirnames.append(dirname) or write_sorted_run(items, dirname))
+    CSVFileManager().remove_null_and_duplicates("vendors", ["name", "number"], memory_rows=memory_rows)
+    assert read_csv("vendors.csv") == [("name", "number")] + unique_rows
+    assert len(runs_dirnames) == (9 // memory_rows + 1) + (6 // memory_rows + 1) # the runs of the hashes, then of the kept indexes
+    assert sorted(os.listdir(tmp_path)) == ["vendors.csv"] # runs and temporary output removed
+
+def test_failed_dedup_leaves_the_output_untouched(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_csv("vendors.csv", ["name", "number"], rows)
+    def failing_write_rows(self, step_rows):
+        raise OSError("disk full")
+    monkeypatch.setattr(scrap.StepWriter, "write_rows", failing_write_rows)
+    with pytest.raises(OSError):
+        CSVFileManager().remove_null_and_duplicates("vendors", ["name", "number"], memory_rows=2)
+    assert read_csv("vendors.csv") == [("name", "number")] + rows
+
+def test_directory_output_is_swapped_whole(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for dirname, part_names in [("vendors.parquet", ["part-0.parquet", "part-1.parquet"]), ("vendors.tmp1.parquet", ["part-2.parquet"])]:
+        os.mkdir(dirname)
+        for part_name in part_names:
+            open(os.path.join(dirname, part_name), "w").close()
+    CSVFileManager().replace_output("vendors.tmp1", "vendors", "parquet")
+    assert os.listdir("vendors.parquet") == ["part-2.parquet"]
+    assert glob.glob("*") == ["vendors.parquet"] # neither the temporary output nor the old one left
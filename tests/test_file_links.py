@@ -0,0 +1,73 @@
+import csv
+
+import pytest
+
+import scrap
+from scrap import CheckpointJournal, FileLinks, read_step_checkpoint
+
+
+@pytest.fixture(autouse=True)
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # checkpoints/ and the links file in a scratch directory
+    monkeypatch.setattr(scrap, "file_links_index_rows", 3) # the views seek from an indexed link
+    with open("links.csv", "w", encoding="utf-8", newline="") as links_file:
+        csv_writer = csv.writer(links_file)
+        csv_writer.writerow(["name", "link"])
+        csv_writer.writerows([[f"vendor\n{link_index}", f"http://host/p/{link_index}" if link_index != 6 else ""] for link_index in range(10)])
+    return tmp_path
+
+def resume_links():
+    # The links of the step as a resumed run reads them, with the save points and the done links of the journals
+    done_link_indexes, _, _, save_points = read_step_checkpoint("Step T")
+    links = FileLinks("links", output_format="csv")
+    links.set_checkpoint(save_points, done_link_indexes)
+    return links
+
+def iter_links(links_view, size=2):
+    return [link_index for links_window in links_view.iter_windows(size) for link_index, _ in links_window]
+
+def test_views_read_their_range_of_links():
+    links = FileLinks("links", output_format="csv")
+    assert len(links) == 10
+    assert list(links[4:8]) == ["http://host/p/4", "http://host/p/5", "", "http://host/p/7"]
+    assert iter_links(links[4:8]) == [4, 5, 7] # no link to scrap in row 6
+
+def test_resume_from_the_save_point_with_the_failed_links_first():
+    links_view = FileLinks("links", output_format="csv")[2:9]
+    checkpoint_journal = CheckpointJournal("Step T", links=links_view)
+    links_windows = links_view.iter_windows(2)
+    assert [link_index for link_index, _ in next(links_windows)] == [2, 3]
+    assert [link_index for link_index, _ in next(links_windows)] == [4, 5]
+    checkpoint_journal.record_flush(1, 2)
+    checkpoint_journal.record_failure(3)
+    checkpoint_journal.record_flush(1, 5) # 4 still pending: the save point stays on it
+    checkpoint_journal.close()
+
+    _, _, _, save_points = read_step_checkpoint("Step T")
+    assert save_points[2]["link_index"] == 4 and [link_index for link_index, _ in save_points[2]["failed"]] == [3]
+    assert iter_links(resume_links()[2:9]) == [3, 4, 7, 8] # 5 is done after the save point
+
+def test_save_point_moves_past_the_done_links():
+    links_view = FileLinks("links", output_format="csv")[0:5]
+    checkpoint_journal = CheckpointJournal("Step T", links=links_view)
+    for link_index in iter_links(links_view, 5):
+        checkpoint_journal.record_flush(1, link_index)
+    checkpoint_journal.close()
+
+    _, _, _, save_points = read_step_checkpoint("Step T")
+    assert save_points[0]["link_index"] == 5 and save_points[0]["failed"] == []
+    resumed_links = resume_links()
+    assert iter_links(resumed_links[0:5]) == []
+    assert iter_links(resumed_links[5:10]) == [5, 7, 8, 9]
+
+def test_save_points_of_every_chunk_are_chained():
+    # A resumed run with fewer workers: its chunk starts from the save point of the first old chunk, then of the next one
+    links = FileLinks("links", output_format="csv")
+    for worker_index, (start, stop, done_count) in enumerate([(0, 5, 3), (5, 10, 2)]):
+        links_view = links[start:stop]
+        checkpoint_journal = CheckpointJournal("Step T", worker_index, links=links_view)
+        for link_index in iter_links(links_view, 5)[:done_count]:
+            checkpoint_journal.record_flush(1, link_index)
+        checkpoint_journal.close()
+
+    assert iter_links(resume_links()[0:10]) == [3, 4, 8, 9]
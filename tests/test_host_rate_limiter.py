@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import scrap
+from scrap import HostRateLimiter
+
+
+@pytest.fixture
+def host_rate_limiter(monkeypatch):
+    monkeypatch.setattr(scrap, "http_initial_concurrency_per_host", 4)
+    monkeypatch.setattr(scrap, "http_max_requests_per_second", None)
+    host_rate_limiter = HostRateLimiter()
+    monkeypatch.setattr(host_rate_limiter, "read_crawl_delay", lambda robots_url: None) # no robots.txt to fetch
+    return host_rate_limiter
+
+def respond(host_rate_limiter, latency_seconds, backoff_reason=None, retry_after_seconds=None):
+    # One request to the host answered after latency_seconds, the host's concurrency limit after it
+    host_state = host_rate_limiter.acquire("http://host/p/1")
+    host_rate_limiter.release(host_state, latency_seconds, backoff_reason, retry_after_seconds)
+    return host_state.limit
+
+def test_limit_grows_by_one_every_limit_fast_responses(host_rate_limiter):
+    limits = [respond(host_rate_limiter, 0.1) for _ in range(10)]
+    assert [int(limit) for limit in limits] == [4] * 4 + [5] * 5 + [6]
+
+def test_throttle_halves_once_per_round_trip_and_pauses(host_rate_limiter):
+    assert respond(host_rate_limiter, 0.1, "429", retry_after_seconds=0) == 2
+    assert respond(host_rate_limiter, 0.1, "503", retry_after_seconds=0) == 2 # same round trip: the same push back
+    host_state = host_rate_limiter.get_host_state("http://host/p/1")
+    assert host_state.consecutive_backoffs == 2
+    host_state.last_decrease_time -= 10
+    respond(host_rate_limiter, 0.1, "timeout")
+    assert host_state.limit == 1 and host_state.consecutive_backoffs == 2 # no pause for a timeout
+    respond(host_rate_limiter, 0.1, "429", retry_after_seconds=30)
+    assert host_state.limit == 1 # never under 1
+    assert host_state.paused_until - time.monotonic() > 25
+    assert host_state.get_wait_seconds(time.monotonic()) > 25
+
+def test_slow_responses_back_off_until_the_baseline_follows_them(host_rate_limiter):
+    for _ in range(10):
+        respond(host_rate_limiter, 0.1)
+    host_state = host_rate_limiter.get_host_state("http://host/p/1")
+    assert host_state.baseline_latency == pytest.approx(0.1)
+    limit = host_state.limit
+    for _ in range(30):
+        respond(host_rate_limiter, 1.0)
+    assert limit / 2 <= host_state.limit < limit / 2 + 1 # overloaded, halved once per round trip (grown before the latency average rose)
+    assert host_state.baseline_latency > 0.1
+
+    for _ in range(300): # the host stays lastingly slower: its new latency becomes the baseline
+        respond(host_rate_limiter, 1.0)
+    assert host_state.latency_ewma < host_state.baseline_latency * scrap.http_latency_backoff_factor
+    assert host_state.limit > limit / 2 # growing again
+
+    respond(host_rate_limiter, 0.01)
+    assert host_state.baseline_latency == host_state.latency_ewma # a faster host lowers the baseline at once
@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+import scrap
+from scrap import QueueLinks, StepWriter
+
+
+def test_links_arrive_in_windows_with_their_arrival_index():
+    queue_links = QueueLinks(maxsize=10)
+    for link in ["a", "b", "c"]:
+        queue_links.put(link)
+    queue_links.close()
+    assert [link for links_window in queue_links.iter_windows(2) for link in links_window] == [(0, "a"), (1, "b"), (2, "c")]
+
+def test_full_queue_stops_blocking_once_the_next_step_stopped(monkeypatch):
+    monkeypatch.setattr(scrap, "pipeline_put_seconds", 0.01)
+    queue_links = QueueLinks(maxsize=1)
+
+    def emit_links():
+        for link in ["a", "b", "c"]:
+            queue_links.put(link)
+        queue_links.close()
+
+    emitting_step = threading.Thread(target=emit_links)
+    emitting_step.start()
+    queue_links.abort()
+    emitting_step.join(timeout=5)
+    assert not emitting_step.is_alive()
+
+def test_emitting_step_needs_a_link_column(tmp_path):
+    with pytest.raises(ValueError):
+        StepWriter(str(tmp_path / "out"), ["name"], downstream_links=QueueLinks())
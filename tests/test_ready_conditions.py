@@ -0,0 +1,47 @@
+import pytest
+
+import scrap
+from scrap import PageNotReadyError, WebScraper
+
+
+class FakeDriver:
+    # A page that never renders its provider name, whose scripts are all loaded
+    title = "Vendor"
+
+    def __init__(self) -> None:
+        self.urls = []
+
+    def get(self, url) -> None:
+        self.urls.append(url)
+
+    def execute_script(self, script, *args):
+        if "isPreviousPage" in script:
+            return script.startswith("return") or None # the new page replaced the previous one (the other script marks the previous page)
+        return script == scrap.ready_condition_scripts["script_regex"]
+
+def create_web_scraper(ready_conditions):
+    web_scraper = WebScraper.__new__(WebScraper) # no browser
+    web_scraper.__dict__.update(url="http://host/p/1", navigation_error=None, ready_conditions=ready_conditions, pages_since_restart=0, consecutive_errors=0, is_browser_hung=False, driver=FakeDriver())
+    return web_scraper
+
+@pytest.fixture(autouse=True)
+def fast_polling_without_network(monkeypatch):
+    monkeypatch.setattr(scrap, "ready_condition_poll_seconds", 0.01)
+    host_rate_limiter = scrap.HostRateLimiter()
+    monkeypatch.setattr(host_rate_limiter, "read_crawl_delay", lambda robots_url: None) # no robots.txt to fetch
+    monkeypatch.setattr(scrap, "host_rate_limiter", host_rate_limiter)
+
+def test_timed_out_condition_fails_the_navigation():
+    web_scraper = create_web_scraper([{"script_regex": "phone"}, {"selector": "h4.provider__name", "timeout": 0.05}])
+    with pytest.raises(PageNotReadyError):
+        web_scraper.wait_until_ready_conditions()
+
+    web_scraper.navigate_to_page("http://host/p/2")
+    assert isinstance(web_scraper.navigation_error, PageNotReadyError)
+    assert web_scraper.driver.urls == ["http://host/p/2"] # not loaded again: the browser is fine
+    assert web_scraper.consecutive_errors == 0
+
+def test_optional_condition_only_logs_its_timeout():
+    web_scraper = create_web_scraper([{"selector": "h4.provider__name", "timeout": 0.05, "optional": True}, {"script_regex": "phone"}])
+    web_scraper.navigate_to_page("http://host/p/2")
+    assert web_scraper.navigation_error is None
@@ -0,0 +1,82 @@
+import csv
+
+import pandas as pd
+import pytest
+
+import reformat_data
+from reformat_data import merge_sorted_runs, parse_args, reformat_contacts_chunk, write_sorted_run
+
+
+header = ["name", "contact_number"]
+
+def reformat(rows):
+    df = pd.DataFrame(rows, columns=["name", "whatsapp_number", "phonecall_number"])
+    return list(reformat_contacts_chunk(df, "name", ["whatsapp_number", "phonecall_number"], "contact_number").itertuples(index=False, name=None))
+
+def test_numbers_are_split_and_normalized():
+    assert reformat([
+        [" Aircon Pro ", "+60 12-345 6789 / 0198765432", "03-1234 5678; 60123456789"],
+        ["Plumber", None, "012 111 2222 , 012 111 2222"],
+        ["", "0123456789", None], # no name
+        ["Painter", None, ""], # no number
+    ]) == [
+        ("Aircon Pro", "0123456789"), ("Aircon Pro", "0198765432"), ("Aircon Pro", "0312345678"), ("Plumber", "0121112222"),
+    ] # the whatsapp numbers then the phone numbers, "60" country code and duplicates dropped
+
+def read_csv(filename):
+    with open(filename, "r", encoding="utf-8", newline="") as csv_file:
+        return [tuple(row) for row in csv.reader(csv_file)]
+
+def test_runs_are_merged_in_the_order_they_are_written(tmp_path):
+    # A missing name is written "" and sorted first, as merge_sorted_runs compares it (pandas would sort it last)
+    dfs = [
+        pd.DataFrame({"name": ["b", None, "B"], "contact_number": ["2", "9", "1"]}, dtype="string"),
+        pd.DataFrame({"name": ["a", "b", "a"], "contact_number": ["3", "10", "1"]}, dtype="string"),
+        pd.DataFrame({"name": ["c"], "contact_number": ["0"]}, dtype="string"),
+    ]
+    run_filenames = [write_sorted_run(df, header, str(tmp_path)) for df in dfs]
+    assert read_csv(run_filenames[0]) == [tuple(header), ("", "9"), ("B", "1"), ("b", "2")]
+    merge_sorted_runs(run_filenames, str(tmp_path / "output.csv"), header)
+    assert read_csv(tmp_path / "output.csv") == [tuple(header), ("", "9"), ("B", "1"), ("a", "1"), ("a", "3"), ("b", "10"), ("b", "2"), ("c", "0")]
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def write_input(rows, mode="w"):
+    with open("vendors_name_contact.csv", mode, encoding="utf-8", newline="") as input_file:
+        csv_writer = csv.writer(input_file)
+        if mode == "w":
+            csv_writer.writerow(["name", "whatsapp_number", "phonecall_number"])
+        csv_writer.writerows(rows)
+
+def run_reformat(capsys):
+    reformat_data.main(parse_args(["--incremental", "--workers", "1", "--chunk-rows", "2"]))
+    return capsys.readouterr().out.splitlines()[0]
+
+def test_incremental_run_merges_the_appended_rows_only(run_dir, capsys):
+    write_input([["Zed", "0111111111", ""], ["Amy", "0122222222", "0133333333"], ["Bob", "", "0144444444"]])
+    assert run_reformat(capsys) == "Full reformat: 4 new rows written into reformatted_vendors_name_contact.csv"
+
+    write_input([["Cat", "0155555555", ""], ["Amy", "0122222222", ""]], mode="a")
+    assert run_reformat(capsys) == "Incremental reformat: 1 new rows written into reformatted_vendors_name_contact.csv"
+    assert read_csv("reformatted_vendors_name_contact.csv") == [
+        tuple(header), ("Amy", "0122222222"), ("Amy", "0133333333"), ("Bob", "0144444444"), ("Cat", "0155555555"), ("Zed", "0111111111"),
+    ]
+    assert run_reformat(capsys) == "Incremental reformat: 0 new rows written into reformatted_vendors_name_contact.csv"
+
+def test_rewritten_input_is_reformatted_whole(run_dir, capsys):
+    write_input([["Zed", "0111111111", ""], ["Amy", "0122222222", ""]])
+    run_reformat(capsys)
+    write_input([["Bob", "0144444444", ""], ["Amy", "0122222222", ""], ["Cat", "0155555555", ""]]) # longer, but not an append
+    assert run_reformat(capsys) == "Full reformat: 3 new rows written into reformatted_vendors_name_contact.csv"
+    assert read_csv("reformatted_vendors_name_contact.csv") == [tuple(header), ("Amy", "0122222222"), ("Bob", "0144444444"), ("Cat", "0155555555")]
+
+def test_edited_output_is_reformatted_whole(run_dir, capsys):
+    write_input([["Zed", "0111111111", ""], ["Amy", "0122222222", ""]])
+    run_reformat(capsys)
+    with open("reformatted_vendors_name_contact.csv", "a", encoding="utf-8") as output_file:
+        output_file.write("Manual,0199999999\n")
+    write_input([["Cat", "0155555555", ""]], mode="a")
+    assert run_reformat(capsys) == "Full reformat: 3 new rows written into reformatted_vendors_name_contact.csv"
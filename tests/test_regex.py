@@ -0,0 +1,29 @@
+import re
+
+from scrap import find_regexs_first_data
+
+
+def search_first_data(text, regex):
+    # What a separate re.findall(regex, text)[0] returns
+    matches = re.findall(regex, text)
+    return matches[0] if matches else False
+
+def test_same_as_separate_searches():
+    text = 'var a = 1; $(".btn-phone-call").attr("href", "tel:0123456789"); $(".btn-whatsapp-call").attr("href", "wa:01123456789");'
+    regexs = [r'\.btn-whatsapp-call\b.*?(011\d{8})', r'\.btn-phone-call\b.*?(0\d{9})', r'var (\w) = (\d)', r'\$\(', r'missing']
+    assert find_regexs_first_data(text, regexs) == [search_first_data(text, regex) for regex in regexs]
+
+def test_regexs_matching_at_the_same_position():
+    assert find_regexs_first_data("abc", ["a", "ab"]) == ["a", "ab"]
+    assert find_regexs_first_data("abc", ["ab", "a"]) == ["ab", "a"]
+
+def test_identical_regexs():
+    assert find_regexs_first_data("xyx", ["x", "x"]) == ["x", "x"]
+
+def test_not_found_and_empty_text():
+    assert find_regexs_first_data("abc", ["z", "b"]) == [False, "b"]
+    assert find_regexs_first_data(None, ["a"]) == [False]
+
+def test_regexs_that_cant_be_combined():
+    # Duplicated group names: searched one by one
+    assert find_regexs_first_data("k1 k2", [r"k(?P<n>\d)", r"(?P<n>k)\d"]) == ["1", "k"]
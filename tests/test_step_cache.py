@@ -0,0 +1,59 @@
+import pytest
+
+from scrap import StepCache
+
+
+def write_file(filename, content):
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(content)
+
+def read_file(filename):
+    with open(filename, "r", encoding="utf-8") as file:
+        return file.read()
+
+def create_step_params(desc="Step 2", **step_params):
+    return {"desc": desc, "read_csv_file_name": "categories_links", "web_scraper_action_names": ["extract_elements_links"], "web_scraper_action_params": [["a.vendor"]], "write_csv_file_name": f"{desc}_links", "write_file_data_header": ["link"], "workers": 1, "engine": "browser", **step_params}
+
+@pytest.fixture
+def step_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_file("categories_links.csv", "link\nhttp://host/c/1\n")
+    return StepCache("step_cache", ttl_seconds=60, max_entries=2)
+
+def test_hit_restores_the_output_whatever_the_execution_params(step_cache):
+    write_file("Step 2_links.csv", "link\nhttp://host/p/1\n")
+    step_cache.store(create_step_params())
+    write_file("Step 2_links.csv", "link\n") # interrupted run
+    assert step_cache.restore(create_step_params(workers=4, engine="http", ready_conditions=[{"selector": "a.vendor"}]))
+    assert read_file("Step 2_links.csv") == "link\nhttp://host/p/1\n"
+    assert StepCache("step_cache").restore(create_step_params()) # the index persists
+
+@pytest.mark.parametrize("change", ["input", "selector"])
+def test_miss_when_the_input_or_the_config_changes(step_cache, change):
+    write_file("Step 2_links.csv", "link\nhttp://host/p/1\n")
+    step_cache.store(create_step_params())
+    if change == "input":
+        write_file("categories_links.csv", "link\nhttp://host/c/1\nhttp://host/c/2\n")
+        assert not step_cache.restore(create_step_params())
+    else:
+        assert not step_cache.restore(create_step_params(web_scraper_action_params=[["a.provider"]]))
+
+def test_expired_entry_is_missed_and_evicted(step_cache):
+    write_file("Step 2_links.csv", "link\nhttp://host/p/1\n")
+    step_cache.store(create_step_params())
+    fingerprint, = step_cache.index
+    step_cache.index[fingerprint]["created_at"] -= 61
+    assert not step_cache.restore(create_step_params())
+    step_cache.evict()
+    assert step_cache.index == {}
+
+def test_least_recently_used_entry_is_evicted(step_cache):
+    for desc in ["Step 2", "Step 3"]:
+        write_file(f"{desc}_links.csv", f"link\nhttp://host/{desc}\n")
+        step_cache.store(create_step_params(desc))
+    assert step_cache.restore(create_step_params("Step 2")) # Step 3 becomes the least recently used
+    write_file("Step 4_links.csv", "link\n")
+    step_cache.store(create_step_params("Step 4"))
+    assert sorted(entry["desc"] for entry in step_cache.index.values()) == ["Step 2", "Step 4"]
+    assert not step_cache.restore(create_step_params("Step 3"))
+    assert step_cache.restore(create_step_params("Step 2"))
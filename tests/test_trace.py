@@ -0,0 +1,42 @@
+import pytest
+
+from scrap import Tracer, read_trace_spans
+
+
+@pytest.mark.parametrize("exporter_format", ["jsonl", "otlp"])
+def test_spans_read_back_as_written(tmp_path, exporter_format):
+    trace_filename = str(tmp_path / f"trace.{exporter_format}")
+    tracer = Tracer()
+    tracer.start(trace_filename, exporter_format)
+    link_span = tracer.start_span("link", root=True, step="Step 4", link_index=3, url="http://host/p/1")
+    with tracer.span("page", url="http://host/p/1"):
+        with tracer.span("extract", selector=["h4.name"], action="extract_batch"):
+            pass
+        with pytest.raises(ValueError):
+            with tracer.span("flush"):
+                raise ValueError("disk full")
+    tracer.end_span(link_span, pages=1)
+    tracer.close()
+
+    spans = {span["name"]: span for span in read_trace_spans(trace_filename)}
+    assert sorted(spans) == ["extract", "flush", "link", "page"]
+    assert spans["link"]["parent_span_id"] is None
+    assert spans["page"]["parent_span_id"] == spans["link"]["span_id"]
+    assert spans["extract"]["parent_span_id"] == spans["flush"]["parent_span_id"] == spans["page"]["span_id"]
+    assert len({span["trace_id"] for span in spans.values()}) == 1
+    assert spans["link"]["attributes"] == {"step": "Step 4", "link_index": 3, "url": "http://host/p/1", "pages": 1}
+    assert spans["extract"]["attributes"] == {"selector": '["h4.name"]', "action": "extract_batch"}
+    assert (spans["flush"]["status"], spans["flush"]["error"]) == ("error", "ValueError: disk full")
+    assert (spans["page"]["status"], spans["page"]["error"]) == ("ok", None)
+    assert spans["link"]["duration_seconds"] >= spans["page"]["duration_seconds"] >= 0
+
+def test_partially_written_last_line_is_skipped(tmp_path):
+    trace_filename = str(tmp_path / "trace.jsonl")
+    tracer = Tracer()
+    tracer.start(trace_filename)
+    with tracer.span("link", root=True):
+        pass
+    tracer.close()
+    with open(trace_filename, "a", encoding="utf-8") as trace_file:
+        trace_file.write('{"trace_id": "0a')
+    assert [span["name"] for span in read_trace_spans(trace_filename)] == ["link"]
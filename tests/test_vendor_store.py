@@ -0,0 +1,37 @@
+import pytest
+
+from scrap import VendorStore
+
+header = ["name", "whatsapp_number", "phonecall_number", "profile_link"]
+
+
+@pytest.fixture
+def vendor_store(tmp_path):
+    vendor_store = VendorStore(str(tmp_path / "vendor_store.sqlite"))
+    yield vendor_store
+    vendor_store.close()
+
+def test_upsert_updates_the_vendor_and_keeps_its_first_scrape(vendor_store):
+    assert vendor_store.upsert_rows("Step 4", header, [["Aircon Sdn Bhd", "0123456789", "", "http://host/p/1"]]) == 1
+    first_scraped_at = vendor_store.get_vendor("http://host/p/1")["first_scraped_at"]
+    vendor_store.upsert_rows("Step 4", header, [["Aircon Sdn Bhd", "0123456789", "0198765432", "http://host/p/1"]])
+
+    vendor = vendor_store.get_vendor("http://host/p/1")
+    assert (vendor["name"], vendor["whatsapp_number"], vendor["phonecall_number"]) == ("Aircon Sdn Bhd", "0123456789", "0198765432")
+    assert vendor["first_scraped_at"] == first_scraped_at
+    assert vendor_store.query("SELECT COUNT(*) AS rows_count FROM vendors")[0]["rows_count"] == 1
+    assert vendor_store.find_vendor_by_phone("+60 19-876 5432")["profile_link"] == "http://host/p/1"
+
+def test_empty_values_never_overwrite_the_stored_ones(vendor_store):
+    vendor_store.upsert_rows("Step 4", header, [["Aircon Sdn Bhd", "0123456789", "0198765432", "http://host/p/1"]])
+    vendor_store.upsert_rows("Step 4", header, [["", "", "0198765432", "http://host/p/1"]])
+
+    vendor = vendor_store.get_vendor("http://host/p/1")
+    assert (vendor["name"], vendor["whatsapp_number"], vendor["phonecall_number"]) == ("Aircon Sdn Bhd", "0123456789", "0198765432")
+
+def test_rows_without_data_are_not_stored(vendor_store):
+    vendor_store.upsert_rows("Step 4", header, [["Aircon Sdn Bhd", "0123456789", "", "http://host/p/1"]])
+    assert vendor_store.upsert_rows("Step 4", header, [["", "", "", "http://host/p/1"], ["", "", "", "http://host/p/2"], ["Plumber", "", "", ""]]) == 0
+
+    assert vendor_store.get_vendor("http://host/p/1")["name"] == "Aircon Sdn Bhd"
+    assert vendor_store.get_vendor("http://host/p/2") is None
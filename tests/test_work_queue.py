@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from scrap import MemoryWorkQueue, SQLiteWorkQueue
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def work_queue(request, tmp_path):
+    work_queue = SQLiteWorkQueue(str(tmp_path / "work_queue.sqlite")) if request.param == "sqlite" else MemoryWorkQueue()
+    work_queue.add_links("S", ["u0", "u1"])
+    return work_queue
+
+def test_links_are_leased_once_and_acked(work_queue):
+    assert [link for _, link, _ in work_queue.lease("S", "A", 1, 60)] == ["u0"]
+    assert [link for _, link, _ in work_queue.lease("S", "B", 5, 60)] == ["u1"]
+    work_queue.ack("S", "A", [0])
+    work_queue.ack("S", "B", [], [1])
+    assert work_queue.get_status_counts("S") == {"done": 1, "pending": 1}
+    assert [link for _, link, _ in work_queue.lease("S", "C", 5, 60)] == ["u1"]
+
+def test_expired_lease_is_leased_again_and_the_stale_node_acks_nothing(work_queue):
+    work_queue.lease("S", "A", 1, 0.01)
+    time.sleep(0.05) # A's lease expired
+    assert [link_index for link_index, _, _ in work_queue.lease("S", "B", 1, 60)] == [0]
+
+    work_queue.ack("S", "A", [], [0]) # A's failure doesn't release B's live lease
+    assert work_queue.lease("S", "C", 1, 60)[0][1] == "u1"
+    assert work_queue.lease("S", "D", 1, 60) == []
+    work_queue.ack("S", "A", [0]) # nor does A's done ack end it
+    assert work_queue.get_status_counts("S") == {"leased": 2}
+    assert work_queue.is_leased_by_other_nodes("S", "A")
+
+    work_queue.ack("S", "B", [0])
+    assert work_queue.get_status_counts("S") == {"done": 1, "leased": 1}
+
+def test_stale_node_heartbeat_keeps_the_resume_url_of_the_new_node(work_queue):
+    work_queue.lease("S", "A", 1, 0.01)
+    time.sleep(0.05) # A's lease expired
+    work_queue.lease("S", "B", 1, 60)
+    work_queue.heartbeat("S", "B", 60, {0: "u0?page=3"})
+    work_queue.heartbeat("S", "A", 60, {0: "u0?page=2"})
+
+    work_queue.ack("S", "B", [], [0])
+    assert work_queue.lease("S", "C", 1, 60) == [(0, "u0", "u0?page=3")]
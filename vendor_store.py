@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+from scrap import VendorStore, vendor_store_filename
+
+# Global variables
+export_formats_extensions = {"csv": ".csv", "parquet": ".parquet"}
+logging_filename = 'recommend.log'
+logging.basicConfig(filename=logging_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# END: Global variables
+
+
+# Global function
+def print_records(records):
+    for record in records:
+        print(json.dumps(record, ensure_ascii=False))
+    if not records:
+        print("Not found", file=sys.stderr)
+# END: Global function
+
+
+# Main Function
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Look up and export the vendors stored by scrap.py --store")
+    parser.add_argument("--store", default=vendor_store_filename, help="vendor store file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    lookup_parser = subparsers.add_parser("lookup", help="print the matching vendors, one json per line")
+    lookup_parser.add_argument("--link", default=None, help="profile link of the vendor")
+    lookup_parser.add_argument("--phone", default=None, help="whatsapp or phone call number of the vendor (any format, e.g. +60 12-345 6789)")
+    lookup_parser.add_argument("--name", default=None, help="start of the vendor's name (case insensitive)")
+    lookup_parser.add_argument("--limit", type=int, default=100, help="max. no. of vendors matched by --name")
+    export_parser = subparsers.add_parser("export", help="export a table of the store into a csv or parquet file")
+    export_parser.add_argument("--table", choices=["vendors", "phones", "links", "step_rows"], default="vendors")
+    export_parser.add_argument("--format", choices=list(export_formats_extensions), default="csv")
+    export_parser.add_argument("--output", default=None, help="file exported to (default: the table name)")
+    subparsers.add_parser("stats", help="print the no. of rows of every table")
+    args = parser.parse_args(argv)
+    if args.command == "lookup" and not (args.link or args.phone or args.name):
+        parser.error("lookup needs --link, --phone or --name")
+    return args
+
+def main(args=None):
+    args = args if args else parse_args()
+    if not os.path.exists(args.store):
+        print(f"No vendor store at {args.store}, run python scrap.py --store first")
+        return 1
+
+    vendor_store = VendorStore(args.store)
+    try:
+        if args.command == "lookup":
+            lookup_start_time = time.perf_counter()
+            if args.link:
+                vendor = vendor_store.get_vendor(args.link)
+                records = [vendor] if vendor else []
+            elif args.phone:
+                vendor = vendor_store.find_vendor_by_phone(args.phone)
+                records = [vendor] if vendor else []
+            else:
+                records = vendor_store.find_vendors_by_name(args.name, args.limit)
+            print_records(records)
+            logging.info(f"Vendor store lookup: {len(records)} vendors in {(time.perf_counter() - lookup_start_time) * 1000:.3f} ms")
+        elif args.command == "export":
+            output_filename = args.output if args.output else args.table + export_formats_extensions[args.format]
+            vendor_store.export(args.table, output_filename, args.format)
+            print(f"{args.table} exported into {output_filename}")
+        else:
+            for table in ["vendors", "phones", "links", "step_rows"]:
+                print(f"{table}: {vendor_store.query(f'SELECT COUNT(*) AS rows_count FROM {table}')[0]['rows_count']} rows")
+    except Exception as e:
+        logging.error(f"Vendor store {args.command} failed: {e}", exc_info=True)
+        print(f"Vendor store {args.command} failed: {e}")
+        return 1
+    finally:
+        vendor_store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# END: Main Function